@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Benchmark resolving the environment variable placeholders of a large configuration.
+
+A generated configuration of `--leaves` values, `--ratio` of them containing
+placeholders, is resolved with:
+
+- `rescan`: matching every string value against a regex compiled per call, as
+  masha did before the interpolation engine (whole-value placeholders only).
+- `first`: indexing the configuration and resolving it, as a single run does.
+- `re-resolve`: resolving it again with the index against another environment,
+  as `masha --watch` and the `masha-serve` daemon do when a variable changed.
+
+Run from the repository root:
+
+    python3 benchmarks/bench_env.py --leaves 100000 --ratio 0.01
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+# pylint: disable=C0413
+from masha.env_loader import PlaceholderIndex  # noqa: E402
+
+
+def config(leaves, ratio):
+    """Return a generated configuration of `leaves` values in groups of 100."""
+    every = max(1, round(1 / ratio)) if ratio else 0
+    groups = {}
+    for leaf in range(leaves):
+        group = groups.setdefault(f"group{leaf // 100:05d}", {})
+        if every and leaf % every == 0:
+            value = f"${{MASHA_HOST_{leaf % 7}: host{leaf}}}"
+            if leaf % (2 * every) == 0:
+                value = f"https://{value}:${{MASHA_PORT:80}}/v{leaf}"
+        else:
+            value = f"value {leaf}"
+        group[f"key{leaf % 100:03d}"] = value
+    return {"groups": groups}
+
+
+def rescan(conf, environ):
+    """Resolve by matching every string value, copying every container."""
+    pattern = re.compile(r"\$\{(\w+):\s*(.*?)\}")
+
+    def resolve(value):
+        if isinstance(value, str):
+            match = pattern.fullmatch(value)
+            if match:
+                name, default = match.groups()
+                return environ.get(
+                    name, None if default == "null" else default
+                )
+            return value
+        if isinstance(value, dict):
+            return {k: resolve(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [resolve(v) for v in value]
+        return value
+
+    return resolve(conf)
+
+
+def timed(function, repeat):
+    """Return the best time in seconds of `repeat` calls of `function`."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(leaves, ratio, repeat):
+    """Measure every approach, returning the results per approach name."""
+    conf = config(leaves, ratio)
+    environ = dict(os.environ, MASHA_HOST_1="example.com")
+    other = dict(environ, MASHA_PORT="8080")
+    index = PlaceholderIndex(conf)
+    approaches = {
+        "rescan": lambda: rescan(conf, environ),
+        "first": lambda: PlaceholderIndex(conf).resolve(conf, environ),
+        "re-resolve": lambda: index.resolve(conf, other),
+    }
+    results = {
+        name: {"seconds": timed(function, repeat)}
+        for name, function in approaches.items()
+    }
+    results["re-resolve"]["placeholders"] = len(index)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--leaves", type=int, default=100000)
+    parser.add_argument("--ratio", type=float, default=0.01)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON."
+    )
+    args = parser.parse_args()
+
+    results = run(args.leaves, args.ratio, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        print(f"{name:12} time {result['seconds'] * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark the memory used to merge and resolve layered configurations.
+
+`--layers` generated configuration layers of `--hosts` hosts each are merged,
+their environment variable placeholders and templated values resolved, as done
+before rendering a template. The peak memory allocated on top of the parsed
+layers is measured with `tracemalloc` for:
+
+- `copying`: merging with `merge_configs` and copying the whole tree in every
+  stage, as masha did before the overlay.
+- `overlay`: the pipeline over a `ConfigOverlay`, copying only the containers of
+  changed values.
+- `overlay-deep`: the same with nested mappings merged key by key.
+
+Run from the repository root:
+
+    python3 benchmarks/bench_memory.py --layers 20 --hosts 2000
+"""
+
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import jinja2
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+# pylint: disable=C0413
+from masha.config_loader import merge_configs  # noqa: E402
+from masha.config_overlay import ConfigOverlay, materialize  # noqa: E402
+from masha.env_loader import resolve_env_variables  # noqa: E402
+from masha.template_resolver import resolve_templates  # noqa: E402
+
+
+def layer(index, hosts):
+    """Return a generated configuration layer."""
+    return {
+        "layer": index,
+        "owner": "${MASHA_OWNER: team}",
+        "domain": f"layer{index}.example.com",
+        "hosts": {
+            f"host{host:05d}": {
+                "address": f"10.{index}.{host >> 8 & 255}.{host & 255}",
+                "port": 8000 + host % 100,
+                "tags": ["web", f"rack{host % 40}"],
+            }
+            for host in range(hosts)
+        },
+        "url": "https://{{ domain }}/",
+    }
+
+
+def _copy_tree(value):
+    if isinstance(value, dict):
+        return {k: _copy_tree(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_tree(v) for v in value]
+    return value
+
+
+def copying(layers):
+    """The pipeline copying the whole tree in every stage."""
+    merged = merge_configs(layers)
+    env_config = resolve_env_variables(_copy_tree(merged))
+    return resolve_templates(_copy_tree(env_config), jinja2.Environment())
+
+
+def overlay(layers, deep=False):
+    """The pipeline over a copy-free overlay."""
+    merged = ConfigOverlay(layers, deep)
+    env_config = resolve_env_variables(merged)
+    return materialize(resolve_templates(env_config, jinja2.Environment()))
+
+
+def measure(function, layers):
+    """Return the peak memory in bytes and the time in seconds of `function`."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(layers)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak, elapsed
+
+
+def run(layers, hosts):
+    """Measure every approach, returning the results per approach name."""
+    configs = [layer(index, hosts) for index in range(layers)]
+    approaches = {
+        "copying": copying,
+        "overlay": overlay,
+        "overlay-deep": lambda configs: overlay(configs, deep=True),
+    }
+    results = {}
+    for name, function in approaches.items():
+        peak, elapsed = measure(function, configs)
+        results[name] = {"peak_bytes": peak, "seconds": elapsed}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--layers", type=int, default=20)
+    parser.add_argument("--hosts", type=int, default=2000)
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON."
+    )
+    args = parser.parse_args()
+
+    results = run(args.layers, args.hosts)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        print(
+            f"{name:14} peak {result['peak_bytes'] / 1e6:8.1f} MB   "
+            f"time {result['seconds'] * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
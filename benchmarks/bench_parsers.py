@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark the parser backends of every configuration file type.
+
+A generated inventory of `--hosts` hosts is written as YAML, JSON and TOML, and
+every available backend of `masha.config_parsers` parses it `--repeat` times.
+
+Run from the repository root:
+
+    python3 benchmarks/bench_parsers.py --hosts 20000
+"""
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+# pylint: disable=C0413
+from masha.config_parsers import available_parsers  # noqa: E402
+
+
+def inventory(hosts):
+    """Return a generated inventory configuration with `hosts` hosts."""
+    return {
+        "hosts": {
+            f"host{index:06d}": {
+                "address": f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}",
+                "port": 8000 + index % 100,
+                "enabled": index % 3 != 0,
+                "weight": index / 7,
+                "tags": ["web", f"rack{index % 40}"],
+            }
+            for index in range(hosts)
+        }
+    }
+
+
+def serialize(config):
+    """Return the configuration as the bytes of each supported file type."""
+    # pylint: disable=C0415
+    import toml
+    import yaml
+
+    return {
+        ".yaml": yaml.safe_dump(config).encode("utf-8"),
+        ".json": json.dumps(config).encode("utf-8"),
+        ".toml": toml.dumps(config).encode("utf-8"),
+    }
+
+
+def run(hosts, repeat):
+    """Time every backend, returning the timings per suffix and backend name."""
+    results = {}
+    for suffix, data in serialize(inventory(hosts)).items():
+        for backend in available_parsers(suffix):
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                backend.parse(data)
+                times.append(time.perf_counter() - start)
+            results[f"{suffix[1:]}/{backend.name}"] = {
+                "min": min(times),
+                "median": statistics.median(times),
+                "repeat": repeat,
+                "bytes": len(data),
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--hosts", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON."
+    )
+    args = parser.parse_args()
+
+    results = run(args.hosts, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        print(
+            f"{name:20} {result['bytes'] / 1e6:6.1f} MB   "
+            f"min {result['min'] * 1000:8.1f} ms   "
+            f"median {result['median'] * 1000:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
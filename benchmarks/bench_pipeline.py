@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+"""
+Benchmark every stage of the masha pipeline on synthetic configurations.
+
+The generated inputs cover the shapes masha is slow on:
+
+- `wide`: a configuration of `--keys` keys, one in a hundred templated.
+- `deep`: nested mappings `--depth` levels deep.
+- `chain`: `--chain` templated values, each one referencing the previous one.
+- `layers`: `--layers` variable files of 2000 keys, merged in order.
+- `output`: a template rendering a line per key of the wide configuration.
+
+Every stage (`load_and_merge_configs`, `resolve_env_variables`,
+`render_templates_with_filters`, `validate_config`, `render_jinja_template`) is
+timed on the inputs it is sensitive to, its peak memory measured with
+`tracemalloc` in a separate run; end-to-end `masha` runs are timed in fresh
+processes, reporting their maximum resident set size.
+
+Results can be saved as a baseline and later runs compared with it, failing when
+a result regressed by more than a threshold. Run from the repository root:
+
+    python3 benchmarks/bench_pipeline.py --save baseline.json
+    python3 benchmarks/bench_pipeline.py compare baseline.json --threshold 0.2
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+# pylint: disable=C0413
+from masha.cli import render_jinja_template  # noqa: E402
+from masha.config_loader import load_and_merge_configs  # noqa: E402
+from masha.config_validator import load_model_class  # noqa: E402
+from masha.config_validator import validate_config  # noqa: E402
+from masha.env_loader import resolve_env_variables  # noqa: E402
+from masha.template_renderer import render_templates_with_filters  # noqa: E402
+
+# sizes of the generated inputs
+DEFAULT_SIZES = {"keys": 100000, "depth": 200, "chain": 500, "layers": 50}
+
+# results below these are too small to compare reliably
+MIN_SECONDS = 0.005
+MIN_BYTES = 1 << 20
+
+MODEL = """\
+from typing import Dict
+
+from pydantic import BaseModel
+
+
+class Wide(BaseModel):
+    name: str
+    run: int = 0
+    values: Dict[str, str]
+"""
+
+
+def wide_config(keys):
+    """Return a configuration of `keys` values, one in a hundred templated."""
+    return {
+        "name": "wide",
+        "values": {
+            f"key{index:06d}": (
+                "{{ name }}-${MASHA_BENCH_SUFFIX:dev}"
+                if index % 100 == 0
+                else f"value {index}"
+            )
+            for index in range(keys)
+        },
+    }
+
+
+def deep_config(depth):
+    """Return nested mappings `depth` levels deep, with leaves on every level."""
+    config = {"leaf": "{{ name }}"}
+    for level in range(depth):
+        config = {
+            "level": level,
+            "path": f"/srv/${{MASHA_BENCH_ROOT:data}}/{level}",
+            "child": config,
+        }
+    return {"name": "deep", "tree": config}
+
+
+def chain_config(length):
+    """Return templated values each referencing the previous one."""
+    config = {"v0": "start"}
+    for index in range(1, length):
+        config[f"v{index}"] = f"{{{{ v{index - 1} | length }}}}"
+    return config
+
+
+def layer_config(index, keys=2000):
+    """Return a variable layer overriding the keys of the previous ones."""
+    return {
+        "layer": index,
+        "values": {
+            f"key{key:05d}": f"layer {index} value {key}"
+            for key in range(index * 100, index * 100 + keys)
+        },
+        f"own{index}": {"port": 8000 + index},
+    }
+
+
+def write_json(path, config):
+    """Write a configuration file, JSON being the fastest to generate."""
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return path
+
+
+class Inputs:
+    """The generated input files, written once to a temporary directory."""
+
+    # pylint: disable=R0902
+    def __init__(self, directory, args):
+        self.directory = Path(directory)
+        self.wide = wide_config(args.keys)
+        self.deep = deep_config(args.depth)
+        self.chain = chain_config(args.chain)
+        self.wide_file = write_json(self.directory / "wide.json", self.wide)
+        self.layer_files = [
+            write_json(
+                self.directory / f"layer{index:03d}.json", layer_config(index)
+            )
+            for index in range(args.layers)
+        ]
+        self.model_file = self.directory / "model.py"
+        self.model_file.write_text(MODEL, encoding="utf-8")
+        self.template = self.directory / "output.j2"
+        self.template.write_text(
+            "{% for key, value in values.items() %}{{ key }} = {{ value }}\n"
+            "{% endfor %}",
+            encoding="utf-8",
+        )
+        self.output = self.directory / "output.txt"
+
+
+def stage_benchmarks(inputs):
+    """Return the in-process benchmarks, a function to time per name."""
+    resolved_wide = render_templates_with_filters(
+        resolve_env_variables(inputs.wide)
+    )
+    model_class = load_model_class(inputs.model_file, "Wide")
+    runs = iter(range(1 << 30))
+
+    def validate():
+        # a config of its own every time, not one known to be valid
+        config = dict(resolved_wide, run=next(runs))
+        return validate_config(config, model_class)
+
+    return {
+        "load/wide": lambda: load_and_merge_configs([inputs.wide_file]),
+        "load/layers": lambda: load_and_merge_configs(inputs.layer_files),
+        "load/layers-deep": lambda: load_and_merge_configs(
+            inputs.layer_files, deep=True
+        ),
+        "env/wide": lambda: resolve_env_variables(inputs.wide),
+        "env/deep": lambda: resolve_env_variables(inputs.deep),
+        "templates/wide": lambda: render_templates_with_filters(inputs.wide),
+        "templates/deep": lambda: render_templates_with_filters(inputs.deep),
+        "templates/chain": lambda: render_templates_with_filters(inputs.chain),
+        "validate/wide": validate,
+        "validate/wide-known": lambda: validate_config(
+            dict(resolved_wide, run=-1), model_class
+        ),
+        "render/output": lambda: render_jinja_template(
+            inputs.template, inputs.output, resolved_wide
+        ),
+    }
+
+
+def cli_benchmarks(inputs):
+    """Return the end-to-end benchmarks, the masha arguments per name."""
+    output = str(inputs.output)
+    return {
+        "cli/wide": [
+            "-v",
+            str(inputs.wide_file),
+            "-o",
+            output,
+            str(inputs.template),
+        ],
+        "cli/wide-validated": [
+            "-v",
+            str(inputs.wide_file),
+            "-m",
+            str(inputs.model_file),
+            "-c",
+            "Wide",
+            "-o",
+            output,
+            str(inputs.template),
+        ],
+        "cli/layers": [
+            *(arg for path in inputs.layer_files for arg in ("-v", str(path))),
+            "-o",
+            output,
+            str(inputs.template),
+        ],
+    }
+
+
+def measure_stage(function, repeat):
+    """Return the best time of `repeat` calls, and the peak memory of one."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    result = function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return {"seconds": best, "peak_bytes": peak}
+
+
+# runs masha like `python -m masha.cli`, writing the peak resident set size of
+# the process at exit: the one getrusage reports for a child also counts the
+# memory of the benchmark process it was forked from
+CLI_RUNNER = """\
+import atexit
+import sys
+
+
+def report(path=sys.argv[1]):
+    try:
+        with open("/proc/self/status") as status, open(path, "w") as out:
+            out.write(next(l for l in status if l.startswith("VmHWM:")).split()[1])
+    except (OSError, StopIteration):
+        pass
+
+
+atexit.register(report)
+sys.argv = ["masha", *sys.argv[2:]]
+from masha.cli import main
+
+main()
+"""
+
+
+def measure_cli(args, repeat):
+    """Return the best time and the largest resident set size of masha runs."""
+    best = None
+    max_rss = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rss_file = Path(tmp_dir) / "rss"
+        for _ in range(repeat):
+            start = time.perf_counter()
+            process = subprocess.Popen(  # pylint: disable=R1732
+                [
+                    sys.executable,
+                    "-c",
+                    CLI_RUNNER,
+                    str(rss_file),
+                    "--log-level",
+                    "ERROR",
+                    *args,
+                ],
+                cwd=REPO_DIR,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            _, status, usage = os.wait4(process.pid, 0)
+            elapsed = time.perf_counter() - start
+            process.returncode = os.waitstatus_to_exitcode(status)
+            if process.returncode:
+                raise RuntimeError(f"masha {' '.join(args)} failed")
+            best = elapsed if best is None else min(best, elapsed)
+            try:
+                rss = int(rss_file.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                # without /proc, an upper bound
+                rss = usage.ru_maxrss
+            # kilobytes on Linux
+            max_rss = max(max_rss, rss * 1024)
+    return {"seconds": best, "max_rss_bytes": max_rss}
+
+
+def sizes(args, saved=None):
+    """Return the input sizes of the options, else the saved ones or defaults."""
+    saved = saved or {}
+    return {
+        size: getattr(args, size) or saved.get(size, default)
+        for size, default in DEFAULT_SIZES.items()
+    }
+
+
+def run(args):
+    """Run the selected benchmarks, returning the results per name."""
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs = Inputs(tmp_dir, args)
+        for name, function in stage_benchmarks(inputs).items():
+            if not args.only or any(name.startswith(p) for p in args.only):
+                results[name] = measure_stage(function, args.repeat)
+        if not args.no_cli:
+            for name, cli_args in cli_benchmarks(inputs).items():
+                if not args.only or any(name.startswith(p) for p in args.only):
+                    results[name] = measure_cli(cli_args, args.repeat)
+    return results
+
+
+def regressions(baseline, current, threshold):
+    """
+    Compare results with a baseline.
+
+    Args:
+        baseline (dict): The baseline results per benchmark name.
+        current (dict): The results to compare, per benchmark name.
+        threshold (float): The relative growth regressing a result.
+
+    Returns:
+        list: A (name, metric, baseline, current, regressed) tuple per metric
+              present in both, regressed if it grew by more than `threshold`.
+    """
+    rows = []
+    for name, result in current.items():
+        for metric, value in result.items():
+            base = baseline.get(name, {}).get(metric)
+            if base is None:
+                continue
+            floor = MIN_SECONDS if metric == "seconds" else MIN_BYTES
+            regressed = value > base * (1 + threshold) and value - base > floor
+            rows.append((name, metric, base, value, regressed))
+    return rows
+
+
+def format_value(metric, value):
+    """Format a time in milliseconds and a memory size in megabytes."""
+    if metric == "seconds":
+        return f"{value * 1000:10.1f} ms"
+    return f"{value / 1e6:10.1f} MB"
+
+
+def print_results(results):
+    """Print the results as a table."""
+    for name, result in results.items():
+        print(
+            f"{name:22}"
+            + "   ".join(
+                f"{metric} {format_value(metric, value)}"
+                for metric, value in result.items()
+            )
+        )
+
+
+def add_run_arguments(parser):
+    """Add the options selecting and sizing the benchmarks."""
+    for size, default in DEFAULT_SIZES.items():
+        parser.add_argument(
+            f"--{size}", type=int, help=f"Input size, by default {default}."
+        )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--only",
+        action="append",
+        metavar="PREFIX",
+        help="Only run the benchmarks whose name starts with PREFIX, repeatable.",
+    )
+    parser.add_argument(
+        "--no-cli", action="store_true", help="Skip the end-to-end masha runs."
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command")
+    add_run_arguments(parser)
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON."
+    )
+    parser.add_argument(
+        "--save", type=Path, metavar="FILE", help="Save the results as JSON."
+    )
+    compare = commands.add_parser(
+        "compare",
+        help="Compare with a saved baseline, failing on regressions.",
+    )
+    compare.add_argument("baseline", type=Path)
+    compare.add_argument(
+        "current",
+        type=Path,
+        nargs="?",
+        help="Saved results to compare, by default the benchmarks are run.",
+    )
+    compare.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative growth of a time or memory result failing the comparison.",
+    )
+    add_run_arguments(compare)
+    args = parser.parse_args()
+    # the stages log every run
+    logging.getLogger("masha").setLevel(logging.WARNING)
+
+    if args.command == "compare":
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        if args.current:
+            current = json.loads(args.current.read_text(encoding="utf-8"))
+        else:
+            # the sizes of the baseline, unless given
+            vars(args).update(sizes(args, baseline["sizes"]))
+            current = {"sizes": sizes(args), "results": run(args)}
+        if current["sizes"] != baseline["sizes"]:
+            print(
+                f"warning: input sizes {current['sizes']} differ from the "
+                f"baseline ones {baseline['sizes']}"
+            )
+        rows = regressions(
+            baseline["results"], current["results"], args.threshold
+        )
+        for name, metric, base, value, regressed in rows:
+            print(
+                f"{name:22} {metric:14}{format_value(metric, base)} -> "
+                f"{format_value(metric, value)}  {value / base - 1:+7.1%}"
+                f"{'  REGRESSED' if regressed else ''}"
+            )
+        failed = [row for row in rows if row[4]]
+        if failed:
+            print(
+                f"{len(failed)} results regressed by more than "
+                f"{args.threshold:.0%}"
+            )
+            sys.exit(1)
+        return
+
+    vars(args).update(sizes(args))
+    saved = {"sizes": sizes(args), "results": run(args)}
+    if args.save:
+        args.save.write_text(json.dumps(saved, indent=2), encoding="utf-8")
+    if args.json:
+        print(json.dumps(saved, indent=2))
+    else:
+        print_results(saved["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cold start of the masha command line.
+
+Every measurement runs masha in a fresh Python process, so the interpreter start,
+the imports and the logging setup are all included:
+
+- `help`: `masha --help`.
+- `render`: rendering a one-line template with a one-key YAML file.
+
+Run from the repository root:
+
+    python3 benchmarks/bench_startup.py --repeat 20
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def time_command(args, repeat):
+    """Return the wall times in seconds of `repeat` runs of a masha command."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "masha.cli", *args],
+            cwd=REPO_DIR,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run(repeat):
+    """Run the startup benchmarks, returning the timings per benchmark name."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        (tmp_dir / "vars.yaml").write_text("name: masha\n", encoding="utf-8")
+        (tmp_dir / "input.j2").write_text(
+            "Hello {{ name }}\n", encoding="utf-8"
+        )
+        render_args = [
+            "-v",
+            str(tmp_dir / "vars.yaml"),
+            "-o",
+            str(tmp_dir / "output.txt"),
+            str(tmp_dir / "input.j2"),
+        ]
+        return {
+            "help": time_command(["--help"], repeat),
+            "render": time_command(render_args, repeat),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON."
+    )
+    args = parser.parse_args()
+
+    results = {
+        name: {
+            "min": min(times),
+            "median": statistics.median(times),
+            "repeat": len(times),
+        }
+        for name, times in run(args.repeat).items()
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, result in results.items():
+        print(
+            f"{name:8} min {result['min'] * 1000:7.1f} ms   "
+            f"median {result['median'] * 1000:7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,39 @@
-# pylint: disable=E0605,C0114
-# ruff: noqa: F401
-from .config_loader import load_and_merge_configs, load_config, merge_configs
-from .config_validator import load_model_class, validate_config
-from .env_loader import resolve_env_variables
-from .logger_factory import create_logger
-from .template_renderer import (
-    load_functions_from_directory,
-    load_functions_from_file,
-    render_templates_with_filters,
-)
+# pylint: disable=C0114
+# The public functions are imported from their submodules on first access, so
+# that importing masha, e.g. to run `masha --help`, does not pull in Pydantic,
+# Jinja2 or the configuration parsers.
+import importlib
+
 from .version import __version__
 
+_LAZY_ATTRIBUTES = {
+    "load_and_merge_configs": "config_loader",
+    "load_config": "config_loader",
+    "merge_configs": "config_loader",
+    "load_model_class": "config_validator",
+    "validate_config": "config_validator",
+    "resolve_env_variables": "env_loader",
+    "IncrementalEngine": "incremental",
+    "create_logger": "logger_factory",
+    "create_jinja_environment": "template_renderer",
+    "load_functions_from_directory": "template_renderer",
+    "load_functions_from_file": "template_renderer",
+    "render_templates_with_filters": "template_renderer",
+    "render_templates_with_functions": "template_renderer",
+}
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
+
+
 __all__ = "masha"
@@ -0,0 +1,130 @@
+"""
+Event loop support for rendering with coroutine filters and tests.
+
+In async mode masha's Jinja2 environments are created with `enable_async=True`,
+so filters and tests written as `async def` functions are awaited. Each render
+runs on its own event loop, where the coroutine functions loaded from the filter
+and test directories may run concurrently, at most `DEFAULT_CONCURRENCY` of them
+at a time unless changed with `set_async_concurrency`. Synchronous filters and
+tests are called as before.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import functools
+import inspect
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator
+
+DEFAULT_CONCURRENCY = 16
+
+_concurrency = DEFAULT_CONCURRENCY
+_semaphore: contextvars.ContextVar = contextvars.ContextVar(
+    "masha_async_semaphore", default=None
+)
+
+
+def set_async_concurrency(limit: int):
+    """
+    Set how many coroutine filters and tests may run at the same time.
+
+    Args:
+        limit (int): The maximum number of concurrently awaited calls, 0 for no
+                     limit.
+    """
+    global _concurrency  # pylint: disable=W0603
+    _concurrency = limit
+
+
+def limit_concurrency(function: Callable) -> Callable:
+    """
+    Make a coroutine function wait for a free slot of the running render.
+
+    Args:
+        function (Callable): A filter or test, returned unchanged unless it is a
+                             coroutine function.
+
+    Returns:
+        Callable: The function, limited to the concurrency of the render loop.
+    """
+    if not inspect.iscoroutinefunction(function):
+        return function
+
+    @functools.wraps(function)
+    async def limited(*args, **kwargs):
+        semaphore = _semaphore.get()
+        if semaphore is None:
+            return await function(*args, **kwargs)
+        async with semaphore:
+            return await function(*args, **kwargs)
+
+    return limited
+
+
+def limit_functions(functions: Dict[str, Callable]) -> Dict[str, Callable]:
+    """
+    Apply `limit_concurrency` to the filters or tests of a directory.
+
+    Args:
+        functions (Dict[str, Callable]): The functions by name, as returned by
+                                        `load_functions_from_directory`.
+
+    Returns:
+        Dict[str, Callable]: The functions, coroutine functions being limited.
+    """
+    return {name: limit_concurrency(f) for name, f in functions.items()}
+
+
+@contextlib.contextmanager
+def _render_loop() -> Iterator[asyncio.AbstractEventLoop]:
+    """A new event loop whose tasks share one concurrency semaphore."""
+    loop = asyncio.new_event_loop()
+    token = _semaphore.set(
+        asyncio.Semaphore(_concurrency) if _concurrency else None
+    )
+    try:
+        yield loop
+    finally:
+        _semaphore.reset(token)
+        try:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+
+def run_async(awaitable: Awaitable) -> Any:
+    """
+    Run a coroutine on a new render loop.
+
+    Args:
+        awaitable (Awaitable): The coroutine to run.
+
+    Returns:
+        Any: Its result.
+    """
+    with _render_loop() as loop:
+        return loop.run_until_complete(awaitable)
+
+
+def iterate_async(iterator: AsyncIterator) -> Iterator:
+    """
+    Iterate over an async iterator, such as `Template.generate_async`, lazily.
+
+    Every item is awaited on the same render loop when it is requested, so a
+    rendered template can still be streamed chunk by chunk.
+
+    Args:
+        iterator (AsyncIterator): The async iterator.
+
+    Yields:
+        Any: Its items.
+    """
+    with _render_loop() as loop:
+        try:
+            while True:
+                try:
+                    yield loop.run_until_complete(anext(iterator))
+                except StopAsyncIteration:
+                    return
+        finally:
+            loop.run_until_complete(iterator.aclose())
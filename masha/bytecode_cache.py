@@ -0,0 +1,159 @@
+"""
+Persistent on-disk cache of compiled Jinja2 templates.
+
+`DiskTemplateCache` is a Jinja2 `FileSystemBytecodeCache`, so it is plugged into
+an environment as its `bytecode_cache` and then transparently used for every
+template loaded through the environment's loader. Config-string templates, which
+are not loaded through a loader, are stored in the same directory by
+`masha.template_resolver`, keyed by the hash of their source text.
+
+Entries are keyed by the Jinja2, Python and masha versions as well, and the cache
+is kept below a configurable size by evicting the least recently used entries.
+"""
+
+import hashlib
+import os
+import sys
+from pathlib import Path
+from typing import Dict
+
+import jinja2
+from jinja2.bccache import Bucket
+
+# pylint: disable=W1203
+from masha.logger_factory import create_logger
+from masha.version import __version__
+
+logger = create_logger("masha")
+
+DEFAULT_MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+_CONFIG_STRING_NAME = "<config-string>"
+
+_VERSION_TAG = (
+    f"masha-{__version__}|jinja2-{jinja2.__version__}"
+    f"|py-{sys.version_info[0]}.{sys.version_info[1]}"
+)
+
+
+class DiskTemplateCache(jinja2.FileSystemBytecodeCache):
+    """
+    A size-bounded Jinja2 bytecode cache shared between masha runs.
+
+    Args:
+        directory (str): The directory holding the cache entries, created if
+                         missing.
+        max_bytes (int, optional): Total size of the entries above which the least
+                         recently used ones are evicted. Defaults to
+                         `DEFAULT_MAX_CACHE_BYTES`.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = None):
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(str(directory), "__masha_%s.cache")
+        self.max_bytes = (
+            DEFAULT_MAX_CACHE_BYTES if max_bytes is None else max_bytes
+        )
+        self._dirty = False
+
+    def get_cache_key(self, name: str, filename: str = None) -> str:
+        hash_ = hashlib.sha256(f"{_VERSION_TAG}|{name}".encode("utf-8"))
+        if filename is not None:
+            hash_.update(f"|{filename}".encode("utf-8"))
+        return hash_.hexdigest()
+
+    def load_bytecode(self, bucket: Bucket):
+        super().load_bytecode(bucket)
+        if bucket.code is not None:
+            # mark the entry as recently used for the eviction
+            try:
+                os.utime(self._get_cache_filename(bucket))
+            except OSError:
+                pass
+
+    def dump_bytecode(self, bucket: Bucket):
+        super().dump_bytecode(bucket)
+        self._dirty = True
+
+    def get_string_bucket(
+        self, environment: jinja2.Environment, source: str, env_key: tuple
+    ) -> Bucket:
+        """
+        Return the bucket of a config-string template.
+
+        Args:
+            environment (jinja2.Environment): The environment compiling `source`.
+            source (str): The template source text.
+            env_key (tuple): The compile-relevant settings of `environment`.
+
+        Returns:
+            Bucket: The bucket, whose `code` is None if the entry is not cached.
+        """
+        source_hash = hashlib.sha256(
+            f"{env_key!r}|{source}".encode("utf-8")
+        ).hexdigest()
+        return self.get_bucket(
+            environment, _CONFIG_STRING_NAME, source_hash, source
+        )
+
+    def prune(self):
+        """
+        Evict the least recently used entries until the cache fits `max_bytes`.
+        """
+        if not self._dirty:
+            return
+        self._dirty = False
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not (
+                    entry.name.startswith("__masha_")
+                    and entry.name.endswith(".cache")
+                ):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        logger.debug(f"Evicted {evicted} entries from {self.directory}")
+
+
+_disk_caches: Dict[Path, DiskTemplateCache] = {}
+
+
+def get_disk_cache(cache_dir: str, max_bytes: int = None) -> DiskTemplateCache:
+    """
+    Return the compiled-template cache stored below `cache_dir`.
+
+    The same instance is returned for the same directory, so the config-string
+    templates and the input template share one cache per process.
+
+    Args:
+        cache_dir (str): The masha cache directory.
+        max_bytes (int, optional): Size limit of the cache; keeps the current
+                          limit (or the default one) if None. Defaults to None.
+
+    Returns:
+        DiskTemplateCache: The cache of the `templates` subdirectory.
+    """
+    directory = Path(cache_dir).resolve() / "templates"
+    if directory not in _disk_caches:
+        _disk_caches[directory] = DiskTemplateCache(str(directory), max_bytes)
+    elif max_bytes is not None:
+        _disk_caches[directory].max_bytes = max_bytes
+    return _disk_caches[directory]
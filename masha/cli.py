@@ -3,24 +3,64 @@
 Render the input file using Jinja2 with the provided configuration.
 """
 
-import json
+import functools
+import logging
+import multiprocessing
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Set
 
 import click
 import jinja2
 from returns.result import Failure, Result, Success
 
 # pylint: disable=W1203
-from masha.config_loader import load_and_merge_configs
-from masha.config_validator import load_model_class, validate_config
+from masha.async_render import DEFAULT_CONCURRENCY, set_async_concurrency
+from masha.bytecode_cache import DEFAULT_MAX_CACHE_BYTES, get_disk_cache
+from masha.config_cache import get_config_cache
+from masha.config_loader import (
+    expand_config_paths,
+    load_and_merge_configs,
+    load_configs,
+)
+from masha.config_overlay import ConfigOverlay, materialize
 from masha.env_loader import resolve_env_variables
-from masha.logger_factory import create_logger
+from masha.function_registry import FunctionRegistry
+from masha.logger_factory import (
+    LOG_FORMATS,
+    LOG_LEVELS,
+    configure_logging,
+    create_logger,
+    log_config,
+)
+from masha.manifest import RenderJob, job_report, load_manifest, write_report
+from masha.matrix import combination_output, load_matrix
+from masha.output_writer import is_stdout, write_template
+from masha.profiler import (
+    count,
+    is_active,
+    merge_profiled,
+    profiling,
+    run_profiled,
+    stage,
+)
+from masha.template_cache import DEFAULT_CACHE_SIZE, set_template_cache_size
 from masha.template_renderer import (
-    load_functions_from_directory,
-    render_templates_with_filters,
+    compile_config_templates,
+    create_jinja_environment,
+    render_templates_with_functions,
+    select_required_config,
 )
+from masha.template_resolver import (
+    KeyPath,
+    TemplateCycleError,
+    find_template_references,
+)
+from masha.tree_renderer import render_tree
+from masha.watcher import RenderSession
+from masha.watcher import watch as watch_inputs
 
 logger = create_logger("masha")
 
@@ -31,78 +71,145 @@ def render_jinja_template(
     config: Dict[str, Any],
     filters_directory: str = None,
     tests_directory: str = None,
+    cache_dir: Path = None,
+    jenv: jinja2.Environment = None,
+    only_if_changed: bool = False,
+    enable_async: bool = False,
 ) -> Result[bool, Exception]:
     """
     Render the input file using Jinja2 with the provided configuration.
 
     Args:
         input_file (Path): The path to the input template file.
-        output_file (Path): The path where the rendered output will be saved.
+        output_file (Path): The path where the rendered output will be saved, `-`
+                            for stdout. It is written as the template renders.
         config (Dict[str, Any]): A dictionary containing the configuration for rendering.
         filters_directory (str, optional): The directory containing custom Jinja2 filters.
                             Defaults to None.
         tests_directory (str, optional): The directory containing custom Jinja2 tests.
                             Defaults to None.
+        cache_dir (Path, optional): The directory of the persistent compiled-template
+                            cache. Defaults to None.
+        jenv (jinja2.Environment, optional): An environment loading templates from
+                            the directory of `input_file`, see
+                            `create_jinja_environment`. If given, the filter, test
+                            and cache arguments are ignored. Defaults to None.
+        only_if_changed (bool, optional): Keep `output_file` untouched if it already
+                            has the rendered content. Defaults to False.
+        enable_async (bool, optional): Render with an async environment, awaiting
+                            coroutine filters and tests. Ignored if `jenv` is
+                            given. Defaults to False.
 
     Returns:
-        Result[bool, Exception]: Success(True) if the template is rendered successfully,
+        Result[bool, Exception]: Success(True) if the template is rendered and written,
+                                Success(False) if the output was kept unchanged,
                                 Failure(exception) if an error occurs during rendering.
     """
     try:
-        jenv = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(input_file.parent)
-        )
-        if filters_directory:
-            filters = load_functions_from_directory(filters_directory)
-            jenv.filters.update(filters)  # Add custom filters functions
-        if tests_directory:
-            tests = load_functions_from_directory(tests_directory)
-            jenv.tests.update(tests)  # Add custom tests
-        template = jenv.get_template(input_file.name)
-        rendered_content = template.render(config)
-
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(rendered_content)
-
-        logger.info(f"Rendered output written to {output_file}")
-        return Success(True)
+        if jenv is None:
+            jenv = create_jinja_environment(
+                input_file.parent,
+                _function_registry(filters_directory),
+                _function_registry(tests_directory),
+                cache_dir,
+                enable_async,
+            )
+        changed = write_template(
+            jenv.get_template(input_file.name),
+            config,
+            output_file,
+            only_if_changed=only_if_changed,
+        )
+        if jenv.bytecode_cache is not None:
+            jenv.bytecode_cache.prune()
+
+        if changed:
+            logger.info(f"Rendered output written to {output_file}")
+        else:
+            logger.info(f"Rendered output unchanged in {output_file}")
+        return Success(changed)
     # pylint: disable=W0718
     except Exception as e:
         logger.error(f"Failed to render template: {e}")
         return Failure(e)
 
 
-# pylint: disable=R0913,R0917,E1120
-def process_template_with_validation(
+# pylint: disable=R0913,R0917
+def prepare_template_config(
     variables: tuple[Path],
     template_filters_directory: Path,
     template_tests_directory: Path,
-    output: Path,
-    input_file: Path,
     model_file: Path = None,
     class_model: str = None,
+    cache_dir: Path = None,
+    processes: int = 1,
+    deep_merge: bool = False,
+    enable_async: bool = False,
+    roots: Set[KeyPath] = None,
 ) -> Result[Dict, Exception]:
     """
-    Validates merged configurations against a Pydantic model and renders an input template.
+    Load, merge, resolve and validate the configuration an input template is rendered with.
+
+    The variable files, the filters, the tests and the model class do not depend on
+    each other and are loaded concurrently.
 
     Parameters:
-    - variables (tuple[Path]): A tuple of file paths containing configuration variables.
+    - variables (tuple[Path]): A tuple of file paths, directories or glob patterns of
+                    configuration variables.
     - template_filters_directory (Path): The directory containing custom template filters.
     - template_tests_directory (Path): The directory containing custom template tests.
-    - output (Path): The path where the rendered template will be saved.
-    - input_file (Path): The path to the input template file.
     - model_file (Path, optional): The path to a Pydantic model file. If provided,
                     the configuration will be validated against this model.
     - class_model (str, optional): The name of the model class within the `model_file`.
                     Required if `model_file` is provided.
+    - cache_dir (Path, optional): The directory of the persistent compiled-template
+                    and parsed-config caches. Defaults to None.
+    - processes (int, optional): The number of processes parsing YAML and TOML
+                    variable files. Defaults to 1.
+    - deep_merge (bool, optional): Merge nested mappings of the variable files key
+                    by key instead of replacing them. Defaults to False.
+    - enable_async (bool, optional): Render with async Jinja2 environments, awaiting
+                    coroutine filters and tests and running those of independent
+                    config values concurrently. Defaults to False.
+    - roots (Set[KeyPath], optional): The key paths the input template reads, see
+                    `find_template_references`. If given, only the values needed
+                    to render them are resolved and rendered. Defaults to None,
+                    resolving the whole configuration.
 
     Returns:
-    - Result[Dict, Exception]: A result object containing either the rendered template
+    - Result[Dict, Exception]: A result object containing either the resolved
                     configuration as a dictionary or an exception if any step fails.
     """
+    validate = model_file and class_model
+    if validate:
+        # pylint: disable=C0415
+        # Pydantic is slow to import, only import it when validating
+        from masha.config_validator import load_model_class, validate_config
+
+    with stage("load"), ThreadPoolExecutor(3) as executor:
+        filters_future = executor.submit(
+            _function_registry, template_filters_directory
+        )
+        tests_future = executor.submit(
+            _function_registry, template_tests_directory
+        )
+        model_future = (
+            executor.submit(
+                load_model_class, model_file, class_model, cache_dir
+            )
+            if validate
+            else None
+        )
+        loaded_configs = load_and_merge_configs(
+            variables,
+            get_config_cache(cache_dir) if cache_dir else None,
+            processes,
+            deep_merge,
+            overlay=True,
+        )
 
     merged_config = None
-    match load_and_merge_configs(variables):
+    match loaded_configs:
         case Success(value):
             merged_config = value
         case Failure(value):
@@ -110,53 +217,815 @@ def process_template_with_validation(
                 ValueError(f"Failed to load configs from files: {value}")
             )
 
-    logger.debug(f"merged_config: {merged_config}")
-    env_config = resolve_env_variables(merged_config)
-    logger.debug(f"env_config: {env_config}")
-    filters_path = template_filters_directory
-    tests_path = template_tests_directory
-    logger.debug(f"filters_path: {filters_path}")
-    template_config = render_templates_with_filters(
-        env_config, str(filters_path), str(tests_path)
-    )
-    logger.info(json.dumps(template_config))
+    template_config = None
+    match resolve_template_config(
+        merged_config,
+        filters_future.result(),
+        tests_future.result(),
+        cache_dir,
+        deep_merge,
+        enable_async,
+        roots,
+    ):
+        case Success(value):
+            template_config = value
+        case Failure(value):
+            return Failure(value)
 
-    # Load the model class
-    if model_file and class_model:
-        model_class = load_model_class(model_file, class_model)
-        if not model_class:
-            return Failure(
-                ValueError("Failed to load the specified model class.")
+    # Validate the merged configuration against the model class
+    if validate:
+        with stage("validate"):
+            model_class = model_future.result()
+            if not model_class:
+                return Failure(
+                    ValueError("Failed to load the specified model class.")
+                )
+            validation_result = validate_config(
+                template_config, model_class, cache_dir
             )
-        # Validate the merged configuration
-        validation_result = validate_config(template_config, model_class)
         if isinstance(validation_result, Failure):
             return Failure(
                 ValueError(f"Given config is invalid {validation_result}")
             )
 
-    match render_jinja_template(
-        input_file,
-        output,
-        template_config,
+    return Success(template_config)
+
+
+# pylint: disable=R0913,R0917
+def resolve_template_config(
+    merged_config: Dict[str, Any],
+    filters: FunctionRegistry = None,
+    tests: FunctionRegistry = None,
+    cache_dir: Path = None,
+    deep_merge: bool = False,
+    enable_async: bool = False,
+    roots: Set[KeyPath] = None,
+) -> Result[Dict, Exception]:
+    """
+    Resolve the environment placeholders and templated values of a merged configuration.
+
+    Parameters:
+    - merged_config (Dict[str, Any]): The merged configuration, as loaded by
+                    `load_and_merge_configs`. It is not modified.
+    - filters (FunctionRegistry, optional): The custom template filters.
+                    Defaults to None.
+    - tests (FunctionRegistry, optional): The custom template tests.
+                    Defaults to None.
+    - cache_dir (Path, optional): The directory of the persistent compiled-template
+                    cache. Defaults to None.
+    - deep_merge (bool, optional): Whether `merged_config` merges nested mappings
+                    key by key, they are then copied into plain dicts.
+                    Defaults to False.
+    - enable_async (bool, optional): Render with an async Jinja2 environment.
+                    Defaults to False.
+    - roots (Set[KeyPath], optional): The key paths the input template reads, see
+                    `find_template_references`. If given, only the values needed
+                    to render them are resolved and rendered. Defaults to None,
+                    resolving the whole configuration.
+
+    Returns:
+    - Result[Dict, Exception]: A result object containing either the resolved
+                    configuration as a dictionary or an exception if any step fails.
+    """
+    log_config(logger, logging.DEBUG, "merged_config", merged_config)
+    if roots is not None:
+        try:
+            with stage("select"):
+                merged_config = select_required_config(
+                    merged_config,
+                    roots,
+                    filters,
+                    tests,
+                    cache_dir,
+                    enable_async,
+                )
+        except jinja2.TemplateError as e:
+            return Failure(
+                ValueError(f"Failed to compile config templates: {e}")
+            )
+    with stage("env"):
+        env_config = resolve_env_variables(merged_config)
+    if deep_merge:
+        # templates render against plain dicts, not nested overlays
+        env_config = materialize(env_config)
+    log_config(logger, logging.DEBUG, "env_config", env_config)
+    try:
+        with stage("templates"):
+            template_config = render_templates_with_functions(
+                env_config,
+                filters,
+                tests,
+                cache_dir,
+                enable_async,
+            )
+    except TemplateCycleError as e:
+        return Failure(ValueError(f"Failed to render config templates: {e}"))
+    log_config(logger, logging.INFO, "template_config", template_config)
+
+    return Success(template_config)
+
+
+def _function_registry(directory: Path) -> FunctionRegistry:
+    """Scan the filters or tests of a directory, None without a directory."""
+    if not directory:
+        return None
+    registry = FunctionRegistry(directory)
+    registry.definitions()  # cached for the environments created later
+    return registry
+
+
+def _used_key_paths(
+    input_file: Path,
+    validate: bool,
+    filters_directory: Path = None,
+    tests_directory: Path = None,
+) -> Set[KeyPath]:
+    """The key paths an input template reads, None if all may be needed."""
+    if validate:
+        logger.info("Resolving the whole config to validate it")
+        return None
+    # the custom filters and tests are needed to parse the templates and to
+    # tell the ones receiving the whole context
+    jenv = create_jinja_environment(
+        input_file.parent,
+        _function_registry(filters_directory),
+        _function_registry(tests_directory),
+    )
+    try:
+        roots = find_template_references(jenv, input_file.name)
+    except jinja2.TemplateError as e:
+        # reported when the template is rendered
+        logger.debug(f"Failed to parse {input_file}: {e}")
+        return None
+    if roots is None:
+        logger.info(
+            f"{input_file} computes template names or reads its whole "
+            f"context, maybe through a filter or test, resolving the whole "
+            f"config"
+        )
+    return roots
+
+
+# pylint: disable=R0913,R0917,E1120
+def process_template_with_validation(
+    variables: tuple[Path],
+    template_filters_directory: Path,
+    template_tests_directory: Path,
+    output: Path,
+    input_file: Path,
+    model_file: Path = None,
+    class_model: str = None,
+    cache_dir: Path = None,
+    processes: int = 1,
+    deep_merge: bool = False,
+    enable_async: bool = False,
+    only_if_changed: bool = False,
+    report: str = None,
+    used_keys_only: bool = False,
+) -> Result[Dict, Exception]:
+    """
+    Validates merged configurations against a Pydantic model and renders an input template.
+
+    Parameters:
+    - variables (tuple[Path]): A tuple of file paths containing configuration variables.
+    - template_filters_directory (Path): The directory containing custom template filters.
+    - template_tests_directory (Path): The directory containing custom template tests.
+    - output (Path): The path where the rendered template will be saved.
+    - input_file (Path): The path to the input template file.
+    - model_file (Path, optional): The path to a Pydantic model file. If provided,
+                    the configuration will be validated against this model.
+    - class_model (str, optional): The name of the model class within the `model_file`.
+                    Required if `model_file` is provided.
+    - cache_dir (Path, optional): The directory of the persistent compiled-template
+                    and parsed-config caches. Defaults to None.
+    - processes (int, optional): The number of processes parsing YAML and TOML
+                    variable files. Defaults to 1.
+    - deep_merge (bool, optional): Merge nested mappings of the variable files key
+                    by key instead of replacing them. Defaults to False.
+    - enable_async (bool, optional): Render with async Jinja2 environments, awaiting
+                    coroutine filters and tests and running those of independent
+                    config values concurrently. Defaults to False.
+    - only_if_changed (bool, optional): Keep the output untouched if it already has
+                    the rendered content. Defaults to False.
+    - report (str, optional): Where to write the JSON report of the render, with the
+                    status `success`, `unchanged` or `failure`, "-" for stdout.
+                    Defaults to None, writing no report.
+    - used_keys_only (bool, optional): Only resolve and render the config values
+                    the input template, its includes and imports read. The whole
+                    configuration is still resolved if the template names are
+                    computed at render time or if it is validated against a
+                    model. Defaults to False.
+
+    Returns:
+    - Result[Dict, Exception]: A result object containing either the rendered template
+                    configuration as a dictionary or an exception if any step fails.
+    """
+
+    roots = None
+    if used_keys_only:
+        roots = _used_key_paths(
+            input_file,
+            model_file and class_model,
+            template_filters_directory,
+            template_tests_directory,
+        )
+
+    template_config = None
+    match prepare_template_config(
+        variables,
         template_filters_directory,
         template_tests_directory,
+        model_file,
+        class_model,
+        cache_dir,
+        processes,
+        deep_merge,
+        enable_async,
+        roots,
     ):
+        case Success(value):
+            template_config = value
+        case Failure(value):
+            return Failure(value)
+
+    with stage("render"):
+        result = render_jinja_template(
+            input_file,
+            output,
+            template_config,
+            template_filters_directory,
+            template_tests_directory,
+            cache_dir,
+            only_if_changed=only_if_changed,
+            enable_async=enable_async,
+        )
+    if report:
+        write_report(
+            [job_report(RenderJob(input_file, output), result)], report
+        )
+    match result:
         case Failure(value):
             return Failure(ValueError(f"Failed to render template {value}"))
 
     return Success(template_config)
 
 
+# State shared with the worker processes of `render_manifest_jobs`, set in
+# the parent before the pool forks so that the workers inherit it.
+_worker_state: Dict[str, Any] = {}
+
+
+def _init_render_worker(state: Dict[str, Any]):
+    """Set up a spawned worker, which cannot inherit the parent's state."""
+    _worker_state.update(state)
+    _worker_state["filters"] = _function_registry(state["filters_directory"])
+    _worker_state["tests"] = _function_registry(state["tests_directory"])
+    _worker_state["environments"] = {}
+
+
+def _render_job_environment(job: RenderJob) -> jinja2.Environment:
+    """Return the environment of the shared state for the template of `job`."""
+    environments = _worker_state["environments"]
+    search_path = job.template.parent
+    if search_path not in environments:
+        environments[search_path] = create_jinja_environment(
+            search_path,
+            _worker_state["filters"],
+            _worker_state["tests"],
+            _worker_state["cache_dir"],
+            _worker_state["enable_async"],
+        )
+    return environments[search_path]
+
+
+def _render_job(index: int) -> Dict[str, Any]:
+    """Render the job at `index` of the shared state, see `render_manifest_jobs`."""
+    job = _worker_state["jobs"][index]
+    result = render_jinja_template(
+        job.template,
+        job.output,
+        _worker_state["config"],
+        jenv=_render_job_environment(job),
+        only_if_changed=_worker_state["only_if_changed"],
+    )
+    return job_report(job, result)
+
+
+# pylint: disable=R0913,R0917
+def render_manifest_jobs(
+    jobs: List[RenderJob],
+    config: Dict[str, Any],
+    template_filters_directory: Path = None,
+    template_tests_directory: Path = None,
+    cache_dir: Path = None,
+    processes: int = 1,
+    only_if_changed: bool = False,
+    enable_async: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Render every job of a manifest with one shared configuration.
+
+    Filters and tests are loaded once, and one Jinja2 environment is shared by all
+    the templates of the same directory. With several `processes`, the jobs are
+    rendered by a process pool: where available the pool is forked after the
+    configuration, filters and templates are prepared, so the workers share them
+    copy-on-write and only the job index is sent with each task.
+
+    Args:
+        jobs (List[RenderJob]): The template/output pairs to render.
+        config (Dict[str, Any]): The resolved configuration for rendering.
+        template_filters_directory (Path, optional): The directory containing custom
+                            Jinja2 filters. Defaults to None.
+        template_tests_directory (Path, optional): The directory containing custom
+                            Jinja2 tests. Defaults to None.
+        cache_dir (Path, optional): The directory of the persistent compiled-template
+                            cache. Defaults to None.
+        processes (int, optional): The number of worker processes. Defaults to 1,
+                            rendering in the current process.
+        only_if_changed (bool, optional): Keep the outputs that already have the
+                            rendered content untouched. Defaults to False.
+        enable_async (bool, optional): Render with async environments, awaiting
+                            coroutine filters and tests. Defaults to False.
+
+    Returns:
+        List[Dict[str, Any]]: The report of each job, in the order of `jobs`.
+    """
+    state = {
+        "jobs": jobs,
+        "config": config,
+        "filters_directory": template_filters_directory,
+        "tests_directory": template_tests_directory,
+        "cache_dir": cache_dir,
+        "only_if_changed": only_if_changed,
+        "enable_async": enable_async,
+    }
+    processes = min(processes, len(jobs))
+    fork = "fork" in multiprocessing.get_all_start_methods()
+    if processes <= 1 or fork:
+        _init_render_worker(state)
+    try:
+        if processes <= 1:
+            return [_render_job(index) for index in range(len(jobs))]
+
+        if fork:
+            # compile the templates before forking, for all workers to share;
+            # the workers report the templates failing to load
+            for job in jobs:
+                try:
+                    _render_job_environment(job).get_template(
+                        job.template.name
+                    )
+                except (OSError, jinja2.TemplateError):
+                    pass
+            context = multiprocessing.get_context("fork")
+            pool = context.Pool(processes)
+        else:
+            pool = multiprocessing.Pool(
+                processes, _init_render_worker, (state,)
+            )
+        with pool:
+            return merge_profiled(
+                pool.map(
+                    functools.partial(run_profiled, _render_job, is_active()),
+                    range(len(jobs)),
+                    chunksize=1,
+                )
+            )
+    finally:
+        _worker_state.clear()
+
+
+# pylint: disable=R0913,R0917
+def process_manifest_with_validation(
+    variables: tuple[Path],
+    template_filters_directory: Path,
+    template_tests_directory: Path,
+    manifest: Path,
+    model_file: Path = None,
+    class_model: str = None,
+    cache_dir: Path = None,
+    processes: int = 1,
+    deep_merge: bool = False,
+    enable_async: bool = False,
+    only_if_changed: bool = False,
+) -> Result[List[Dict[str, Any]], Exception]:
+    """
+    Validates merged configurations once and renders every job of a manifest.
+
+    Parameters:
+    - variables (tuple[Path]): A tuple of file paths containing configuration variables.
+    - template_filters_directory (Path): The directory containing custom template filters.
+    - template_tests_directory (Path): The directory containing custom template tests.
+    - manifest (Path): The manifest file listing template/output pairs.
+    - model_file (Path, optional): The path to a Pydantic model file. If provided,
+                    the configuration will be validated against this model.
+    - class_model (str, optional): The name of the model class within the `model_file`.
+                    Required if `model_file` is provided.
+    - cache_dir (Path, optional): The directory of the persistent compiled-template
+                    cache. Defaults to None.
+    - processes (int, optional): The number of processes rendering the jobs and
+                    parsing YAML and TOML variable files. Defaults to 1.
+    - deep_merge (bool, optional): Merge nested mappings of the variable files key
+                    by key instead of replacing them. Defaults to False.
+    - enable_async (bool, optional): Render with async Jinja2 environments, awaiting
+                    coroutine filters and tests and running those of independent
+                    config values concurrently. Defaults to False.
+    - only_if_changed (bool, optional): Keep the outputs that already have the
+                    rendered content untouched, reported as `unchanged`. Defaults
+                    to False.
+
+    Returns:
+    - Result[List[Dict[str, Any]], Exception]: The per-job reports, or an exception
+                    if the manifest or the configuration could not be prepared.
+    """
+    jobs = None
+    match load_manifest(manifest):
+        case Success(value):
+            jobs = value
+        case Failure(value):
+            return Failure(ValueError(f"Failed to load manifest: {value}"))
+
+    template_config = None
+    match prepare_template_config(
+        variables,
+        template_filters_directory,
+        template_tests_directory,
+        model_file,
+        class_model,
+        cache_dir,
+        processes,
+        deep_merge,
+        enable_async,
+    ):
+        case Success(value):
+            template_config = value
+        case Failure(value):
+            return Failure(value)
+
+    with stage("render"):
+        return Success(
+            render_manifest_jobs(
+                jobs,
+                template_config,
+                template_filters_directory,
+                template_tests_directory,
+                cache_dir,
+                processes,
+                only_if_changed,
+                enable_async,
+            )
+        )
+
+
+def _init_matrix_worker(state: Dict[str, Any]):
+    """Set up a worker rendering the combinations of a matrix."""
+    _init_render_worker(state)
+    if state["validate"]:
+        # pylint: disable=C0415
+        from masha.config_validator import load_model_class
+
+        _worker_state["model_class"] = load_model_class(
+            state["model_file"], state["class_model"], state["cache_dir"]
+        )
+
+
+def _render_combination(index: int) -> Dict[str, Any]:
+    """Resolve and render the combination at `index` of the shared state."""
+    combination = _worker_state["combinations"][index]
+    job = _worker_state["jobs"][index]
+    match resolve_template_config(
+        ConfigOverlay(_worker_state["layers"][index], _worker_state["deep"]),
+        _worker_state["filters"],
+        _worker_state["tests"],
+        _worker_state["cache_dir"],
+        _worker_state["deep"],
+        _worker_state["enable_async"],
+        _worker_state["roots"],
+    ):
+        case Success(value):
+            result = _validate_combination(value)
+        case Failure(value):
+            result = Failure(value)
+    if isinstance(result, Success):
+        if not is_stdout(job.output):
+            job.output.parent.mkdir(parents=True, exist_ok=True)
+        result = render_jinja_template(
+            job.template,
+            job.output,
+            result.unwrap(),
+            jenv=_render_job_environment(job),
+            only_if_changed=_worker_state["only_if_changed"],
+        )
+    return {"combination": combination.name, **job_report(job, result)}
+
+
+def _validate_combination(config: Dict[str, Any]) -> Result[Dict, Exception]:
+    """Validate a resolved combination against the model of the shared state."""
+    if not _worker_state["validate"]:
+        return Success(config)
+    model_class = _worker_state["model_class"]
+    if not model_class:
+        return Failure(ValueError("Failed to load the specified model class."))
+    # pylint: disable=C0415
+    from masha.config_validator import validate_config
+
+    match validate_config(config, model_class, _worker_state["cache_dir"]):
+        case Failure(value):
+            return Failure(ValueError(f"Given config is invalid {value}"))
+    return Success(config)
+
+
+# pylint: disable=R0913,R0917,R0914
+def process_matrix_with_validation(
+    variables: tuple[Path],
+    template_filters_directory: Path,
+    template_tests_directory: Path,
+    matrix: Path,
+    output: Path,
+    input_file: Path,
+    model_file: Path = None,
+    class_model: str = None,
+    cache_dir: Path = None,
+    processes: int = 1,
+    deep_merge: bool = False,
+    enable_async: bool = False,
+    only_if_changed: bool = False,
+    used_keys_only: bool = False,
+) -> Result[List[Dict[str, Any]], Exception]:
+    """
+    Resolves, validates and renders an input template for every combination of a matrix.
+
+    The base variable files and the overlay files of all the combinations are
+    parsed once, the templated values they hold and the input template are
+    compiled once, then every combination is merged from its layers, resolved,
+    validated and rendered to its own output. With several `processes`, the
+    combinations are rendered by a process pool, forked after the preparations
+    where available, like the jobs of `render_manifest_jobs`.
+
+    Parameters:
+    - variables (tuple[Path]): The base configuration files, directories or glob
+                    patterns shared by all the combinations.
+    - template_filters_directory (Path): The directory containing custom template filters.
+    - template_tests_directory (Path): The directory containing custom template tests.
+    - matrix (Path): The matrix file of the named overlay sets, see `load_matrix`.
+    - output (Path): The output path, formatted with the overlay set names of every
+                    combination, see `combination_output`.
+    - input_file (Path): The path to the input template file.
+    - model_file (Path, optional): The path to a Pydantic model file. If provided,
+                    every combination will be validated against this model.
+    - class_model (str, optional): The name of the model class within the `model_file`.
+                    Required if `model_file` is provided.
+    - cache_dir (Path, optional): The directory of the persistent compiled-template
+                    and parsed-config caches. Defaults to None.
+    - processes (int, optional): The number of processes rendering the combinations
+                    and parsing YAML and TOML variable files. Defaults to 1.
+    - deep_merge (bool, optional): Merge nested mappings of the variable files key
+                    by key instead of replacing them. Defaults to False.
+    - enable_async (bool, optional): Render with async Jinja2 environments, awaiting
+                    coroutine filters and tests and running those of independent
+                    config values concurrently. Defaults to False.
+    - only_if_changed (bool, optional): Keep the outputs that already have the
+                    rendered content untouched, reported as `unchanged`. Defaults
+                    to False.
+    - used_keys_only (bool, optional): Only resolve and render the config values
+                    the input template reads, see `process_template_with_validation`.
+                    Defaults to False.
+
+    Returns:
+    - Result[List[Dict[str, Any]], Exception]: The per-combination reports, or an
+                    exception if the matrix or the variable files could not be loaded.
+    """
+    combinations = None
+    match load_matrix(matrix):
+        case Success(value):
+            combinations = value
+        case Failure(value):
+            return Failure(ValueError(f"Failed to load matrix: {value}"))
+    try:
+        jobs = [
+            RenderJob(input_file, combination_output(combination, output))
+            for combination in combinations
+        ]
+    except (KeyError, ValueError) as e:
+        return Failure(ValueError(f"Invalid field {e} in output {output}"))
+    if len({job.output for job in jobs}) < len(jobs):
+        return Failure(
+            ValueError(
+                f"Output {output} names the same file for several combinations"
+            )
+        )
+
+    validate = bool(model_file and class_model)
+    with stage("load"):
+        base_paths = expand_config_paths(variables)
+        overlay_paths = [
+            expand_config_paths(combination.variables)
+            for combination in combinations
+        ]
+        unique_paths = dict.fromkeys(base_paths)
+        for combination_paths in overlay_paths:
+            unique_paths.update(dict.fromkeys(combination_paths))
+        paths = list(unique_paths)
+        count("files_loaded", len(paths))
+        loaded = {}
+        cache = get_config_cache(cache_dir) if cache_dir else None
+        results = load_configs(paths, cache, processes)
+        for path, result in zip(paths, results):
+            match result:
+                case Success(value):
+                    loaded[path] = value
+                case Failure(value):
+                    return Failure(
+                        ValueError(f"Failed to load config {path}: {value}")
+                    )
+
+    state = {
+        "jobs": jobs,
+        "combinations": combinations,
+        "layers": [
+            [loaded[path] for path in base_paths + combination_paths]
+            for combination_paths in overlay_paths
+        ],
+        "deep": deep_merge,
+        "roots": (
+            _used_key_paths(
+                input_file,
+                validate,
+                template_filters_directory,
+                template_tests_directory,
+            )
+            if used_keys_only
+            else None
+        ),
+        "validate": validate,
+        "model_file": model_file,
+        "class_model": class_model,
+        "filters_directory": template_filters_directory,
+        "tests_directory": template_tests_directory,
+        "cache_dir": cache_dir,
+        "only_if_changed": only_if_changed,
+        "enable_async": enable_async,
+    }
+    processes = min(processes, len(jobs))
+    fork = "fork" in multiprocessing.get_all_start_methods()
+    try:
+        if processes <= 1 or fork:
+            _init_matrix_worker(state)
+            # compiled before forking, for all the workers to share
+            compile_config_templates(
+                loaded.values(),
+                _worker_state["filters"],
+                _worker_state["tests"],
+                cache_dir,
+                enable_async,
+            )
+            try:
+                _render_job_environment(jobs[0]).get_template(input_file.name)
+            except (OSError, jinja2.TemplateError):
+                pass  # reported by every combination
+        with stage("render"):
+            if processes <= 1:
+                return Success(
+                    [_render_combination(index) for index in range(len(jobs))]
+                )
+            if fork:
+                pool = multiprocessing.get_context("fork").Pool(processes)
+            else:
+                pool = multiprocessing.Pool(
+                    processes, _init_matrix_worker, (state,)
+                )
+            with pool:
+                reports = merge_profiled(
+                    pool.map(
+                        functools.partial(
+                            run_profiled, _render_combination, is_active()
+                        ),
+                        range(len(jobs)),
+                        chunksize=1,
+                    )
+                )
+            return Success(reports)
+    finally:
+        _worker_state.clear()
+
+
+# pylint: disable=R0913,R0917
+def process_tree_with_validation(
+    variables: tuple[Path],
+    template_filters_directory: Path,
+    template_tests_directory: Path,
+    template_dir: Path,
+    output_dir: Path,
+    model_file: Path = None,
+    class_model: str = None,
+    cache_dir: Path = None,
+    processes: int = 1,
+    deep_merge: bool = False,
+    enable_async: bool = False,
+    only_if_changed: bool = False,
+) -> Result[List[Dict[str, Any]], Exception]:
+    """
+    Validates merged configurations once and renders a directory tree of templates.
+
+    Only the templates whose source, referenced templates, configuration or filters
+    changed since the previous run are rendered, see `masha.tree_renderer`.
+
+    Parameters:
+    - variables (tuple[Path]): A tuple of file paths containing configuration variables.
+    - template_filters_directory (Path): The directory containing custom template filters.
+    - template_tests_directory (Path): The directory containing custom template tests.
+    - template_dir (Path): The root directory of the templates.
+    - output_dir (Path): The directory the rendered tree is written to.
+    - model_file (Path, optional): The path to a Pydantic model file. If provided,
+                    the configuration will be validated against this model.
+    - class_model (str, optional): The name of the model class within the `model_file`.
+                    Required if `model_file` is provided.
+    - cache_dir (Path, optional): The directory of the persistent compiled-template
+                    and parsed-config caches. Defaults to None.
+    - processes (int, optional): The number of processes parsing YAML and TOML
+                    variable files. Defaults to 1.
+    - deep_merge (bool, optional): Merge nested mappings of the variable files key
+                    by key instead of replacing them. Defaults to False.
+    - enable_async (bool, optional): Render with async Jinja2 environments, awaiting
+                    coroutine filters and tests and running those of independent
+                    config values concurrently. Defaults to False.
+    - only_if_changed (bool, optional): Keep the outputs of re-rendered templates
+                    that already have the rendered content untouched, reported as
+                    `unchanged`. Defaults to False.
+
+    Returns:
+    - Result[List[Dict[str, Any]], Exception]: The per-template reports, or an
+                    exception if the configuration could not be prepared.
+    """
+    template_config = None
+    match prepare_template_config(
+        variables,
+        template_filters_directory,
+        template_tests_directory,
+        model_file,
+        class_model,
+        cache_dir,
+        processes,
+        deep_merge,
+        enable_async,
+    ):
+        case Success(value):
+            template_config = value
+        case Failure(value):
+            return Failure(value)
+
+    with stage("render"):
+        jenv = create_jinja_environment(
+            template_dir,
+            _function_registry(template_filters_directory),
+            _function_registry(template_tests_directory),
+            cache_dir,
+            enable_async,
+        )
+        reports = render_tree(
+            jenv,
+            output_dir,
+            template_config,
+            [template_filters_directory, template_tests_directory],
+            only_if_changed=only_if_changed,
+        )
+        if jenv.bytecode_cache is not None:
+            jenv.bytecode_cache.prune()
+    return Success(reports)
+
+
+def exit_with_report(result: Result[List[Dict[str, Any]], Exception], report):
+    """
+    Write the job reports of a multi-output run and exit accordingly.
+
+    Args:
+        result (Result[List[Dict[str, Any]], Exception]): The job reports, or the
+                    exception that prevented rendering any job.
+        report (str): Where to write the JSON report, "-" for stdout.
+    """
+    match result:
+        case Success(value):
+            write_report(value, report)
+            if any(job["status"] == "failure" for job in value):
+                logger.error("Some jobs failed")
+                sys.exit(1)
+            logger.info("Command run successfully")
+            sys.exit(0)
+        case Failure(value):
+            logger.error(f"Command failed with error {value}")
+            sys.exit(1)
+
+
 # pylint: disable=R0913,R0917,E1120
 @click.command()
 @click.option(
     "-v",
     "--variables",
-    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    type=click.Path(path_type=Path),
     multiple=True,
     required=True,
-    help="Path(s) to the various configuration files.",
+    help="Path(s) to the various configuration files, directories of them or glob "
+    "patterns, merged in order.",
 )
 @click.option(
     "-m",
@@ -197,14 +1066,165 @@ def process_template_with_validation(
 @click.option(
     "-o",
     "--output",
-    type=click.Path(dir_okay=False, writable=True, path_type=Path),
-    required=True,
-    help="Path to the output file where the rendered content will be written.",
+    type=click.Path(
+        dir_okay=False, writable=True, allow_dash=True, path_type=Path
+    ),
+    required=False,
+    default=None,
+    help="Path to the output file where the rendered content will be written, "
+    "'-' for stdout (logs then go to stderr). With --matrix, {dimension} and "
+    "{name} fields name the output of every combination.",
+)
+@click.option(
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Manifest of template/output pairs to render instead of INPUT_FILE.",
+)
+@click.option(
+    "--matrix",
+    type=click.Path(exists=True, dir_okay=False, path_type=Path),
+    default=None,
+    help="Matrix of named overlay sets of variable files; INPUT_FILE is "
+    "rendered for every combination of them, merged over the -v files.",
+)
+@click.option(
+    "--template-dir",
+    type=click.Path(
+        exists=True, file_okay=False, dir_okay=True, path_type=Path
+    ),
+    default=None,
+    help="Directory tree of *.j2 templates to render into --output-dir.",
+)
+@click.option(
+    "--output-dir",
+    type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+    default=None,
+    help="Directory the --template-dir tree is rendered into.",
+)
+@click.option(
+    "--report",
+    type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+    default="-",
+    show_default=True,
+    help="Where to write the JSON report of --manifest, --matrix or "
+    "--template-dir jobs, or of INPUT_FILE with --only-if-changed.",
+)
+@click.option(
+    "--used-keys-only",
+    is_flag=True,
+    default=False,
+    help="Only resolve and render the config values INPUT_FILE reads, unless it "
+    "computes template names or the config is validated.",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    default=False,
+    help="Keep running and re-render INPUT_FILE whenever one of its inputs changes.",
+)
+@click.option(
+    "--watch-interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=1.0,
+    show_default=True,
+    help="Seconds between two checks for changed inputs in --watch mode.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=0),
+    default=1,
+    show_default=True,
+    help="Number of processes rendering --manifest jobs or --matrix combinations "
+    "and parsing YAML/TOML -v files, 0 for one per CPU.",
+)
+@click.option(
+    "--template-cache-size",
+    type=click.IntRange(min=0),
+    default=DEFAULT_CACHE_SIZE,
+    show_default=True,
+    help="Maximum number of compiled config-string templates kept in memory.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False, writable=True, path_type=Path),
+    default=None,
+    help="Directory to persist compiled templates and parsed -v files in between runs.",
+)
+@click.option(
+    "--cache-max-size",
+    type=click.IntRange(min=0),
+    default=DEFAULT_MAX_CACHE_BYTES // (1024 * 1024),
+    show_default=True,
+    help="Size in MiB above which old compiled templates of --cache-dir are evicted.",
+)
+@click.option(
+    "--deep-merge",
+    is_flag=True,
+    default=False,
+    help="Merge nested mappings of the -v files key by key instead of replacing "
+    "them.",
+)
+@click.option(
+    "--only-if-changed",
+    is_flag=True,
+    default=False,
+    help="Keep outputs whose content would not change untouched, reporting them "
+    "as unchanged.",
+)
+@click.option(
+    "--enable-async",
+    is_flag=True,
+    default=False,
+    help="Render with async Jinja2 environments, running the coroutine filters and "
+    "tests of independent config values concurrently.",
+)
+@click.option(
+    "--async-concurrency",
+    type=click.IntRange(min=0),
+    default=DEFAULT_CONCURRENCY,
+    show_default=True,
+    help="Maximum number of coroutine filters and tests running at the same time "
+    "with --enable-async, 0 for no limit.",
+)
+@click.option(
+    "--profile",
+    "profile_file",
+    type=click.Path(dir_okay=False, allow_dash=True, path_type=Path),
+    help="Write the wall and CPU time, peak memory and counts of every stage of "
+    "the run to FILE as JSON, '-' for stderr.",
+)
+@click.option(
+    "--cprofile",
+    "cprofile_file",
+    type=click.Path(dir_okay=False, path_type=Path),
+    help="Dump the cProfile statistics of the run to FILE, for pstats.",
+)
+@click.option(
+    "--log-level",
+    type=click.Choice(LOG_LEVELS, case_sensitive=False),
+    default=None,
+    help="Log level, overriding the one of logging.conf (INFO).",
+)
+@click.option(
+    "-q",
+    "--quiet",
+    is_flag=True,
+    default=False,
+    help="Only log errors, same as --log-level ERROR.",
+)
+@click.option(
+    "--log-format",
+    type=click.Choice(LOG_FORMATS),
+    default="text",
+    show_default=True,
+    help="Log as text or as JSON lines, without configuration dumps.",
 )
 @click.argument(
     "input_file",
     type=click.Path(exists=True, dir_okay=False, path_type=Path),
-    required=True,
+    required=False,
     # help="Path to the input template file.",
 )
 def main(
@@ -214,11 +1234,142 @@ def main(
     template_filters_directory: Path,
     template_tests_directory: Path,
     output: Path,
+    manifest: Path,
+    matrix: Path,
+    template_dir: Path,
+    output_dir: Path,
+    report: str,
+    used_keys_only: bool,
+    watch: bool,
+    watch_interval: float,
+    jobs: int,
+    template_cache_size: int,
+    cache_dir: Path,
+    cache_max_size: int,
+    deep_merge: bool,
+    only_if_changed: bool,
+    enable_async: bool,
+    async_concurrency: int,
+    profile_file: Path,
+    cprofile_file: Path,
+    log_level: str,
+    quiet: bool,
+    log_format: str,
     input_file: Path,
 ):
     """
     Validate merged configurations against a Pydantic model and render an input template.
     """
+    # logs go to stderr whenever stdout carries the output or the JSON report
+    stdout_report = is_stdout(report) and bool(
+        manifest
+        or matrix
+        or template_dir
+        or output_dir
+        or (only_if_changed and not watch and output and not is_stdout(output))
+    )
+    configure_logging(
+        "ERROR" if quiet else log_level,
+        log_format,
+        (
+            sys.stderr
+            if (output and is_stdout(output)) or stdout_report
+            else None
+        ),
+    )
+    # written when the command exits, also through sys.exit
+    click.get_current_context().with_resource(
+        profiling(profile_file, cprofile_file)
+    )
+    set_template_cache_size(template_cache_size)
+    set_async_concurrency(async_concurrency)
+    if cache_dir:
+        get_disk_cache(cache_dir, cache_max_size * 1024 * 1024)
+    processes = jobs or os.cpu_count()
+
+    if manifest:
+        exit_with_report(
+            process_manifest_with_validation(
+                variables,
+                template_filters_directory,
+                template_tests_directory,
+                manifest,
+                model_file,
+                class_model,
+                cache_dir,
+                processes,
+                deep_merge,
+                enable_async,
+                only_if_changed,
+            ),
+            report,
+        )
+    if template_dir or output_dir:
+        if not (template_dir and output_dir):
+            raise click.UsageError(
+                "--template-dir and --output-dir must be given together."
+            )
+        exit_with_report(
+            process_tree_with_validation(
+                variables,
+                template_filters_directory,
+                template_tests_directory,
+                template_dir,
+                output_dir,
+                model_file,
+                class_model,
+                cache_dir,
+                processes,
+                deep_merge,
+                enable_async,
+                only_if_changed,
+            ),
+            report,
+        )
+
+    if input_file is None or output is None:
+        raise click.UsageError(
+            "INPUT_FILE and --output are required unless --manifest or "
+            "--template-dir is given."
+        )
+    if matrix:
+        exit_with_report(
+            process_matrix_with_validation(
+                variables,
+                template_filters_directory,
+                template_tests_directory,
+                matrix,
+                output,
+                input_file,
+                model_file,
+                class_model,
+                cache_dir,
+                processes,
+                deep_merge,
+                enable_async,
+                only_if_changed,
+                used_keys_only,
+            ),
+            report,
+        )
+    if watch:
+        session = RenderSession(
+            variables,
+            template_filters_directory,
+            template_tests_directory,
+            model_file,
+            class_model,
+            cache_dir,
+            deep_merge,
+            enable_async,
+        )
+        try:
+            watch_inputs(
+                session, input_file, output, watch_interval, only_if_changed
+            )
+        except KeyboardInterrupt:
+            logger.info("Stopped watching")
+        sys.exit(0)
     match process_template_with_validation(
         variables,
         template_filters_directory,
@@ -227,6 +1378,13 @@ def main(
         input_file,
         model_file,
         class_model,
+        cache_dir,
+        processes,
+        deep_merge,
+        enable_async,
+        only_if_changed,
+        report if only_if_changed and not is_stdout(output) else None,
+        used_keys_only,
     ):
         case Success(value):
             logger.info("Command run successfully")
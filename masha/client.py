@@ -0,0 +1,81 @@
+"""
+Thin client forwarding `masha` command lines to a running `masha-serve` daemon.
+
+The client only uses the standard library, so that it starts quickly. It sends its
+arguments, working directory and environment to the daemon listening on the Unix
+socket given by `MASHA_SOCKET` (see `default_socket_path`), prints what the daemon
+captured while rendering, the logs to stderr, and exits with the daemon's exit
+code. If no daemon is running, the command line is rendered in-process by
+`masha.cli.main`.
+"""
+
+import json
+import os
+import socket
+import sys
+import tempfile
+from typing import List
+
+
+def default_socket_path() -> str:
+    """
+    Return the path of the daemon's Unix socket.
+
+    Returns:
+        str: `$MASHA_SOCKET` if set, otherwise `masha.sock` in
+             `$XDG_RUNTIME_DIR`, or a per-user socket in the temp directory.
+    """
+    if os.environ.get("MASHA_SOCKET"):
+        return os.environ["MASHA_SOCKET"]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "masha.sock")
+    return os.path.join(tempfile.gettempdir(), f"masha-{os.getuid()}.sock")
+
+
+def send_request(argv: List[str], socket_path: str = None) -> dict:
+    """
+    Send a command line to the daemon and wait for its response.
+
+    Args:
+        argv (List[str]): The `masha` arguments, without the program name.
+        socket_path (str, optional): The daemon's socket. Defaults to
+                                     `default_socket_path()`.
+
+    Returns:
+        dict: The response with the `exit_code` and the captured `stdout` and
+              `stderr`, which holds the logs.
+
+    Raises:
+        OSError: If no daemon is listening on the socket.
+    """
+    request = {"argv": argv, "cwd": os.getcwd(), "env": dict(os.environ)}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path or default_socket_path())
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile("rb") as response:
+            return json.loads(response.readline())
+
+
+def main():
+    """
+    Forward the command line to the daemon, or render in-process without one.
+    """
+    argv = sys.argv[1:]
+    try:
+        response = send_request(argv)
+    except OSError:
+        # pylint: disable=C0415
+        from masha.cli import main as cli_main
+
+        cli_main(args=argv, prog_name="masha")
+        return
+    sys.stderr.write(response["stderr"])
+    sys.stderr.flush()
+    sys.stdout.write(response["stdout"])
+    sys.stdout.flush()
+    sys.exit(response["exit_code"])
+
+
+if __name__ == "__main__":
+    main()
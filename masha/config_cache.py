@@ -0,0 +1,150 @@
+"""
+Persistent on-disk cache of parsed configuration files.
+
+`ConfigCache` stores the parsed data of every variable file as a pickle, together
+with the size, modification time and SHA-256 hash of the file it was parsed from.
+A file whose size and modification time match its entry is loaded from the cache
+without being read. Otherwise the file is read and hashed, and only parsed again
+if the hash differs.
+
+Like git's index, the size and modification time alone are only trusted when the
+file was last modified well before its entry was written: a file changed within
+the same timestamp tick as the previous run could otherwise keep its modification
+time. Such "racy" entries are verified against the content hash.
+
+Entries are written atomically, so masha processes sharing a cache directory
+only ever see complete entries. Unreadable entries are ignored and overwritten.
+The cache directory must only be writable by trusted users, as its entries are
+unpickled.
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+# pylint: disable=W1203
+from masha.logger_factory import create_logger
+from masha.version import __version__
+
+logger = create_logger("masha")
+
+# modification times closer than this to the writing of their entry are racy
+RACY_WINDOW_NS = 2 * 10**9
+
+_VERSION_TAG = (
+    f"masha-{__version__}|py-{sys.version_info[0]}.{sys.version_info[1]}"
+)
+
+
+class ConfigCache:
+    """
+    A cache of parsed configuration files shared between masha runs.
+
+    Args:
+        directory (str): The directory holding the cache entries, created if
+                         missing.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = str(directory)
+
+    def _entry_path(self, path: Path) -> str:
+        key = hashlib.sha256(
+            f"{_VERSION_TAG}|{Path(path).resolve()}".encode("utf-8")
+        ).hexdigest()
+        return os.path.join(self.directory, f"__masha_{key}.pickle")
+
+    def _read_entry(self, entry_path: str) -> Dict[str, Any]:
+        try:
+            with open(entry_path, "rb") as f:
+                entry = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        # pylint: disable=W0718
+        except Exception as e:
+            logger.debug(f"Ignoring unreadable cache entry {entry_path}: {e}")
+            return None
+        return entry if isinstance(entry, dict) else None
+
+    def _write_entry(self, entry_path: str, entry: Dict[str, Any]):
+        tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, entry_path)
+        except (OSError, pickle.PicklingError) as e:
+            logger.debug(f"Failed to write cache entry {entry_path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def load(self, path: Path, parse: Callable[[bytes], Any]) -> Any:
+        """
+        Return the parsed data of a file, parsing it only if it changed.
+
+        Args:
+            path (Path): The configuration file.
+            parse (Callable[[bytes], Any]): Parses the content of the file.
+
+        Returns:
+            Any: The parsed data, a fresh copy on every call.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        entry_path = self._entry_path(path)
+        entry = self._read_entry(entry_path)
+        checked_ns = time.time_ns()
+        stat = os.stat(path)
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime_ns"] == stat.st_mtime_ns
+            and entry["mtime_ns"] + RACY_WINDOW_NS <= entry["checked_ns"]
+        ):
+            return entry["data"]
+
+        content = Path(path).read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry is not None and entry["sha256"] == digest:
+            data = entry["data"]
+        else:
+            logger.debug(f"Parsing changed config file {path}")
+            data = parse(content)
+        self._write_entry(
+            entry_path,
+            {
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "checked_ns": checked_ns,
+                "sha256": digest,
+                "data": data,
+            },
+        )
+        return data
+
+
+_config_caches: Dict[Path, ConfigCache] = {}
+
+
+def get_config_cache(cache_dir: str) -> ConfigCache:
+    """
+    Return the parsed-config cache stored below `cache_dir`.
+
+    Args:
+        cache_dir (str): The masha cache directory.
+
+    Returns:
+        ConfigCache: The cache of the `configs` subdirectory.
+    """
+    directory = Path(cache_dir).resolve() / "configs"
+    if directory not in _config_caches:
+        _config_caches[directory] = ConfigCache(str(directory))
+    return _config_caches[directory]
@@ -12,8 +12,12 @@ Functions:
 - `merge_configs(configs: Dict[str, Any]) -> dict`: Merges multiple dictionaries into one.
    If there are overlapping keys, the values from later dictionaries will overwrite those from
    earlier ones.
+- `expand_config_paths(paths: list[Path]) -> list[Path]`: Expands directories and glob
+   patterns into the configuration files they contain, in merge order.
+- `load_configs(config_paths: list[Path]) -> list[Result]`: Loads configuration files
+   concurrently, returning their results in the order of the paths.
 - `load_and_merge_configs(config_paths: list[Path])`: Loads and merges multiple configuration
-   files specified by their paths.
+   files specified by their paths, directories or glob patterns.
 
 CLI Entry Point:
 - `main()`: The main function that serves as the entry point for the command-line interface.
@@ -22,62 +26,75 @@ CLI Entry Point:
 """
 
 import argparse
-import configparser
+import functools
+import glob
 import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List
 
-import toml
-import yaml
 from returns.result import Failure, Result, Success
 
 # pylint: disable=W1203
-from masha.logger_factory import create_logger
+from masha.config_cache import ConfigCache
+from masha.config_overlay import ConfigOverlay, materialize
+from masha.config_parsers import get_parser, supported_suffixes
+from masha.logger_factory import create_logger, log_config
+from masha.profiler import count
 
 logger = create_logger("masha")
 
+# file types parsed by pure-Python code or holding the GIL while parsing
+PROCESS_PARSED_SUFFIXES = {".yaml", ".yml", ".toml"}
+
+MAX_LOADER_THREADS = 32
+
 
 # Function to load configuration files
-def load_config(file_path: Path) -> Result[{}, dict]:
+def load_config(
+    file_path: Path, cache: ConfigCache = None
+) -> Result[{}, dict]:
     """
     Load configuration from a file based on its extension.
 
+    The file is read in one go and parsed by the fastest available parser for its
+    type, see `masha.config_parsers`.
+
     Args:
         file_path (Path): The path to the configuration file.
+        cache (ConfigCache, optional): The parsed-config cache to load unchanged
+                                       files from. Defaults to None.
 
     Returns:
         Result: A dictionary containing the configuration data if successful,
                 or an error message if the file type is unsupported.
     """
+    return _load_config(file_path, cache)
+
+
+def _load_config(
+    file_path: Path, cache: ConfigCache = None, parse_pool: "_ParsePool" = None
+) -> Result[{}, dict]:
+    parser = get_parser(file_path.suffix)
+    if parser is None:
+        return Failure({"error": f"Unsupported file type: {file_path.suffix}"})
+    parse = parser.parse
+    if parse_pool is not None and file_path.suffix in PROCESS_PARSED_SUFFIXES:
+        parse = functools.partial(parse_pool.parse, file_path.suffix)
     try:
-        if file_path.suffix in {".yaml", ".yml"}:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return Success(yaml.safe_load(f))
-        elif file_path.suffix == ".json":
-            with open(file_path, "r", encoding="utf-8") as f:
-                return Success(json.load(f))
-        elif file_path.suffix == ".toml":
-            with open(file_path, "r", encoding="utf-8") as f:
-                return Success(toml.load(f))
-        elif file_path.suffix == ".properties":
-            config = configparser.ConfigParser()
-            config.read(file_path)
-            return Success(
-                {
-                    section: dict(config[section])
-                    for section in config.sections()
-                }
-            )
-        else:
-            return Failure(
-                {"error": f"Unsupported file type: {file_path.suffix}"}
-            )
+        if cache is not None:
+            return Success(cache.load(file_path, parse))
+        return Success(parse(file_path.read_bytes()))
     except FileNotFoundError as e:
         return Failure({"error": f"File not found: {e}"})
 
 
 # Function to merge multiple dictionaries
-def merge_configs(configs: Dict[str, Any]) -> dict:
+def merge_configs(configs: Dict[str, Any], deep: bool = False) -> dict:
     """
     Merge multiple dictionaries into one.
 
@@ -85,29 +102,167 @@ def merge_configs(configs: Dict[str, Any]) -> dict:
     configs (Dict[str, Any]): A dictionary where each key is a string representing a
                               configuration name, and the value is another dictionary
                               containing the configuration settings.
+    deep (bool, optional): Merge nested dictionaries present in several configurations
+                           key by key instead of replacing them. Defaults to False.
 
     Returns:
     dict: A single dictionary that contains all the configurations from the input
           dictionaries. If there are overlapping keys, the values from later dictionaries
           will overwrite those from earlier ones.
     """
-    merged_config = {}
-    for config in configs:
-        merged_config.update(config)
-    logger.debug(f"merged_config = {merged_config}")
+    if deep:
+        merged_config = materialize(ConfigOverlay(configs, deep=True))
+    else:
+        merged_config = {}
+        for config in configs:
+            merged_config.update(config)
+    log_config(logger, logging.DEBUG, "merged_config", merged_config)
     return merged_config
 
 
-def load_and_merge_configs(config_paths: list[Path]) -> Result[Dict, Dict]:
+def _parse_config_bytes(suffix: str, data: bytes) -> Any:
+    return get_parser(suffix).parse(data)
+
+
+class _ParsePool:
+    """Parses configuration files in worker processes, started on first use."""
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def parse(self, suffix: str, data: bytes) -> Any:
+        with self._lock:
+            if self._executor is None:
+                # forking a process running loader threads is unsafe
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context(
+                    "forkserver" if "forkserver" in methods else "spawn"
+                )
+                self._executor = ProcessPoolExecutor(
+                    self.processes, mp_context=context
+                )
+        return self._executor.submit(
+            _parse_config_bytes, suffix, data
+        ).result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+def expand_config_paths(paths: Iterable[Path]) -> List[Path]:
+    """
+    Expand directories and glob patterns into the configuration files they match.
+
+    A directory stands for all the files of a supported type below it, a glob
+    pattern (`*`, `?`, `[...]`, `**` for any subdirectories) for the files it
+    matches. Both are sorted by path, which is their merge order. A pattern matching
+    nothing is kept as is, so that loading it reports the missing file.
+
+    Args:
+        paths (Iterable[Path]): Configuration files, directories and glob patterns.
+
+    Returns:
+        List[Path]: The configuration files, in merge order.
+    """
+    suffixes = set(supported_suffixes())
+    expanded = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            expanded.extend(
+                sorted(
+                    file
+                    for file in path.rglob("*")
+                    if file.suffix in suffixes and file.is_file()
+                )
+            )
+        elif glob.has_magic(str(path)):
+            matches = sorted(
+                Path(file)
+                for file in glob.glob(str(path), recursive=True)
+                if os.path.isfile(file)
+            )
+            expanded.extend(matches or [path])
+        else:
+            expanded.append(path)
+    return expanded
+
+
+def load_configs(
+    config_paths: list[Path], cache: ConfigCache = None, processes: int = 1
+) -> List[Result[{}, dict]]:
+    """
+    Load configuration files concurrently.
+
+    Files are read, and looked up in the cache, on a pool of threads. With more
+    than one process, the YAML and TOML files are also parsed on a pool of that
+    many worker processes.
+
+    Args:
+        config_paths (list[Path]): The configuration files.
+        cache (ConfigCache, optional): The parsed-config cache to load unchanged
+                                       files from. Defaults to None.
+        processes (int, optional): Number of processes parsing YAML and TOML files.
+                                   Defaults to 1, parsing in this process.
+
+    Returns:
+        List[Result[{}, dict]]: The results of `load_config`, in the order of
+                                `config_paths`.
+    """
+    config_paths = list(config_paths)
+    if len(config_paths) < 2:
+        return [
+            load_config(config_path, cache) for config_path in config_paths
+        ]
+    parse_pool = _ParsePool(processes) if processes > 1 else None
+    try:
+        with ThreadPoolExecutor(
+            min(MAX_LOADER_THREADS, len(config_paths))
+        ) as executor:
+            return list(
+                executor.map(
+                    lambda config_path: _load_config(
+                        config_path, cache, parse_pool
+                    ),
+                    config_paths,
+                )
+            )
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
+
+
+# pylint: disable=R0913,R0917
+def load_and_merge_configs(
+    config_paths: list[Path],
+    cache: ConfigCache = None,
+    processes: int = 1,
+    deep: bool = False,
+    overlay: bool = False,
+) -> Result[Dict, Dict]:
     """
     Load and merge multiple configuration files.
 
-    This function takes a list of file paths to configuration files, loads each one,
-    and merges them into a single dictionary. If any file fails to load or merge,
-    the function returns an error message.
+    This function takes a list of file paths to configuration files, loads them
+    concurrently, and merges them into a single dictionary in the order of the
+    paths. Directories and glob patterns stand for the files they contain, see
+    `expand_config_paths`. If any file fails to load or merge, the function returns
+    an error message.
 
     Args:
         config_paths (list[Path]): A list of file paths to the configuration files.
+        cache (ConfigCache, optional): The parsed-config cache to load unchanged
+                                       files from. Defaults to None.
+        processes (int, optional): Number of processes parsing YAML and TOML files.
+                                   Defaults to 1.
+        deep (bool, optional): Merge nested dictionaries key by key, see
+                               `merge_configs`. Defaults to False.
+        overlay (bool, optional): Return a `ConfigOverlay` over the loaded files
+                                  instead of copying them into a new dictionary.
+                                  Defaults to False.
 
     Returns:
         Result[dict, str]: A `Success` containing the merged configuration dictionary
@@ -118,17 +273,23 @@ def load_and_merge_configs(config_paths: list[Path]) -> Result[Dict, Dict]:
     Raises:
         ValueError: If any of the provided file paths are not valid or do not exist.
     """
+    config_paths = expand_config_paths(config_paths)
+    logger.debug(f"Loading files: {config_paths}")
+    count("files_loaded", len(config_paths))
     configs = []
-    for config_path in config_paths:
-        logger.debug(f"Loading file: {config_path}")
-        match load_config(config_path):
+    for config_path, result in zip(
+        config_paths, load_configs(config_paths, cache, processes)
+    ):
+        match result:
             case Success(config_data):
                 configs.append(config_data)
             case Failure(value):
                 msg = f"Error processing file {config_path}: {value}"
                 logger.warning(msg)
                 return Failure({"error": msg})
-    merged_config = merge_configs(configs)
+    if overlay:
+        return Success(ConfigOverlay(configs, deep))
+    merged_config = merge_configs(configs, deep)
     return Success(merged_config)
 
 
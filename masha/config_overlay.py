@@ -0,0 +1,173 @@
+"""
+Copy-free merged view of layered configurations.
+
+A `ConfigOverlay` presents the merge of several configuration layers, later layers
+taking precedence, without copying any of them. Like `merge_configs`, a key of a
+later layer replaces the value of earlier layers as a whole by default; a deep
+overlay instead merges nested mappings present in several layers key by key,
+presenting them as nested overlays.
+
+Writes and deletions of the keys of an overlay go to a private layer on top,
+leaving the layers as they are. Nested mappings are returned as they are, or as
+nested overlays when merged from several layers, so writing into a nested dict
+modifies the layer holding it. The pipeline stages resolving environment
+variables and templated values therefore copy the containers on the paths to
+the values they change (see `shallow_copy`), sharing everything else with the
+layers, and `materialize` turns the overlay into plain dicts before any template
+is rendered with it.
+"""
+
+from collections.abc import Mapping, MutableMapping
+from typing import Any, Dict, Iterator, Sequence
+
+
+class _Deleted:
+    """Marks a deleted key, pickled by reference to remain a singleton."""
+
+    def __reduce__(self):
+        return "_DELETED"
+
+
+_DELETED = _Deleted()
+
+
+class ConfigOverlay(MutableMapping):
+    """
+    A read-through mapping over configuration layers, the last one winning.
+
+    Args:
+        layers (Sequence[Mapping]): The layers, from lowest to highest precedence.
+        deep (bool, optional): Merge nested mappings of several layers key by key
+                               instead of letting the last one replace the others.
+                               Defaults to False.
+    """
+
+    __slots__ = ("_layers", "_deep", "_writes", "_children")
+
+    def __init__(self, layers: Sequence[Mapping], deep: bool = False):
+        self._layers = tuple(layers)
+        self._deep = deep
+        self._writes: Dict[Any, Any] = {}
+        self._children: Dict[Any, "ConfigOverlay"] = {}
+
+    def __getitem__(self, key):
+        value = self._writes.get(key, self)
+        if value is not self:
+            if value is _DELETED:
+                raise KeyError(key)
+            return value
+        if key in self._children:
+            return self._children[key]
+        if not self._deep:
+            for layer in reversed(self._layers):
+                if key in layer:
+                    return layer[key]
+            raise KeyError(key)
+
+        mappings = []
+        for layer in reversed(self._layers):
+            if key not in layer:
+                continue
+            value = layer[key]
+            if not isinstance(value, (dict, Mapping)):
+                if not mappings:
+                    return value
+                break
+            mappings.append(value)
+        if not mappings:
+            raise KeyError(key)
+        if len(mappings) == 1:
+            return mappings[0]
+        child = ConfigOverlay(reversed(mappings), deep=True)
+        self._children[key] = child
+        return child
+
+    def __setitem__(self, key, value):
+        self._children.pop(key, None)
+        self._writes[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._children.pop(key, None)
+        self._writes[key] = _DELETED
+
+    def __contains__(self, key) -> bool:
+        value = self._writes.get(key, self)
+        if value is not self:
+            return value is not _DELETED
+        return any(key in layer for layer in self._layers)
+
+    def __iter__(self) -> Iterator:
+        # keys in order of first appearance, as with repeated dict.update
+        seen = set()
+        for layer in self._layers + (self._writes,):
+            for key in layer:
+                if key not in seen:
+                    seen.add(key)
+                    if self._writes.get(key) is not _DELETED:
+                        yield key
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"ConfigOverlay({materialize(self)!r})"
+
+    def copy(self) -> "ConfigOverlay":
+        """
+        Return an overlay over the same layers with a copy of the written values.
+
+        Returns:
+            ConfigOverlay: The copy, whose writes do not affect this overlay.
+        """
+        # pylint: disable=W0212
+        copy = ConfigOverlay(self._layers, self._deep)
+        copy._writes.update(self._writes)
+        for key, child in self._children.items():
+            copy._children[key] = child.copy()
+        return copy
+
+
+MAPPING_TYPES = (dict, ConfigOverlay)
+
+
+def shallow_copy(mapping: Mapping) -> MutableMapping:
+    """
+    Copy a configuration mapping so that its values can be replaced.
+
+    Args:
+        mapping (Mapping): A dict or `ConfigOverlay`.
+
+    Returns:
+        MutableMapping: A dict, or an overlay over the same layers, sharing all
+                        values with `mapping`.
+    """
+    if isinstance(mapping, ConfigOverlay):
+        return mapping.copy()
+    return dict(mapping)
+
+
+def materialize(value: Any) -> Any:
+    """
+    Turn overlays into plain dicts, sharing all other values.
+
+    Dicts are only copied if they contain overlays.
+
+    Args:
+        value (Any): A configuration value.
+
+    Returns:
+        Any: `value` with every `ConfigOverlay` in it replaced by a dict.
+    """
+    if isinstance(value, ConfigOverlay):
+        return {key: materialize(item) for key, item in value.items()}
+    if isinstance(value, dict):
+        changed = {}
+        for key, item in value.items():
+            materialized = materialize(item)
+            if materialized is not item:
+                changed[key] = materialized
+        if changed:
+            return {**value, **changed}
+    return value
@@ -0,0 +1,175 @@
+"""
+Registry of the parsers turning the bytes of a configuration file into data.
+
+Each file suffix has a list of candidate parser backends, fastest first. The
+first backend whose module can be imported is used, so libyaml's `CSafeLoader`,
+the standard library `tomllib` and `orjson` are picked up when available while
+the pure-Python parsers remain as fallbacks. All backends of a suffix produce
+the same data for the same file; only their speed differs.
+
+Backend modules are imported when a file of their type is first parsed.
+"""
+
+import configparser
+import json
+from typing import Any, Callable, Dict, List, NamedTuple
+
+ParseFunction = Callable[[bytes], Any]
+
+
+class ParserBackend(NamedTuple):
+    """A named implementation parsing the bytes of a configuration file."""
+
+    name: str
+    parse: ParseFunction
+
+
+# suffix -> [(backend name, factory returning the parse function)], fastest first
+_candidates: Dict[str, List[tuple]] = {}
+_selected: Dict[str, ParserBackend] = {}
+
+
+def register_parser(
+    suffixes: List[str],
+    name: str,
+    factory: Callable[[], ParseFunction],
+    fallback: bool = False,
+):
+    """
+    Register a parser backend for configuration files with the given suffixes.
+
+    Args:
+        suffixes (List[str]): The file suffixes, e.g. [".yaml", ".yml"].
+        name (str): The name of the backend.
+        factory (Callable[[], ParseFunction]): Imports the backend and returns its
+                            parse function. It raises ImportError if the backend
+                            is unavailable.
+        fallback (bool, optional): Try the backend after the already registered
+                            ones instead of before them. Defaults to False.
+    """
+    for suffix in suffixes:
+        candidates = _candidates.setdefault(suffix, [])
+        if fallback:
+            candidates.append((name, factory))
+        else:
+            candidates.insert(0, (name, factory))
+        _selected.pop(suffix, None)
+
+
+def supported_suffixes() -> List[str]:
+    """
+    Return the file suffixes with registered parser backends.
+
+    Returns:
+        List[str]: The suffixes, e.g. ".yaml".
+    """
+    return sorted(_candidates)
+
+
+def available_parsers(suffix: str) -> List[ParserBackend]:
+    """
+    Return all the importable backends for a suffix, fastest first.
+
+    Args:
+        suffix (str): The file suffix.
+
+    Returns:
+        List[ParserBackend]: The available backends.
+    """
+    backends = []
+    for name, factory in _candidates.get(suffix, ()):
+        try:
+            backends.append(ParserBackend(name, factory()))
+        except ImportError:
+            continue
+    return backends
+
+
+def get_parser(suffix: str) -> ParserBackend:
+    """
+    Return the fastest available backend for a suffix.
+
+    Args:
+        suffix (str): The file suffix.
+
+    Returns:
+        ParserBackend: The backend, None if the suffix is not supported.
+    """
+    if suffix not in _selected:
+        for name, factory in _candidates.get(suffix, ()):
+            try:
+                _selected[suffix] = ParserBackend(name, factory())
+                break
+            except ImportError:
+                continue
+        else:
+            return None
+    return _selected[suffix]
+
+
+# pylint: disable=C0415
+def _yaml_parser(loader_name: str) -> Callable[[], ParseFunction]:
+    def factory():
+        import yaml
+
+        loader = getattr(yaml, loader_name, None)
+        if loader is None:
+            raise ImportError(f"yaml.{loader_name} is not available")
+
+        def parse(data: bytes) -> Any:
+            return yaml.load(
+                data, Loader=loader
+            )  # nosec B506, safe loaders only
+
+        return parse
+
+    return factory
+
+
+def _orjson_parser() -> ParseFunction:
+    import orjson
+
+    def parse(data: bytes) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than json, e.g. about NaN and big integers
+            return json.loads(data)
+
+    return parse
+
+
+def _json_parser() -> ParseFunction:
+    return json.loads
+
+
+def _tomllib_parser() -> ParseFunction:
+    import tomllib
+
+    return lambda data: tomllib.loads(data.decode("utf-8"))
+
+
+def _toml_parser() -> ParseFunction:
+    import toml
+
+    return lambda data: toml.loads(data.decode("utf-8"))
+
+
+def _properties_parser() -> ParseFunction:
+    def parse(data: bytes) -> Any:
+        config = configparser.ConfigParser()
+        config.read_string(data.decode("utf-8"))
+        return {
+            section: dict(config[section]) for section in config.sections()
+        }
+
+    return parse
+
+
+register_parser([".yaml", ".yml"], "yaml", _yaml_parser("SafeLoader"))
+register_parser([".yaml", ".yml"], "libyaml", _yaml_parser("CSafeLoader"))
+register_parser([".json"], "json", _json_parser)
+register_parser([".json"], "orjson", _orjson_parser)
+register_parser([".toml"], "toml", _toml_parser)
+register_parser([".toml"], "tomllib", _tomllib_parser)
+register_parser([".properties"], "configparser", _properties_parser)
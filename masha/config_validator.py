@@ -1,10 +1,30 @@
 #!/usr/bin/env python3
 """
 Validate the configuration against pydantic Model class
+
+Model classes are kept per process, keyed by the hash of their file, and with a
+cache directory their compiled code is kept between runs. The fingerprints of the
+configurations found valid are remembered too, per process and in the cache
+directory, so that validating the same configuration again is skipped; only the
+newest `MAX_VALID_FINGERPRINTS` of them are kept.
+`validate_configs` validates many configurations in one call, optionally on a
+pool of worker processes.
 """
 
 import argparse
+import ast
+import hashlib
+import logging
+import marshal
+import multiprocessing
+import os
+import pickle
+import sys
+import threading
+import weakref
+from itertools import islice
 from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from pydantic import BaseModel, ValidationError
 from returns.result import Failure, Result, Success
@@ -12,50 +32,334 @@ from returns.result import Failure, Result, Success
 # pylint: disable=W1203
 from masha.config_loader import load_and_merge_configs
 from masha.env_loader import resolve_env_variables
-from masha.logger_factory import create_logger
+from masha.logger_factory import create_logger, log_config
+from masha.profiler import count
 from masha.template_renderer import render_templates_with_filters
 
 logger = create_logger("masha")
 
 
+# sha256 of the model source and the class name -> loaded model class
+_model_classes: Dict[Tuple[str, str], type] = {}
+# model class -> (model file, class name, key of the source and class name)
+_model_sources: "weakref.WeakKeyDictionary[type, Tuple[Path, str, str]]" = (
+    weakref.WeakKeyDictionary()
+)
+# the number of fingerprints of valid configs kept per model class
+MAX_VALID_FINGERPRINTS = 10000
+
+# model class -> fingerprints of the configs known to be valid, oldest first
+_valid_fingerprints: "weakref.WeakKeyDictionary[type, Dict[str, None]]" = (
+    weakref.WeakKeyDictionary()
+)
+# cache directories whose known valid fingerprints were read, per model class
+_loaded_fingerprints: "weakref.WeakKeyDictionary[type, Set[str]]" = (
+    weakref.WeakKeyDictionary()
+)
+_lock = threading.RLock()
+
+
+def config_fingerprint(config_data: dict) -> Optional[str]:
+    """
+    Return a hash of the content of a configuration.
+
+    The hash is taken over the pickled configuration, which keeps the types of
+    the values and keys apart, e.g. a date from its ISO string or ``1`` from
+    ``"1"``, so that configurations differing only in types never share a
+    fingerprint. Equal configurations with keys in another order may get
+    different fingerprints, which only costs a validation.
+
+    Args:
+        config_data (dict): The configuration.
+
+    Returns:
+        Optional[str]: The SHA-256 hash of the pickled configuration, None if it
+                       cannot be pickled.
+    """
+    try:
+        data = pickle.dumps(config_data, protocol=pickle.HIGHEST_PROTOCOL)
+    # pylint: disable=W0718
+    except Exception:
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+
+def _imports_digest(source: bytes) -> str:
+    """
+    Hash the modules a model source imports, as loaded in this process.
+
+    Only the modules imported by the model file itself are hashed, by the
+    content of their file and their version, not the modules those import.
+    """
+    names = set()
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif (
+            isinstance(node, ast.ImportFrom) and node.module and not node.level
+        ):
+            names.add(node.module)
+    digest = hashlib.sha256()
+    for name in sorted(names):
+        module = sys.modules.get(name)
+        digest.update(f"{name}|{getattr(module, '__version__', '')}|".encode())
+        path = getattr(module, "__file__", None)
+        if path:
+            try:
+                digest.update(Path(path).read_bytes())
+            except OSError:
+                pass
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _fingerprints_file(cache_dir: str, model_class: type) -> Optional[str]:
+    source = _model_sources.get(model_class)
+    if source is None or not cache_dir:
+        return None
+    return os.path.join(cache_dir, f"__masha_valid_{source[2]}.txt")
+
+
+def _known_valid(model_class: type, cache_dir: str = None) -> Dict[str, None]:
+    """Return the fingerprints known valid, reading those of `cache_dir` once."""
+    with _lock:
+        known = _valid_fingerprints.setdefault(model_class, {})
+        loaded = _loaded_fingerprints.setdefault(model_class, set())
+        path = _fingerprints_file(cache_dir, model_class)
+        if path is not None and path not in loaded:
+            loaded.add(path)
+            try:
+                _remember(known, _read_fingerprints(path))
+            except OSError:
+                pass
+        return known
+
+
+def _remember(known: Dict[str, None], fingerprints: Iterable[str]):
+    """Add fingerprints as the newest, dropping the oldest beyond the limit."""
+    for fingerprint in fingerprints:
+        known.pop(fingerprint, None)
+        known[fingerprint] = None
+    excess = len(known) - MAX_VALID_FINGERPRINTS
+    for stale in list(islice(known, max(excess, 0))):
+        del known[stale]
+
+
+def _read_fingerprints(path: str) -> List[str]:
+    with open(path, "r", encoding="ascii") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _add_valid(model_class: type, fingerprints: List[str], cache_dir: str):
+    """Remember valid fingerprints, storing them in the file of `cache_dir`."""
+    fingerprints = [f for f in fingerprints if f is not None]
+    if not fingerprints:
+        return
+    with _lock:
+        _remember(_known_valid(model_class, cache_dir), fingerprints)
+    path = _fingerprints_file(cache_dir, model_class)
+    if path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            _store_fingerprints(path, fingerprints)
+        except OSError as e:
+            logger.debug(f"Failed to store valid config fingerprints: {e}")
+
+
+def _store_fingerprints(path: str, fingerprints: List[str]):
+    """
+    Atomically rewrite the file, adding fingerprints to those already stored.
+
+    A concurrent run rewriting the file may drop the fingerprints of the other,
+    which only costs validating their configurations again.
+    """
+    stored: Dict[str, None] = {}
+    try:
+        _remember(stored, _read_fingerprints(path))
+    except FileNotFoundError:
+        pass
+    _remember(stored, fingerprints)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="ascii") as f:
+            f.write("".join(f"{fp}\n" for fp in stored))
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _validate(config_data: dict, model_class: type) -> Result[str, str]:
+    try:
+        model_class.model_validate(config_data)
+        # the JSON log format replaces the whole config by its label
+        log_config(logger, logging.DEBUG, "validated_config", config_data)
+        return Success(f"Validation successful: {model_class.__name__}")
+    except ValidationError as e:
+        msg = f"Validation failed with errors: {e}"
+        logger.warning(msg)
+        return Failure(msg)
+
+
 # Main validation function
 def validate_config(
-    config_data: dict, model_class: BaseModel
+    config_data: dict, model_class: BaseModel, cache_dir: str = None
 ) -> Result[str, str]:
     """
     Validate the configuration data against the provided Pydantic model class.
 
+    A configuration with the same content as one already found valid against the
+    same model class is not validated again.
+
     Parameters:
     config_data (dict): A dictionary containing the configuration data to be validated.
     model_class (BaseModel): The Pydantic model class that defines the expected structure of
     the configuration data.
+    cache_dir (str, optional): The directory remembering the valid configurations
+    between runs, for model classes loaded by `load_model_class`. Defaults to None.
 
     Returns:
-    None
+    Result[str, str]: A success message, or the validation errors.
+    """
+    return validate_configs([config_data], model_class, cache_dir=cache_dir)[0]
 
-    Raises:
-    ValidationError: If the configuration data does not match the expected structure defined
-    by `model_class`.
+
+# State of the worker processes of `validate_configs`, set in the parent before
+# the pool forks so that the workers inherit it.
+_worker_model: Dict[str, Any] = {}
+
+
+def _init_validation_worker(model_file: Path, model_class_name: str):
+    """Load the model class in a spawned worker."""
+    _worker_model["class"] = load_model_class(model_file, model_class_name)
+
+
+def _validate_in_worker(config_data: dict) -> Tuple[bool, str]:
+    # results are returned as plain tuples
+    match _validate(config_data, _worker_model["class"]):
+        case Success(value):
+            return True, value
+        case Failure(value):
+            return False, value
+
+
+def validate_configs(
+    configs: Iterable[dict],
+    model_class: BaseModel,
+    processes: int = 1,
+    cache_dir: str = None,
+) -> List[Result[str, str]]:
     """
+    Validate many configurations against one Pydantic model class.
+
+    Configurations with the same content as one already found valid against the
+    model class are not validated again. With more than one process, the others
+    are validated on a pool of worker processes, if the model class was loaded by
+    `load_model_class`.
+
+    Args:
+        configs (Iterable[dict]): The configurations to validate.
+        model_class (BaseModel): The Pydantic model class.
+        processes (int, optional): The number of worker processes. Defaults to 1.
+        cache_dir (str, optional): The directory remembering the valid
+                            configurations between runs, for model classes loaded by
+                            `load_model_class`. Defaults to None.
+
+    Returns:
+        List[Result[str, str]]: The result of every configuration, in order.
+    """
+    configs = list(configs)
+    fingerprints = [config_fingerprint(config) for config in configs]
+    known = _known_valid(model_class, cache_dir)
+    pending = [
+        index
+        for index, fingerprint in enumerate(fingerprints)
+        if fingerprint is None or fingerprint not in known
+    ]
+    logger.debug(
+        f"Validating {len(pending)} of {len(configs)} configs, "
+        f"the others are known to be valid"
+    )
+    count("configs_validated", len(pending))
+    count("configs_known_valid", len(configs) - len(pending))
+    success = Success(f"Validation successful: {model_class.__name__}")
+    results = [success] * len(configs)
+
+    source = _model_sources.get(model_class)
+    processes = min(processes, len(pending))
+    if processes > 1 and source is not None:
+        if "fork" in multiprocessing.get_all_start_methods():
+            _worker_model["class"] = model_class
+            pool = multiprocessing.get_context("fork").Pool(processes)
+        else:
+            pool = multiprocessing.Pool(
+                processes, _init_validation_worker, source[:2]
+            )
+        try:
+            with pool:
+                outcomes = pool.map(
+                    _validate_in_worker,
+                    [configs[index] for index in pending],
+                    chunksize=max(1, len(pending) // (4 * processes)),
+                )
+        finally:
+            _worker_model.clear()
+        for index, (valid, message) in zip(pending, outcomes):
+            results[index] = Success(message) if valid else Failure(message)
+    else:
+        for index in pending:
+            results[index] = _validate(configs[index], model_class)
+
+    _add_valid(
+        model_class,
+        [
+            fingerprints[index]
+            for index in pending
+            if isinstance(results[index], Success)
+        ],
+        cache_dir,
+    )
+    return results
+
+
+def _compile_model(source: bytes, path: Path, digest: str, cache_dir: str):
+    """Compile the model source, reusing the code compiled by earlier runs."""
+    if not cache_dir:
+        return compile(source, str(path), "exec")
+    tag = f"py-{sys.version_info[0]}.{sys.version_info[1]}"
+    code_path = os.path.join(cache_dir, f"__masha_model_{digest}_{tag}.code")
     try:
-        model_instance = model_class(**config_data)
-        msg = f"Validation successful: {model_instance}"
-        logger.debug(msg)
-        return Success(msg)
-    except ValidationError as e:
-        msg = f"Validation failed with errors: {e}"
-        logger.warning(msg)
-        return Failure(msg)
+        with open(code_path, "rb") as f:
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    code = compile(source, str(path), "exec")
+    tmp_path = f"{code_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            marshal.dump(code, f)
+        os.replace(tmp_path, code_path)
+    except OSError as e:
+        logger.debug(f"Failed to store the compiled model: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return code
 
 
 # pylint: disable=W0122,W0718
-def load_model_class(model_file_path: Path, model_class_name: str):
+def load_model_class(
+    model_file_path: Path, model_class_name: str, cache_dir: str = None
+):
     """
     Load a model class from a specified file path.
 
     Args:
         model_file_path (Path): The path to the file containing the model class.
         model_class_name (str): The name of the model class to load.
+        cache_dir (str, optional): The directory keeping the compiled model file
+            between runs. Defaults to None.
 
     Returns:
         Optional[Type]: The loaded model class if successful, otherwise None.
@@ -70,6 +374,12 @@ def load_model_class(model_file_path: Path, model_class_name: str):
         - If the retrieved class is not a subclass of `BaseModel`, a `TypeError` is raised.
         - Any exceptions encountered during the execution or retrieval process are logged as
             warnings.
+        - The class is kept per process, keyed by the SHA-256 hash of the file, so
+            loading an unchanged file again does not execute it. Like any Python
+            import, the modules it imports are not reloaded when they change.
+        - The configurations found valid are remembered in `cache_dir` per
+            hash of the file, class name and hash of the modules the file
+            imports directly; modules imported only by those are not hashed.
 
     Example:
         >>> model_file_path = Path("path/to/model.py")
@@ -79,14 +389,34 @@ def load_model_class(model_file_path: Path, model_class_name: str):
         ...     print(f"Model class {model_class_name} loaded successfully.")
     """
     try:
-        model_globals = {}
-        exec(model_file_path.read_text(), model_globals)
-        model_class = model_globals[model_class_name]
-        if not issubclass(model_class, BaseModel):
-            raise TypeError(
-                f"{model_class_name} is not a subclass of Pydantic BaseModel."
+        source = Path(model_file_path).read_bytes()
+        digest = hashlib.sha256(source).hexdigest()
+        with _lock:
+            model_class = _model_classes.get((digest, model_class_name))
+            if model_class is not None:
+                return model_class
+            model_globals = {}
+            exec(
+                _compile_model(source, model_file_path, digest, cache_dir),
+                model_globals,
+            )
+            model_class = model_globals[model_class_name]
+            if not issubclass(model_class, BaseModel):
+                raise TypeError(
+                    f"{model_class_name} is not a subclass of Pydantic BaseModel."
+                )
+            _model_classes[(digest, model_class_name)] = model_class
+            # the valid fingerprints of cache_dir are kept per source, class
+            # name and imported modules
+            imports = _imports_digest(source)
+            _model_sources[model_class] = (
+                Path(model_file_path),
+                model_class_name,
+                hashlib.sha256(
+                    f"{digest}|{model_class_name}|{imports}".encode("utf-8")
+                ).hexdigest(),
             )
-        return model_class
+            return model_class
     except Exception as e:
         logger.warning(f"Failed to load the model class: {e}")
         return None
@@ -2,27 +2,318 @@
 
 """
 Loads the environment variable in configuration value
+
+Placeholders ``${ENV_VAR: default_value}`` may appear anywhere inside a string
+value and nest, e.g. ``${APP_URL:https://${APP_HOST:localhost}/}``. Every string is
+compiled once, in a single scan, into its literal text and placeholders, and a
+`PlaceholderIndex` records the key paths of the values containing placeholders,
+so resolving the configuration again, against another environment, only visits
+those values.
 """
 
 import json
 import os
 import re
+from functools import lru_cache
 from pathlib import Path
+from typing import Any, List, Mapping, Optional, Set, Tuple, Union
 
 from returns.result import Failure, Success
 
 # pylint: disable=W1203
 from masha.config_loader import load_and_merge_configs
+from masha.config_overlay import MAPPING_TYPES, shallow_copy
 from masha.logger_factory import create_logger
+from masha.profiler import count
 
 logger = create_logger("masha")
 
-_path_matcher = re.compile(
-    r"\$\{(?P<env_name>[^}^{:]+)(?::(?P<default_value>[^}^{]*))?\}"
-)
+KeyPath = Tuple[Any, ...]
+
+# placeholder delimiters and the text between them, in one pass
+_TOKENS = re.compile(r"\$\{|[:}]|[^$:}]+|\$")
+_NAME = re.compile(r"\w+")
+# default value standing for None
+_NULL = "null"
 
 
-def resolve_env_variables(config) -> dict:
+class Placeholder:
+    """
+    A compiled ``${NAME: default}`` placeholder.
+
+    Args:
+        name (Tuple): The parts of the variable name, literal strings or nested
+                      placeholders.
+        default (Optional[Tuple]): The parts of the default value, None for the
+                      ``null`` default.
+    """
+
+    __slots__ = ("name", "default")
+
+    def __init__(self, name: tuple, default: Optional[tuple]):
+        self.name = name
+        self.default = default
+
+    def resolve(self, environ: Mapping[str, str], looked_up: Set[str] = None):
+        """
+        Return the value of the variable in `environ`, or the default value.
+
+        Args:
+            environ (Mapping[str, str]): The environment variables.
+            looked_up (Set[str], optional): Collects the names of the variables
+                      looked up. Defaults to None.
+
+        Returns:
+            Optional[str]: The value, None if unset with a ``null`` default.
+        """
+        name = _join(self.name, environ, looked_up)
+        if looked_up is not None:
+            looked_up.add(name)
+        value = environ.get(name)
+        if value is not None:
+            return value
+        if self.default is None:
+            return None
+        return _evaluate(self.default, environ, looked_up)
+
+    def __repr__(self):
+        return f"Placeholder({self.name!r}, {self.default!r})"
+
+
+Part = Union[str, Placeholder]
+
+
+def _join(parts: tuple, environ, looked_up) -> str:
+    return "".join(
+        (
+            part
+            if isinstance(part, str)
+            else (part.resolve(environ, looked_up) or "")
+        )
+        for part in parts
+    )
+
+
+def _evaluate(parts: tuple, environ, looked_up):
+    # a lone placeholder keeps its value, which may be None
+    if len(parts) == 1 and isinstance(parts[0], Placeholder):
+        return parts[0].resolve(environ, looked_up)
+    return _join(parts, environ, looked_up)
+
+
+def _append(parts: List[Part], part: Part):
+    if isinstance(part, str) and parts and isinstance(parts[-1], str):
+        parts[-1] += part
+    elif part != "":
+        parts.append(part)
+
+
+class _Frame:
+    __slots__ = ("name", "default")
+
+    def __init__(self):
+        self.name: List[Part] = []
+        self.default: Optional[List[Part]] = None
+
+    def parts(self) -> List[Part]:
+        """The parts currently scanned."""
+        return self.name if self.default is None else self.default
+
+    def close(self) -> Optional[Placeholder]:
+        """Return the placeholder, or None if not a valid one."""
+        if self.default is None or not self.name:
+            return None
+        if not all(
+            isinstance(part, Placeholder) or _NAME.fullmatch(part)
+            for part in self.name
+        ):
+            return None
+        default = self.default
+        if default and isinstance(default[0], str):
+            default[0] = default[0].lstrip()
+            if not default[0]:
+                del default[0]
+        if default == [_NULL]:
+            return Placeholder(tuple(self.name), None)
+        return Placeholder(tuple(self.name), tuple(default))
+
+    def unwrap(self, parts: List[Part], closed: bool):
+        """Append the scanned text to `parts` as literal text."""
+        _append(parts, "${")
+        for part in self.name:
+            _append(parts, part)
+        if self.default is not None:
+            _append(parts, ":")
+            for part in self.default:
+                _append(parts, part)
+        if closed:
+            _append(parts, "}")
+
+
+@lru_cache(maxsize=65536)
+def compile_interpolation(text: str) -> Optional[Tuple[Part, ...]]:
+    """
+    Split a string into its literal text and placeholders, in a single scan.
+
+    Text looking like a placeholder without being one, e.g. ``${VAR}`` without
+    a default value or with a name of other characters than letters, digits and
+    underscores, stays literal. Compiled strings are cached.
+
+    Args:
+        text (str): The string value.
+
+    Returns:
+        Optional[Tuple[Part, ...]]: The literal strings and `Placeholder`s making up
+                      `text`, None if it has no placeholder.
+    """
+    if "${" not in text:
+        return None
+    root: List[Part] = []
+    stack: List[_Frame] = []
+    for token in _TOKENS.findall(text):
+        parts = stack[-1].parts() if stack else root
+        if token == "${":
+            stack.append(_Frame())
+        elif token == ":" and stack and stack[-1].default is None:
+            stack[-1].default = []
+        elif token == "}" and stack:
+            frame = stack.pop()
+            parts = stack[-1].parts() if stack else root
+            placeholder = frame.close()
+            if placeholder is None:
+                frame.unwrap(parts, closed=True)
+            else:
+                parts.append(placeholder)
+        else:
+            _append(parts, token)
+    while stack:
+        frame = stack.pop()
+        frame.unwrap(stack[-1].parts() if stack else root, closed=False)
+    if all(isinstance(part, str) for part in root):
+        return None
+    return tuple(root)
+
+
+def interpolate(text: str, environ: Mapping[str, str] = None):
+    """
+    Resolve the placeholders of a string.
+
+    A string made of a single placeholder is replaced by the value of the variable
+    or the default value, None for a ``null`` default; the placeholders inside a
+    longer string are replaced by their value, nothing for None.
+
+    Args:
+        text (str): The string value.
+        environ (Mapping[str, str], optional): The environment variables.
+                      Defaults to `os.environ`.
+
+    Returns:
+        Optional[str]: The resolved value.
+    """
+    parts = compile_interpolation(text)
+    if parts is None:
+        return text
+    return _evaluate(parts, os.environ if environ is None else environ, None)
+
+
+class PlaceholderIndex:
+    """
+    The key paths of the string values of a configuration containing placeholders.
+
+    Key paths go through mappings and lists, list items being keyed by position.
+    The index stays valid for any configuration of the same structure and string
+    values, e.g. the same merged files resolved against another environment.
+
+    Args:
+        config (dict): The configuration to index.
+    """
+
+    def __init__(self, config):
+        self.entries: List[Tuple[KeyPath, Tuple[Part, ...]]] = []
+        _index(config, (), self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def paths(self) -> List[KeyPath]:
+        """
+        Return the key paths of the values containing placeholders.
+
+        Returns:
+            List[KeyPath]: The key paths, in configuration order.
+        """
+        return [path for path, _ in self.entries]
+
+    def variable_names(self, environ: Mapping[str, str] = None) -> Set[str]:
+        """
+        Return the names of the environment variables resolving looks up.
+
+        Args:
+            environ (Mapping[str, str], optional): The environment variables, which
+                      nested variable names are built from. Defaults to `os.environ`.
+
+        Returns:
+            Set[str]: The variable names.
+        """
+        environ = os.environ if environ is None else environ
+        names: Set[str] = set()
+        for _, parts in self.entries:
+            _evaluate(parts, environ, names)
+        return names
+
+    def resolve(self, config, environ: Mapping[str, str] = None):
+        """
+        Resolve the indexed placeholders of `config`.
+
+        Only the containers on the key paths of the indexed values are copied, all
+        other values are shared with `config`, which is never modified.
+
+        Args:
+            config (dict): The indexed configuration, or one of the same structure.
+            environ (Mapping[str, str], optional): The environment variables.
+                      Defaults to `os.environ`.
+
+        Returns:
+            dict: A new configuration with the placeholders resolved.
+        """
+        environ = os.environ if environ is None else environ
+        resolved = shallow_copy(config)
+        copied = {id(resolved)}
+        for path, parts in self.entries:
+            parent = resolved
+            for key in path[:-1]:
+                child = parent[key]
+                if id(child) not in copied:
+                    if isinstance(child, list):
+                        child = list(child)
+                    else:
+                        child = shallow_copy(child)
+                    copied.add(id(child))
+                    parent[key] = child
+                parent = child
+            parent[path[-1]] = _evaluate(parts, environ, None)
+        return resolved
+
+
+def _index(value, path: KeyPath, entries: list):
+    if isinstance(value, MAPPING_TYPES):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return
+    for key, item in items:
+        if isinstance(item, str):
+            # the key path is only built for the values with placeholders
+            if "${" in item and (parts := compile_interpolation(item)):
+                entries.append((path + (key,), parts))
+        elif isinstance(item, (list, *MAPPING_TYPES)):
+            _index(item, path + (key,), entries)
+
+
+def resolve_env_variables(
+    config, environ: Mapping[str, str] = None, index: PlaceholderIndex = None
+) -> dict:
     """
     Resolve environment variables in a configuration dictionary.
 
@@ -34,31 +325,43 @@ def resolve_env_variables(config) -> dict:
     Args:
         config (dict): The configuration dictionary containing potential environment
                        variable placeholders.
+        environ (Mapping[str, str], optional): The environment variables. Defaults
+                       to `os.environ`.
+        index (PlaceholderIndex, optional): The index of `config`, kept to resolve
+                       it again. Defaults to None, indexing `config`.
+
+    A value made of a single placeholder becomes the variable value or the default
+    value, None for ``null``; placeholders inside longer strings are substituted.
+    Only the dicts and lists containing placeholders are copied, all other values
+    are shared with `config`, which is never modified. `config` may also be a
+    `ConfigOverlay`, in which case an overlay over the same layers is returned.
 
     Returns:
         dict: A new dictionary with all environment variable placeholders resolved.
     """
-    pattern = re.compile(
-        r"\$\{(\w+):\s*(.*?)\}"
-    )  # Match ${ENV_VAR: default_value}
-
-    def resolve_value(value):
-        if isinstance(value, str):
-            match = pattern.fullmatch(value)
-            if match:
-                env_var, default_value = match.groups()
-                if default_value == "null":
-                    default_value = None
-                return os.getenv(env_var, default_value)
-        elif isinstance(
-            value, dict
-        ):  # Recursively resolve nested dictionaries
-            return {k: resolve_value(v) for k, v in value.items()}
-        elif isinstance(value, list):  # Recursively resolve lists
-            return [resolve_value(v) for v in value]
-        return value  # Return unchanged if no match
-
-    return {key: resolve_value(value) for key, value in config.items()}
+    if index is None:
+        index = PlaceholderIndex(config)
+    count("placeholders_resolved", len(index))
+    return index.resolve(config, environ)
+
+
+def find_env_variable_names(config, index: PlaceholderIndex = None) -> set:
+    """
+    Find the names of the environment variables a configuration refers to.
+
+    Args:
+        config (dict): The configuration dictionary containing potential environment
+                       variable placeholders.
+        index (PlaceholderIndex, optional): The index of `config`. Defaults to None,
+                       indexing `config`.
+
+    Returns:
+        set: The names of the environment variables of all placeholders, nested
+             names built from the current environment.
+    """
+    if index is None:
+        index = PlaceholderIndex(config)
+    return index.variable_names()
 
 
 def main():
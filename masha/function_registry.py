@@ -0,0 +1,298 @@
+"""
+Cached, on-demand loading of the custom filters and tests of a directory.
+
+A `FunctionRegistry` finds the functions a directory of Python files defines by
+parsing the files, without running them. Jinja2 environments look filters and
+tests up by name while compiling and rendering templates, so with a `LazyFunctions`
+mapping only the files defining the filters and tests used by the rendered
+templates are imported; a directory of filters with heavy imports costs nothing
+to templates not using them.
+
+Loaded files are cached per process by path, size and modification time, so
+the config values and the input templates of a run share one loaded set, and a
+file is only executed again once it changed. The public callables a file binds
+are exported, e.g. functions, classes and `functools.partial` objects, but not
+the names it imports.
+"""
+
+import ast
+import importlib.util
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+# pylint: disable=W1203
+from masha.logger_factory import create_logger
+
+logger = create_logger("masha")
+
+_Stamp = Tuple[int, int]
+
+# resolved path -> (size and mtime when loaded, exported functions)
+_modules: Dict[Path, Tuple[_Stamp, Dict[str, Callable]]] = {}
+# resolved path -> (size and mtime when parsed, names the file defines)
+_definitions: Dict[Path, Tuple[_Stamp, Tuple[str, ...]]] = {}
+_lock = threading.RLock()
+
+
+def _stamp(path: Path) -> _Stamp:
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def pass_arg(function: Callable) -> Optional[str]:
+    """
+    Return what Jinja2 passes to a filter or test before its arguments.
+
+    Jinja2 compiles this into the code calling the function.
+
+    Args:
+        function (Callable): The filter or test.
+
+    Returns:
+        Optional[str]: `"context"`, `"eval_context"` or `"environment"`, as set by
+                       the `jinja2.pass_*` decorators, None if nothing is passed.
+    """
+    kind = getattr(function, "jinja_pass_arg", None)
+    return kind.name if kind is not None else None
+
+
+def defined_names(source: str) -> Tuple[str, ...]:
+    """
+    Return the public names a module binds at its top level, without running it.
+
+    Args:
+        source (str): The source of the module.
+
+    Returns:
+        Tuple[str, ...]: The names of its functions, classes and assigned
+                         variables not starting with `_`.
+    """
+    names = []
+    for node in ast.parse(source).body:
+        if isinstance(
+            node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+        ):
+            names.append(node.name)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = (
+                node.targets if isinstance(node, ast.Assign) else [node.target]
+            )
+            names.extend(
+                target.id for target in targets if isinstance(target, ast.Name)
+            )
+    return tuple(name for name in names if not name.startswith("_"))
+
+
+def imported_names(source: str) -> Tuple[str, ...]:
+    """
+    Return the names a module binds with import statements, without running it.
+
+    Args:
+        source (str): The source of the module.
+
+    Returns:
+        Tuple[str, ...]: The names bound by its `import` and `from ... import`
+                         statements, e.g. `os` for `import os.path`.
+    """
+    names = []
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.extend(
+                alias.asname or alias.name.split(".")[0]
+                for alias in node.names
+            )
+    return tuple(names)
+
+
+def load_module_functions(file: Path) -> Dict[str, Callable]:
+    """
+    Load the public callables a Python file defines, reusing earlier loads.
+
+    The file is executed again only if its size or modification time changed.
+
+    Args:
+        file (Path): The Python file.
+
+    Returns:
+        Dict[str, Callable]: The functions by name, excluding the names bound by
+                             import statements, see `imported_names`.
+    """
+    path = Path(file).resolve()
+    with _lock:
+        stamp = _stamp(path)
+        cached = _modules.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        logger.debug(f"Loading functions from {path}")
+        module_name = str(file)[:-3]  # Remove '.py' extension
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        source = path.read_text(encoding="utf-8")
+        defined = set(defined_names(source))
+        imported = set(imported_names(source))
+        functions = {}
+        for attr_name, attr in vars(module).items():
+            if not callable(attr) or attr_name.startswith("_"):
+                continue
+            if attr_name in defined or (
+                attr_name not in imported
+                # the names of `from ... import *` are only known at run time
+                and (
+                    "*" not in imported
+                    or getattr(attr, "__module__", None) == module.__name__
+                )
+            ):
+                functions[attr_name] = attr
+        _modules[path] = (stamp, functions)
+        return functions
+
+
+class FunctionRegistry:
+    """
+    The filters or tests defined by the Python files of a directory.
+
+    Args:
+        directory (Path): The directory of the Python files.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    def files(self) -> Iterator[Path]:
+        """
+        Yield the Python files of the directory, in name order.
+
+        Yields:
+            Path: The files.
+        """
+        if self.directory.is_dir():
+            for name in sorted(os.listdir(self.directory)):
+                if name.endswith(".py"):
+                    yield self.directory / name
+
+    def definitions(self) -> Dict[str, Path]:
+        """
+        Map every name defined by the files to the last file defining it.
+
+        Returns:
+            Dict[str, Path]: The file defining each name.
+        """
+        index = {}
+        for file in self.files():
+            path = file.resolve()
+            with _lock:
+                stamp = _stamp(path)
+                cached = _definitions.get(path)
+                if cached is None or cached[0] != stamp:
+                    try:
+                        names = defined_names(path.read_text(encoding="utf-8"))
+                    except (SyntaxError, UnicodeDecodeError):
+                        # let loading the file report the error
+                        names = ()
+                    cached = _definitions[path] = (stamp, names)
+            for name in cached[1]:
+                index[name] = file
+        return index
+
+    def fingerprint(self) -> Tuple[Tuple[str, _Stamp], ...]:
+        """
+        Return the path, size and modification time of every file.
+
+        Returns:
+            Tuple[Tuple[str, _Stamp], ...]: A summary changing whenever a file is
+                                            changed, added or removed.
+        """
+        return tuple(
+            (str(path), _stamp(path))
+            for path in (file.resolve() for file in self.files())
+        )
+
+    def load_all(self) -> Dict[str, Callable]:
+        """
+        Load every file of the directory.
+
+        Returns:
+            Dict[str, Callable]: All the functions, later files taking precedence.
+        """
+        functions = {}
+        for file in self.files():
+            functions.update(load_module_functions(file))
+        return functions
+
+
+class LazyFunctions(dict):
+    """
+    Jinja2 filters or tests loading the custom ones of a registry when looked up.
+
+    Custom functions take precedence over the built-in ones of the same name.
+
+    Args:
+        builtins (Dict[str, Any]): The built-in filters or tests of the environment.
+        registry (FunctionRegistry): The custom functions.
+        wrap (Callable[[Callable], Callable], optional): Applied to every loaded
+                            function. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        builtins: Dict[str, Any],
+        registry: FunctionRegistry,
+        wrap: Callable[[Callable], Callable] = None,
+    ):
+        self._registry = registry
+        self._wrap = wrap
+        self._all_loaded = False
+        self._defined = registry.definitions()
+        super().__init__(
+            (name, value)
+            for name, value in builtins.items()
+            if name not in self._defined
+        )
+        self._fingerprint = (
+            tuple(
+                sorted((name, pass_arg(value)) for name, value in self.items())
+            ),
+            registry.fingerprint(),
+        )
+
+    def fingerprint(self) -> tuple:
+        """
+        Return the pass arguments of the built-in functions and the fingerprint
+        of the registry, without loading the custom functions.
+
+        Returns:
+            tuple: A hashable summary of the functions.
+        """
+        return self._fingerprint
+
+    def _add(self, file: Path):
+        for name, function in load_module_functions(file).items():
+            # a name defined by several files is taken from the last one
+            if self._defined.get(name, file) == file:
+                self[name] = self._wrap(function) if self._wrap else function
+
+    def __missing__(self, name):
+        if name in self._defined:
+            self._add(self._defined[name])
+        elif not self._all_loaded:
+            # maybe defined in a way the source scan does not see
+            self._all_loaded = True
+            for file in self._registry.files():
+                self._add(file)
+        if not dict.__contains__(self, name):
+            raise KeyError(name)
+        return dict.__getitem__(self, name)
+
+    def __contains__(self, name) -> bool:
+        return self.get(name) is not None
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
@@ -0,0 +1,511 @@
+"""
+Re-resolve configurations and re-render outputs incrementally.
+
+An `IncrementalEngine` runs the whole pipeline once: loading the variable files,
+merging them, resolving environment variables and templated values, validating
+the result and rendering the output templates. It keeps every intermediate
+result, the file each value came from and, for every templated value and output
+template, the key paths it references.
+
+After a variable file or environment variables changed, `update` compares the
+new values with the previous ones, key path by key path, skipping the values
+shared with the previous run, and then renders again only the templated values
+referencing a changed key path, in dependency order, and only the outputs
+referencing a changed value. The returned `UpdateReport` tells which key paths
+and which outputs actually changed.
+"""
+
+import os
+from pathlib import Path
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import jinja2
+from jinja2 import meta
+from returns.result import Failure, Result, Success
+
+# pylint: disable=W1203
+from masha.async_render import run_async
+from masha.config_loader import expand_config_paths, load_config
+from masha.config_overlay import MAPPING_TYPES, ConfigOverlay, materialize
+from masha.env_loader import PlaceholderIndex
+from masha.logger_factory import create_logger
+from masha.output_writer import write_template
+from masha.template_cache import get_template_cache
+from masha.template_renderer import (
+    Functions,
+    create_jinja_environment,
+    create_value_environment,
+)
+from masha.template_resolver import (
+    WHOLE_CONFIG,
+    KeyPath,
+    TemplateCycleError,
+    build_dependency_graph,
+    compile_cached,
+    find_template_references,
+    has_template_syntax,
+    iter_string_leaves,
+    topological_order,
+    writable_parent,
+)
+
+logger = create_logger("masha")
+
+
+class UpdateReport(NamedTuple):
+    """
+    What a run of an `IncrementalEngine` recomputed.
+
+    Attributes:
+        changed_keys (List[KeyPath]): The key paths whose resolved value changed.
+        rendered_keys (List[KeyPath]): The templated values rendered again.
+        rendered_outputs (List[Path]): The outputs rendered again.
+        changed_outputs (List[Path]): The outputs whose content changed.
+    """
+
+    changed_keys: List[KeyPath]
+    rendered_keys: List[KeyPath]
+    rendered_outputs: List[Path]
+    changed_outputs: List[Path]
+
+
+def diff_paths(old: Any, new: Any, prefix: KeyPath = ()) -> List[KeyPath]:
+    """
+    Return the key paths whose value differs between two configurations.
+
+    Mappings are compared key by key, all other values as a whole. Values shared
+    by both configurations are skipped without being compared.
+
+    Args:
+        old (Any): The previous configuration.
+        new (Any): The new configuration.
+        prefix (KeyPath, optional): The key path of both values. Defaults to ().
+
+    Returns:
+        List[KeyPath]: The key paths of the changed, added and removed values.
+    """
+    if old is new:
+        return []
+    if not (isinstance(old, MAPPING_TYPES) and isinstance(new, MAPPING_TYPES)):
+        return [] if old == new else [prefix]
+    changed = []
+    for key, value in new.items():
+        if key in old:
+            changed.extend(diff_paths(old[key], value, prefix + (key,)))
+        else:
+            changed.append(prefix + (key,))
+    changed.extend(prefix + (key,) for key in old if key not in new)
+    return changed
+
+
+class _ChangedPaths:
+    """Tells whether key paths read something at or below changed key paths."""
+
+    def __init__(self, paths: Iterable[KeyPath]):
+        self.exact: Set[KeyPath] = set()
+        self.prefixes: Set[KeyPath] = set()
+        for path in paths:
+            self.add(path)
+
+    def add(self, path: KeyPath):
+        """Mark `path`, and with it everything below it, as changed."""
+        self.exact.add(path)
+        self.prefixes.update(path[:depth] for depth in range(1, len(path) + 1))
+
+    def affects(self, references: Optional[Set[KeyPath]]) -> bool:
+        """Whether any of `references`, None for unknown ones, read a change."""
+        if references is None or WHOLE_CONFIG in references:
+            return bool(self.exact)
+        return any(
+            reference in self.prefixes
+            or any(
+                reference[:depth] in self.exact
+                for depth in range(1, len(reference))
+            )
+            for reference in references
+        )
+
+
+_MISSING = object()
+
+
+class _Output(NamedTuple):
+    template: Path
+    output: Path
+    # the key paths the template and its included templates read, None if unknown
+    references: Optional[Set[KeyPath]]
+    fingerprint: tuple
+
+
+class IncrementalEngine:
+    """
+    Resolves configurations and renders templates, recomputing only what changed.
+
+    Args:
+        variables (Iterable[Path]): The configuration files, directories or glob
+                            patterns, merged in order.
+        filters (Functions, optional): Custom Jinja2 filters, or a
+                            `FunctionRegistry` loading the used ones. Defaults to None.
+        tests (Functions, optional): Custom Jinja2 tests, or a `FunctionRegistry`
+                            loading the used ones. Defaults to None.
+        model_class (type, optional): A Pydantic model class validating the resolved
+                            configuration. Defaults to None.
+        deep_merge (bool, optional): Merge nested mappings of the variable files
+                            key by key. Defaults to False.
+        enable_async (bool, optional): Render with async environments, awaiting
+                            coroutine filters and tests. Defaults to False.
+    """
+
+    # pylint: disable=R0902,R0913,R0917
+    def __init__(
+        self,
+        variables: Iterable[Path],
+        filters: Functions = None,
+        tests: Functions = None,
+        model_class=None,
+        deep_merge: bool = False,
+        enable_async: bool = False,
+    ):
+        self.variables = tuple(variables)
+        self.filters = filters
+        self.tests = tests
+        self.model_class = model_class
+        self.deep_merge = deep_merge
+        self.enable_async = enable_async
+        # variable file -> (fingerprint, parsed content)
+        self._configs: Dict[Path, Tuple[Any, dict]] = {}
+        self._files: List[Path] = []
+        self._merged: Optional[ConfigOverlay] = None
+        self._index: Optional[PlaceholderIndex] = None
+        self._env_values: Dict[str, Optional[str]] = {}
+        self._env_config: Optional[dict] = None
+        self._config: Optional[dict] = None
+        # templated key path -> rendered value
+        self._values: Dict[KeyPath, Any] = {}
+        self._outputs: Dict[Path, _Output] = {}
+        self._environments: Dict[Path, jinja2.Environment] = {}
+        self._value_env = create_value_environment(
+            filters, tests, enable_async=enable_async
+        )
+        # the inputs changed since the last successful run
+        self._stale = False
+
+    @property
+    def config(self) -> Optional[dict]:
+        """The resolved configuration of the last successful run."""
+        return self._config
+
+    def add_output(self, template: Path, output: Path):
+        """
+        Render `template` to `output` on every run changing a value it reads.
+
+        Args:
+            template (Path): The path to the input template file.
+            output (Path): The path where the rendered template is saved.
+        """
+        self._outputs[Path(output)] = _Output(
+            Path(template), Path(output), None, ()
+        )
+
+    def source_of(self, path: KeyPath) -> Optional[Path]:
+        """
+        Return the variable file the value at a key path came from.
+
+        Args:
+            path (KeyPath): The key path.
+
+        Returns:
+            Optional[Path]: The last file defining the value, None if none does.
+        """
+        for file in reversed(self._files):
+            value = self._configs[file][1]
+            for depth, key in enumerate(path):
+                if not isinstance(value, MAPPING_TYPES):
+                    # replaces the values of the earlier files below it
+                    return None
+                if key not in value:
+                    break
+                if depth == 0 and not self.deep_merge:
+                    # the whole top-level value comes from the last file
+                    return file if _contains(value[key], path[1:]) else None
+                value = value[key]
+            else:
+                return file
+        return None
+
+    def update(
+        self,
+        changed_files: Iterable[Path] = None,
+        environ: Mapping[str, str] = None,
+    ) -> Result[UpdateReport, Exception]:
+        """
+        Bring the configuration and the outputs up to date with their inputs.
+
+        The first run computes everything. After a failure, the next run computes
+        again everything changed since the last successful run.
+
+        Args:
+            changed_files (Iterable[Path], optional): The variable files known to have
+                            changed. Defaults to None, checking every file for a
+                            changed modification time or size.
+            environ (Mapping[str, str], optional): The environment variables.
+                            Defaults to `os.environ`.
+
+        Returns:
+            Result[UpdateReport, Exception]: What was recomputed, or the exception
+                            of the first failing stage.
+        """
+        environ = os.environ if environ is None else environ
+        first_run = self._config is None
+        match self._load(changed_files):
+            case Success(files_changed):
+                self._stale = self._stale or files_changed
+            case Failure(value):
+                return Failure(value)
+        if not (
+            first_run
+            or self._stale
+            or self._env_values != self._lookup(environ)
+        ):
+            return self._render_outputs(_ChangedPaths(()), [], [])
+
+        self._stale = True
+        if files_changed or self._index is None:
+            self._merged = ConfigOverlay(
+                [self._configs[file][1] for file in self._files],
+                self.deep_merge,
+            )
+            self._index = PlaceholderIndex(self._merged)
+        env_config = materialize(self._index.resolve(self._merged, environ))
+        changed = [] if first_run else diff_paths(self._env_config, env_config)
+        logger.debug(f"{len(changed)} config values changed")
+
+        try:
+            config, values, rendered_keys, changed = self._render_values(
+                env_config, changed, first_run
+            )
+        except TemplateCycleError as e:
+            return Failure(
+                ValueError(f"Failed to render config templates: {e}")
+            )
+        if self.model_class is not None:
+            # pylint: disable=C0415
+            from masha.config_validator import validate_config
+
+            validation_result = validate_config(config, self.model_class)
+            if isinstance(validation_result, Failure):
+                return Failure(
+                    ValueError(f"Given config is invalid {validation_result}")
+                )
+        self._env_values = self._lookup(environ)
+        self._env_config = env_config
+        self._values = values
+        self._config = config
+        self._stale = False
+        return self._render_outputs(
+            None if first_run else _ChangedPaths(changed),
+            changed,
+            rendered_keys,
+        )
+
+    def _lookup(self, environ: Mapping[str, str]) -> Dict[str, Optional[str]]:
+        if self._index is None:
+            return {}
+        return {
+            name: environ.get(name)
+            for name in self._index.variable_names(environ)
+        }
+
+    def _load(
+        self, changed_files: Optional[Iterable[Path]]
+    ) -> Result[bool, Exception]:
+        """Parse the new and changed variable files, telling if any changed."""
+        files = expand_config_paths(self.variables)
+        if changed_files is None:
+            stale = [
+                file
+                for file in files
+                if file not in self._configs
+                or self._configs[file][0] != _fingerprint(file)
+            ]
+        else:
+            changed = {Path(file) for file in changed_files}
+            stale = [
+                file
+                for file in files
+                if file in changed or file not in self._configs
+            ]
+        for file in stale:
+            fingerprint = _fingerprint(file)
+            match load_config(file):
+                case Success(value):
+                    self._configs[file] = (fingerprint, value)
+                case Failure(value):
+                    return Failure(
+                        ValueError(f"Error processing file {file}: {value}")
+                    )
+        files_changed = bool(stale) or files != self._files
+        self._files = files
+        for file in set(self._configs) - set(files):
+            del self._configs[file]
+        return Success(files_changed)
+
+    def _render_values(
+        self, env_config: dict, changed: List[KeyPath], first_run: bool
+    ) -> Tuple[dict, Dict[KeyPath, Any], List[KeyPath], List[KeyPath]]:
+        """Render the templated values reading changed values again."""
+        env = self._value_env
+        cache = get_template_cache()
+        compiled = {
+            path: compile_cached(env, value, cache)
+            for path, value in iter_string_leaves(env_config)
+            if has_template_syntax(env, value)
+        }
+        graph = build_dependency_graph(
+            env_config,
+            {path: entry.references for path, entry in compiled.items()},
+        )
+        # a templated value whose source changed is only a change once rendered
+        sources_changed = {path for path in changed if path in compiled}
+        changed = [path for path in changed if path not in compiled]
+        changed_paths = _ChangedPaths(changed)
+        config = dict(env_config)
+        copied = {id(config)}
+        globals_ = env.make_globals(None)
+        values = {}
+        rendered_keys = []
+        for path in topological_order(graph):
+            previous = self._values.get(path, _MISSING)
+            value = previous
+            if (
+                previous is _MISSING
+                or path in sources_changed
+                or changed_paths.affects(compiled[path].references)
+            ):
+                template = env.template_class.from_code(
+                    env, compiled[path].code, globals_
+                )
+                if env.is_async:
+                    value = run_async(template.render_async(config))
+                else:
+                    value = template.render(config)
+                rendered_keys.append(path)
+                if not first_run and value != previous:
+                    changed_paths.add(path)
+                    changed.append(path)
+            values[path] = value
+            writable_parent(config, path, copied)[path[-1]] = value
+        return config, values, rendered_keys, changed
+
+    def _render_outputs(
+        self,
+        changed: Optional[_ChangedPaths],
+        changed_keys: List[KeyPath],
+        rendered_keys: List[KeyPath],
+    ) -> Result[UpdateReport, Exception]:
+        """Render the outputs reading changed values, or new templates, again."""
+        rendered_outputs = []
+        changed_outputs = []
+        for output, entry in list(self._outputs.items()):
+            jenv = self._environment(entry.template.parent)
+            fingerprint = _template_fingerprint(jenv, entry.template.name)
+            if (
+                changed is not None
+                and fingerprint == entry.fingerprint
+                and not changed.affects(entry.references)
+            ):
+                continue
+            try:
+                template = jenv.get_template(entry.template.name)
+                if fingerprint != entry.fingerprint:
+                    entry = self._outputs[output] = entry._replace(
+                        references=find_template_references(
+                            jenv, entry.template.name
+                        ),
+                        fingerprint=fingerprint,
+                    )
+                rendered_outputs.append(output)
+                if write_template(
+                    template, self._config, output, only_if_changed=True
+                ):
+                    changed_outputs.append(output)
+            # pylint: disable=W0718
+            except Exception as e:
+                return Failure(ValueError(f"Failed to render template {e}"))
+        logger.info(
+            f"Rendered {len(rendered_outputs)} outputs, {len(changed_outputs)} changed"
+        )
+        return Success(
+            UpdateReport(
+                changed_keys, rendered_keys, rendered_outputs, changed_outputs
+            )
+        )
+
+    def _environment(self, search_path: Path) -> jinja2.Environment:
+        if search_path not in self._environments:
+            self._environments[search_path] = create_jinja_environment(
+                search_path,
+                self.filters,
+                self.tests,
+                enable_async=self.enable_async,
+            )
+        return self._environments[search_path]
+
+
+def _fingerprint(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _contains(value: Any, path: KeyPath) -> bool:
+    for key in path:
+        if not isinstance(value, MAPPING_TYPES) or key not in value:
+            return False
+        value = value[key]
+    return True
+
+
+def _included_templates(
+    jenv: jinja2.Environment, name: str
+) -> Optional[List[str]]:
+    """Return `name` and the templates it includes, None if not known statically."""
+    names = [name]
+    pending = [name]
+    while pending:
+        source = jenv.loader.get_source(jenv, pending.pop())[0]
+        for included in meta.find_referenced_templates(jenv.parse(source)):
+            if included is None:
+                return None
+            if included not in names:
+                names.append(included)
+                pending.append(included)
+    return names
+
+
+def _template_fingerprint(jenv: jinja2.Environment, name: str) -> tuple:
+    """Return the fingerprints of a template and the templates it includes."""
+    try:
+        names = _included_templates(jenv, name) or [name]
+    except jinja2.TemplateError:
+        names = [name]
+    fingerprints = []
+    for included in names:
+        try:
+            filename = jenv.loader.get_source(jenv, included)[1]
+        except jinja2.TemplateNotFound:
+            filename = None
+        fingerprints.append((included, filename and _fingerprint(filename)))
+    return tuple(fingerprints)
@@ -4,12 +4,27 @@ Module for creating and configuring logger instances.
 This module provides a function to create a logger instance configured from a
 logging configuration file. The logger is set up using the settings specified
 in 'logging.conf'. If the configuration file is not found, a FileNotFoundError
-is raised.
+is raised. The configuration file is only applied by the first call, later calls
+return the already configured loggers.
+
+`configure_logging` overrides the level and stream of the configuration file and
+selects between its text format and a structured JSON format. Configurations are
+logged with `log_config`, which only serializes them when the level is enabled.
 """
 
+import json
 import logging
 import logging.config
+from collections.abc import Mapping
 from pathlib import Path
+from typing import Any, TextIO
+
+_configured = False
+_default_level = None
+_text_formatters = {}
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+LOG_FORMATS = ("text", "json")
 
 
 def create_logger(name):
@@ -27,12 +42,121 @@ def create_logger(name):
         FileNotFoundError: If the 'logging.conf' file is not found in the same
         directory as this script.
     """
-    log_conf_file = Path(__file__).parent / "logging.conf"
+    global _configured  # pylint: disable=W0603
+    if not _configured:
+        log_conf_file = Path(__file__).parent / "logging.conf"
 
-    if not log_conf_file.exists():
-        raise FileNotFoundError(
-            f"The logging configuration file '{log_conf_file}' was not found."
-        )
+        if not log_conf_file.exists():
+            raise FileNotFoundError(
+                f"The logging configuration file '{log_conf_file}' was not found."
+            )
 
-    logging.config.fileConfig(log_conf_file)
+        logging.config.fileConfig(log_conf_file)
+        _configured = True
     return logging.getLogger(name)
+
+
+class LazyJson:
+    """
+    Serializes a value to JSON only when a log message using it is formatted.
+
+    Args:
+        value (Any): The value to serialize.
+    """
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value, default=json_default)
+
+
+def json_default(value: Any) -> Any:
+    """
+    Serialize values `json` does not support: mappings as dicts, others as strings.
+
+    Args:
+        value (Any): The value to serialize.
+
+    Returns:
+        Any: A value `json` supports.
+    """
+    if isinstance(value, Mapping):
+        return dict(value)
+    return str(value)
+
+
+def log_config(logger: logging.Logger, level: int, label: str, config: Any):
+    """
+    Log a configuration as JSON, serializing it only if `level` is enabled.
+
+    The JSON log format replaces the configuration by its label.
+
+    Args:
+        logger (logging.Logger): The logger to log with.
+        level (int): The logging level, e.g. `logging.DEBUG`.
+        label (str): What the configuration is, e.g. "merged_config".
+        config (Any): The configuration.
+    """
+    if logger.isEnabledFor(level):
+        logger.log(
+            level,
+            "%s: %s",
+            label,
+            LazyJson(config),
+            extra={"masha_config": label},
+            stacklevel=2,
+        )
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        if hasattr(record, "masha_config"):
+            message = f"{record.masha_config} omitted"
+        else:
+            message = record.getMessage()
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "message": message,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(
+    level: str = None, log_format: str = "text", stream: TextIO = None
+):
+    """
+    Override the level, format and stream of the `masha` logger set by 'logging.conf'.
+
+    Args:
+        level (str, optional): One of `LOG_LEVELS`. Defaults to None, the level of
+                               'logging.conf'.
+        log_format (str, optional): One of `LOG_FORMATS`. Defaults to "text", the
+                               format of 'logging.conf'.
+        stream (TextIO, optional): The stream to log to, e.g. `sys.stderr` while the
+                               rendered output goes to stdout. Defaults to None,
+                               keeping the current stream.
+    """
+    global _default_level  # pylint: disable=W0603
+    logger = create_logger("masha")
+    if _default_level is None:
+        _default_level = logger.level
+    logger.setLevel(level.upper() if level else _default_level)
+    for handler in logger.handlers:
+        if handler not in _text_formatters:
+            _text_formatters[handler] = handler.formatter
+        handler.setFormatter(
+            JsonFormatter()
+            if log_format == "json"
+            else _text_formatters[handler]
+        )
+        if stream is not None and isinstance(handler, logging.StreamHandler):
+            handler.setStream(stream)
@@ -0,0 +1,131 @@
+"""
+Load manifests of template/output pairs rendered in a single masha run.
+
+A manifest is a YAML, JSON or TOML file supported by `load_config`, with a
+`jobs` list of `template`/`output` entries. Relative paths are resolved against
+the directory of the manifest:
+
+    jobs:
+      - template: templates/nginx.conf.j2
+        output: out/nginx.conf
+      - template: templates/app.ini.j2
+        output: out/app.ini
+"""
+
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple
+
+from returns.result import Failure, Result, Success
+
+from masha.config_loader import load_config
+
+
+class RenderJob(NamedTuple):
+    """A template to render and the file the output is written to."""
+
+    template: Path
+    output: Path
+
+
+def load_manifest(manifest_path: Path) -> Result[List[RenderJob], dict]:
+    """
+    Load the render jobs listed in a manifest file.
+
+    Args:
+        manifest_path (Path): The path to the manifest file.
+
+    Returns:
+        Result[List[RenderJob], dict]: A `Success` with the jobs in manifest order,
+                          or a `Failure` with an error message.
+    """
+    manifest = None
+    match load_config(manifest_path):
+        case Success(value):
+            manifest = value
+        case Failure(value):
+            return Failure(value)
+
+    if not isinstance(manifest, dict) or not isinstance(
+        manifest.get("jobs"), list
+    ):
+        return Failure({"error": f"No 'jobs' list in {manifest_path}"})
+
+    base_dir = manifest_path.parent
+    jobs = []
+    for index, entry in enumerate(manifest["jobs"]):
+        if not (
+            isinstance(entry, dict)
+            and "template" in entry
+            and "output" in entry
+        ):
+            return Failure(
+                {
+                    "error": f"Job {index} of {manifest_path} needs "
+                    "'template' and 'output'"
+                }
+            )
+        jobs.append(
+            RenderJob(
+                base_dir / Path(entry["template"]),
+                base_dir / Path(entry["output"]),
+            )
+        )
+    return Success(jobs)
+
+
+def job_report(job: RenderJob, result: Result) -> Dict[str, Any]:
+    """
+    Summarize the outcome of a render job for the structured report.
+
+    Args:
+        job (RenderJob): The rendered job.
+        result (Result): The result of rendering the job.
+
+    Returns:
+        Dict[str, Any]: The template, output, status and error of the job. The
+                        status is `unchanged` if the result is Success(False),
+                        the output was then kept as it was.
+    """
+    report = {
+        "template": str(job.template),
+        "output": str(job.output),
+        "status": "success",
+        "error": None,
+    }
+    match result:
+        case Success(False):
+            report["status"] = "unchanged"
+        case Failure(value):
+            report["status"] = "failure"
+            report["error"] = str(value)
+    return report
+
+
+def write_report(reports: List[Dict[str, Any]], report_path: str = "-"):
+    """
+    Write the per-job reports of a run as JSON.
+
+    Jobs with any status other than `failure` count as succeeded.
+
+    Args:
+        reports (List[Dict[str, Any]]): The job reports, see `job_report`.
+        report_path (str, optional): The file to write to, "-" for stdout.
+                          Defaults to "-".
+    """
+    failed = sum(1 for report in reports if report["status"] == "failure")
+    content = json.dumps(
+        {
+            "jobs": reports,
+            "succeeded": len(reports) - failed,
+            "failed": failed,
+        },
+        indent=2,
+    )
+    if report_path == "-":
+        sys.stdout.write(content + "\n")
+        sys.stdout.flush()
+    else:
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write(content + "\n")
@@ -0,0 +1,122 @@
+"""
+Load matrices of variable-file overlays rendered in a single masha run.
+
+A matrix is a YAML, JSON or TOML file supported by `load_config`, with a
+`dimensions` mapping. Every dimension names its overlay sets, each one a
+variable file or a list of them; the combinations are the cartesian product of
+the sets, in the order of the dimensions. Relative paths are resolved against
+the directory of the matrix:
+
+    dimensions:
+      env:
+        dev: env/dev.yaml
+        prod: [env/prod.yaml, env/prod-secrets.yaml]
+      region:
+        eu: regions/eu.yaml
+        us: regions/us.yaml
+
+The overlays of a combination are merged over the shared `-v` base layers, and
+the output of a combination is named by formatting the `-o` path with the set
+names, e.g. ``out/{env}-{region}.conf``, or ``{name}`` for ``prod-eu``.
+"""
+
+import itertools
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+from returns.result import Failure, Result, Success
+
+from masha.config_loader import load_config
+
+
+class Combination(NamedTuple):
+    """One overlay set of every dimension of a matrix."""
+
+    name: str
+    sets: Dict[str, str]
+    variables: Tuple[Path, ...]
+
+
+def load_matrix(matrix_path: Path) -> Result[List[Combination], dict]:
+    """
+    Load the combinations of the overlay sets of a matrix file.
+
+    Args:
+        matrix_path (Path): The path to the matrix file.
+
+    Returns:
+        Result[List[Combination], dict]: A `Success` with the combinations, the
+                          sets of the last dimension varying fastest, or a
+                          `Failure` with an error message.
+    """
+    matrix = None
+    match load_config(matrix_path):
+        case Success(value):
+            matrix = value
+        case Failure(value):
+            return Failure(value)
+
+    dimensions = matrix.get("dimensions") if isinstance(matrix, dict) else None
+    if not isinstance(dimensions, dict) or not dimensions:
+        return Failure({"error": f"No 'dimensions' mapping in {matrix_path}"})
+
+    base_dir = matrix_path.parent
+    choices = []
+    for dimension, sets in dimensions.items():
+        if not isinstance(sets, dict) or not sets:
+            return Failure(
+                {
+                    "error": f"Dimension '{dimension}' of {matrix_path} needs "
+                    "a mapping of named overlay sets"
+                }
+            )
+        dimension_choices = []
+        for set_name, paths in sets.items():
+            if isinstance(paths, str):
+                paths = [paths]
+            if not isinstance(paths, list) or not all(
+                isinstance(path, str) for path in paths
+            ):
+                return Failure(
+                    {
+                        "error": f"Overlay set '{dimension}.{set_name}' of "
+                        f"{matrix_path} needs a path or a list of paths"
+                    }
+                )
+            dimension_choices.append(
+                (str(set_name), tuple(base_dir / Path(path) for path in paths))
+            )
+        choices.append(dimension_choices)
+
+    combinations = []
+    for product in itertools.product(*choices):
+        combinations.append(
+            Combination(
+                "-".join(set_name for set_name, _ in product),
+                {
+                    str(dimension): set_name
+                    for dimension, (set_name, _) in zip(dimensions, product)
+                },
+                tuple(path for _, paths in product for path in paths),
+            )
+        )
+    return Success(combinations)
+
+
+def combination_output(combination: Combination, output: Path) -> Path:
+    """
+    Return the output path of a combination.
+
+    Args:
+        combination (Combination): The combination.
+        output (Path): The output path, with ``{dimension}`` and ``{name}``
+                       fields standing for the set names of the combination.
+
+    Returns:
+        Path: The output path of the combination.
+
+    Raises:
+        KeyError: If `output` has a field that is not a dimension.
+    """
+    fields = {"name": combination.name, **combination.sets}
+    return Path(str(output).format_map(fields))
@@ -0,0 +1,242 @@
+"""
+Streaming of rendered templates to their output file or to stdout.
+
+`write_template` renders a template with `jinja2.Template.generate`, so the output
+is never held in memory as a whole: the generated chunks are gathered into writes
+of about `DEFAULT_BUFFER_SIZE` characters. The peak memory of a render is bounded
+by the buffer size and the template's own state, not by the size of the output.
+Templates of async environments are streamed from `generate_async` the same way.
+
+Output files are written in place: their inode, owner and hard links are kept,
+and their directory does not need to be writable. The rendering is spooled to a
+temporary file first, kept in memory up to the buffer size, and only copied into
+the output once the template rendered completely, so a failing render leaves the
+output as it was. A symlinked output is written through to its target, and
+outputs that are not regular files, such as `/dev/null` or a named pipe, are
+streamed to directly. Optionally an output whose content would not change is kept
+as it is, with its modification time, so that tools watching it are not
+triggered; such outputs are replaced atomically by a temporary file written next
+to them, when their directory is writable. The output `-` stands for stdout.
+"""
+
+import filecmp
+import os
+import shutil
+import stat
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Iterable, Mapping, TextIO
+
+import jinja2
+
+from masha.async_render import iterate_async
+from masha.profiler import count
+
+STDOUT = "-"
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+
+
+def is_stdout(output: Path) -> bool:
+    """
+    Tell whether an output path stands for stdout.
+
+    Args:
+        output (Path): The output path.
+
+    Returns:
+        bool: True if `output` is `-`.
+    """
+    return str(output) == STDOUT
+
+
+def write_chunks(
+    chunks: Iterable[str],
+    stream: TextIO,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+) -> int:
+    """
+    Write text chunks to a stream in writes of about `buffer_size` characters.
+
+    Args:
+        chunks (Iterable[str]): The chunks, e.g. from `jinja2.Template.generate`.
+        stream (TextIO): The stream to write to.
+        buffer_size (int, optional): The number of characters gathered before
+                                     writing them. Defaults to `DEFAULT_BUFFER_SIZE`.
+
+    Returns:
+        int: The number of characters written.
+    """
+    buffer = []
+    buffered = 0
+    written = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= buffer_size:
+            stream.write("".join(buffer))
+            written += buffered
+            buffer.clear()
+            buffered = 0
+    if buffer:
+        stream.write("".join(buffer))
+        written += buffered
+    return written
+
+
+def write_template(
+    template: jinja2.Template,
+    context: Mapping[str, Any],
+    output: Path,
+    buffer_size: int = DEFAULT_BUFFER_SIZE,
+    only_if_changed: bool = False,
+) -> bool:
+    """
+    Render a template chunk by chunk into its output.
+
+    Args:
+        template (jinja2.Template): The template to render.
+        context (Mapping[str, Any]): The configuration to render it with.
+        output (Path): The output file, `-` for stdout.
+        buffer_size (int, optional): The number of characters gathered before
+                                     writing them. Defaults to `DEFAULT_BUFFER_SIZE`.
+        only_if_changed (bool, optional): Keep the output file untouched if it
+                                     already has the rendered content, replacing it
+                                     atomically otherwise. Defaults to False,
+                                     always writing it in place.
+
+    Returns:
+        bool: False if the output was kept because it did not change, True if it
+              was written.
+
+    Raises:
+        Exception: Any error raised while rendering, the output file is then left
+                   as it was.
+    """
+    if template.environment.is_async:
+        chunks = iterate_async(template.generate_async(context))
+    else:
+        chunks = template.generate(context)
+    if is_stdout(output):
+        count(
+            "characters_written", write_chunks(chunks, sys.stdout, buffer_size)
+        )
+        sys.stdout.flush()
+        return True
+
+    # write the target of a symlink, not the link itself
+    output = Path(os.path.realpath(output))
+    if not _is_regular_or_missing(output):
+        # devices and pipes, e.g. /dev/null, are streamed to directly
+        with open(output, "w", encoding="utf-8") as f:
+            count("characters_written", write_chunks(chunks, f, buffer_size))
+        return True
+    if only_if_changed:
+        try:
+            fd, tmp_path = _create_temp(output)
+        except PermissionError:
+            # the directory is not writable, the file itself may still be
+            pass
+        else:
+            return _replace_if_changed(
+                fd, tmp_path, chunks, output, buffer_size
+            )
+    with tempfile.SpooledTemporaryFile(
+        max_size=buffer_size, mode="w+", encoding="utf-8", newline=""
+    ) as spool:
+        count("characters_written", write_chunks(chunks, spool, buffer_size))
+        spool.seek(0)
+        if only_if_changed and _same_spooled(spool, output, buffer_size):
+            return False
+        spool.seek(0)
+        with open(output, "w", encoding="utf-8") as f:
+            shutil.copyfileobj(spool, f, buffer_size)
+    return True
+
+
+def _replace_if_changed(
+    fd: int,
+    tmp_path: str,
+    chunks: Iterable[str],
+    output: Path,
+    buffer_size: int,
+) -> bool:
+    """Write the temporary file and move it over the output if it differs."""
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            count("characters_written", write_chunks(chunks, f, buffer_size))
+        if _same_content(tmp_path, output):
+            os.remove(tmp_path)
+            return False
+        _copy_mode(output, tmp_path)
+        os.replace(tmp_path, output)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def _is_regular_or_missing(output: Path) -> bool:
+    """Tell whether the output is a regular file or does not exist yet."""
+    try:
+        return stat.S_ISREG(os.stat(output).st_mode)
+    except FileNotFoundError:
+        return True
+
+
+def _create_temp(output: Path) -> tuple[int, str]:
+    """
+    Create a temporary file next to the output.
+
+    The file is created with the mode `open()` would give the output, the
+    process umask being applied to it by the system.
+    """
+    while True:
+        tmp_path = str(
+            output.parent / f".{output.name}.{os.urandom(4).hex()}.tmp"
+        )
+        try:
+            return (
+                os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666),
+                tmp_path,
+            )
+        except FileExistsError:
+            continue
+
+
+def _same_content(tmp_path: str, output: Path) -> bool:
+    """Compare the files block by block, after comparing their sizes."""
+    try:
+        return filecmp.cmp(tmp_path, output, shallow=False)
+    except FileNotFoundError:
+        return False
+
+
+def _same_spooled(spool: TextIO, output: Path, buffer_size: int) -> bool:
+    """Compare the spooled rendering with the output file block by block."""
+    try:
+        with open(output, encoding="utf-8", newline="") as f:
+            while True:
+                block = spool.read(buffer_size)
+                if f.read(buffer_size) != block:
+                    return False
+                if not block:
+                    return True
+    except (FileNotFoundError, UnicodeDecodeError):
+        return False
+
+
+def _copy_mode(output: Path, tmp_path: str):
+    """Give the temporary file the mode and owner of the output it replaces."""
+    try:
+        output_stat = os.stat(output)
+    except FileNotFoundError:
+        return
+    os.chmod(tmp_path, stat.S_IMODE(output_stat.st_mode))
+    try:
+        os.chown(tmp_path, output_stat.st_uid, output_stat.st_gid)
+    except PermissionError:
+        # only the superuser can give a file away
+        pass
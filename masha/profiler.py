@@ -0,0 +1,305 @@
+"""
+Per-stage time, memory and count profile of a masha run.
+
+While a `Profile` is active (see `profiling`), the pipeline stages run in
+`stage` blocks, each recording its wall and CPU time and the peak memory
+allocated while it ran, as traced by `tracemalloc`, and the stages add their
+counts with `count`: files loaded, placeholders resolved, config values
+rendered, filter and test calls, configs validated and characters
+written. Some values, such as the dependency levels of the config values, are
+recorded with `count_max` as the largest one seen instead. Without an active
+profile, `stage` and `count` cost next to nothing.
+
+Tasks of worker processes run with `run_profiled`, recording a profile of their
+own that is returned with their result; the parent adds it to its profile with
+`merge_profiled`, the times of a stage summed over the processes.
+
+The profile is written as JSON; optionally, a full `cProfile` of the run is
+dumped too, for `pstats` or `snakeviz`.
+"""
+
+import contextlib
+import cProfile
+import functools
+import json
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+# pylint: disable=W1203
+from masha.logger_factory import create_logger
+
+logger = create_logger("masha")
+
+
+class Profile:
+    """The stages and counts recorded during a run."""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, float]] = {}
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.maxima: Dict[str, int] = {}
+        self._start = (time.perf_counter(), time.process_time())
+        # stages reset the peak of tracemalloc, the overall one is kept here
+        self._peak = 0
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Record the time and peak memory of the block as stage `name`."""
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, _empty_stage())
+            entry["wall_seconds"] += time.perf_counter() - wall
+            entry["cpu_seconds"] += time.process_time() - cpu
+            peak = tracemalloc.get_traced_memory()[1]
+            self._peak = max(self._peak, peak)
+            entry["peak_bytes"] = max(entry["peak_bytes"], peak - base)
+            entry["runs"] += 1
+
+    def recorded(self) -> Dict[str, Any]:
+        """Return the stages, counts and maxima, for `merge`."""
+        return {
+            "stages": self.stages,
+            "counts": dict(self.counts),
+            "maxima": self.maxima,
+            "peak_bytes": max(self._peak, tracemalloc.get_traced_memory()[1]),
+        }
+
+    def merge(self, recorded: Dict[str, Any]):
+        """
+        Add what another profile recorded, e.g. in a worker process.
+
+        Args:
+            recorded (Dict[str, Any]): The `recorded` dict of the other profile.
+        """
+        for name, other in recorded["stages"].items():
+            entry = self.stages.setdefault(name, _empty_stage())
+            for key, value in other.items():
+                if key == "peak_bytes":
+                    entry[key] = max(entry[key], value)
+                else:
+                    entry[key] += value
+        for name, value in recorded["counts"].items():
+            self.counts[name] += value
+        for name, value in recorded["maxima"].items():
+            self.maxima[name] = max(self.maxima.get(name, value), value)
+        self._peak = max(self._peak, recorded["peak_bytes"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Return the profile as a JSON-serializable dict.
+
+        Returns:
+            Dict[str, Any]: The totals, the stages in the order they first ran
+                            and the counts.
+        """
+        wall, cpu = self._start
+        return {
+            "total": {
+                "wall_seconds": time.perf_counter() - wall,
+                "cpu_seconds": time.process_time() - cpu,
+                "peak_bytes": max(
+                    self._peak, tracemalloc.get_traced_memory()[1]
+                ),
+            },
+            "stages": self.stages,
+            "counts": dict(sorted((self.counts | self.maxima).items())),
+        }
+
+
+def _empty_stage() -> Dict[str, float]:
+    return {
+        "wall_seconds": 0.0,
+        "cpu_seconds": 0.0,
+        "peak_bytes": 0,
+        "runs": 0,
+    }
+
+
+_active: Optional[Profile] = None
+
+
+def is_active() -> bool:
+    """Whether a profile is being recorded."""
+    return _active is not None
+
+
+def stage(name: str) -> contextlib.AbstractContextManager:
+    """
+    Record the block as a stage of the active profile, if any.
+
+    Args:
+        name (str): The stage name.
+
+    Returns:
+        contextlib.AbstractContextManager: The context manager to run the stage in.
+    """
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
+
+
+def count(name: str, value: int = 1):
+    """
+    Add `value` to a count of the active profile, if any.
+
+    Args:
+        name (str): The count name.
+        value (int, optional): The value to add. Defaults to 1.
+    """
+    if _active is not None:
+        _active.counts[name] += value
+
+
+def count_max(name: str, value: int):
+    """
+    Record `value` as a count of the active profile, if any, keeping the largest.
+
+    Args:
+        name (str): The count name.
+        value (int): The value seen.
+    """
+    if _active is not None:
+        _active.maxima[name] = max(_active.maxima.get(name, value), value)
+
+
+def run_profiled(
+    function: Callable, enabled: bool, *args
+) -> Tuple[Any, Optional[Dict[str, Any]]]:
+    """
+    Run a task of a worker process, recording a profile of its own.
+
+    Forked workers inherit a copy of the parent's profile, whose records would
+    be lost with the worker, and spawned ones have none.
+
+    Args:
+        function (Callable): The task.
+        enabled (bool): Whether the parent is profiling, see `is_active`.
+        *args: The arguments of the task.
+
+    Returns:
+        Tuple[Any, Optional[Dict[str, Any]]]: The result of the task and the
+                            profile recorded, None when not `enabled`.
+    """
+    # pylint: disable=W0603
+    global _active
+    if not enabled:
+        return function(*args), None
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    _active = Profile()
+    try:
+        return function(*args), _active.recorded()
+    finally:
+        _active = None
+        if not tracing:
+            tracemalloc.stop()
+
+
+def merge_profiled(
+    results: Iterable[Tuple[Any, Optional[Dict[str, Any]]]],
+) -> List[Any]:
+    """
+    Add the profiles of `run_profiled` tasks to the active profile, if any.
+
+    Args:
+        results (Iterable[Tuple[Any, Optional[Dict[str, Any]]]]): The results of
+                            the tasks, with their profiles.
+
+    Returns:
+        List[Any]: The results of the tasks, in their order.
+    """
+    merged = []
+    for result, recorded in results:
+        if _active is not None and recorded is not None:
+            _active.merge(recorded)
+        merged.append(result)
+    return merged
+
+
+def counting(function: Callable, name: str) -> Callable:
+    """
+    Wrap a Jinja2 filter or test to count its calls as `name`.
+
+    The wrapper keeps the attributes Jinja2 reads, e.g. of `pass_context`.
+
+    Args:
+        function (Callable): The filter or test.
+        name (str): The count name.
+
+    Returns:
+        Callable: The counting function.
+    """
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        count(name)
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def profiling(
+    profile_file: str = None, cprofile_file: str = None
+) -> Iterator[None]:
+    """
+    Profile the block, writing the profile when it exits, even by an exception.
+
+    Args:
+        profile_file (str, optional): Where to write the JSON profile, "-" for
+                            stderr. Defaults to None, recording no profile.
+        cprofile_file (str, optional): Where to dump the `cProfile` statistics.
+                            Defaults to None.
+    """
+    # pylint: disable=W0603
+    global _active
+    if not (profile_file or cprofile_file):
+        yield
+        return
+    profiler = cProfile.Profile() if cprofile_file else None
+    tracing = tracemalloc.is_tracing()
+    if profile_file:
+        if not tracing:
+            tracemalloc.start()
+        _active = Profile()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile_file)
+            logger.info(f"cProfile statistics written to {cprofile_file}")
+        if profile_file:
+            _write_profile(_active.to_dict(), profile_file)
+            _active = None
+            if not tracing:
+                tracemalloc.stop()
+
+
+def _write_profile(profile: Dict[str, Any], profile_file: str):
+    text = json.dumps(profile, indent=2)
+    if str(profile_file) == "-":
+        sys.stderr.write(text + "\n")
+        return
+    with open(profile_file, "w", encoding="utf-8") as f:
+        f.write(text + "\n")
+    logger.info(f"Profile written to {profile_file}")
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Long-running render daemon answering `masha` command lines over a Unix socket.
+
+`masha-serve` accepts the requests sent by `masha-client` (see `masha.client`)
+one at a time. Each request carries the arguments of `masha.cli.main`, the
+client's working directory and environment; the response carries the exit code,
+what was printed to stdout, such as an output or a report written to `-`, and
+separately the logs and everything printed to stderr.
+
+Plain renders of one input template keep a `RenderSession` per set of variable
+files, filters, tests and model, so parsed configs, loaded filters, the model
+class and compiled templates stay hot between requests. Sessions are invalidated
+stage by stage when their input files change and evicted least recently used
+first once their configurations use more than the configured memory.
+"""
+
+import contextlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List
+
+import click
+from returns.result import Failure, Success
+
+# pylint: disable=W1203
+from masha import cli
+from masha.async_render import set_async_concurrency
+from masha.bytecode_cache import get_disk_cache
+from masha.client import default_socket_path
+from masha.logger_factory import configure_logging, create_logger
+from masha.output_writer import is_stdout
+from masha.template_cache import set_template_cache_size
+from masha.watcher import RenderSession
+
+logger = create_logger("masha")
+
+DEFAULT_MAX_MEMORY = 512 * 1024 * 1024
+
+
+class SessionCache:
+    """
+    Least-recently-used render sessions, bounded by their approximate memory.
+
+    Args:
+        max_bytes (int, optional): The memory above which the least recently used
+                                   sessions are evicted. Defaults to
+                                   `DEFAULT_MAX_MEMORY`.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_MEMORY):
+        self.max_bytes = max_bytes
+        self._sessions = OrderedDict()
+
+    def get(self, params: Dict[str, Any]) -> RenderSession:
+        """
+        Return the session for the inputs of a parsed `masha` command line.
+
+        Args:
+            params (Dict[str, Any]): The parameters of `masha.cli.main`, with
+                                     absolute paths.
+
+        Returns:
+            RenderSession: The cached or a new session.
+        """
+        key = (
+            tuple(params["variables"]),
+            params["template_filters_directory"],
+            params["template_tests_directory"],
+            params["model_file"],
+            params["class_model"],
+            params["cache_dir"],
+            params["deep_merge"],
+            params["enable_async"],
+        )
+        if key in self._sessions:
+            self._sessions.move_to_end(key)
+            return self._sessions[key][0]
+        session = RenderSession(*key)
+        self._sessions[key] = (session, 0)
+        return session
+
+    def update_size(self, session: RenderSession):
+        """
+        Account for the memory used by `session` and evict sessions if needed.
+
+        Args:
+            session (RenderSession): The session that has just been used.
+        """
+        total = 0
+        for key, (cached, size) in self._sessions.items():
+            if cached is session:
+                size = session.approximate_size()
+                self._sessions[key] = (cached, size)
+            total += size
+        while total > self.max_bytes and len(self._sessions) > 1:
+            key, (_, size) = self._sessions.popitem(last=False)
+            logger.info(f"Evicted render session of {key[0]}")
+            total -= size
+
+
+def _absolute(params: Dict[str, Any], cwd: str) -> Dict[str, Any]:
+    """Make the path parameters of a command line absolute."""
+    params = dict(params)
+    for name, value in params.items():
+        # `-` stands for stdout, not for a file in the client's directory
+        if isinstance(value, Path) and not is_stdout(value):
+            params[name] = Path(cwd) / value
+    params["variables"] = tuple(
+        Path(cwd) / path for path in params["variables"]
+    )
+    return params
+
+
+def run_command(argv: List[str], cwd: str, sessions: SessionCache) -> int:
+    """
+    Run a `masha` command line, rendering single templates with a hot session.
+
+    Args:
+        argv (List[str]): The arguments of `masha.cli.main`.
+        cwd (str): The client's working directory.
+        sessions (SessionCache): The hot render sessions.
+
+    Returns:
+        int: The exit code of the command.
+    """
+    try:
+        ctx = cli.main.make_context("masha", list(argv))
+    except click.exceptions.Exit as e:
+        return e.exit_code
+    except click.ClickException as e:
+        e.show()
+        return e.exit_code
+
+    params = _absolute(ctx.params, cwd)
+    if params["watch"]:
+        click.echo("Error: --watch is not supported by masha-serve.", err=True)
+        return 2
+    if (
+        params["manifest"]
+        or params["matrix"]
+        or params["template_dir"]
+        or params["output_dir"]
+    ):
+        try:
+            with ctx:
+                cli.main.invoke(ctx)
+        except SystemExit as e:
+            return e.code or 0
+        except click.ClickException as e:
+            e.show()
+            return e.exit_code
+        return 0
+
+    if params["input_file"] is None or params["output"] is None:
+        click.echo(
+            "Error: INPUT_FILE and --output are required unless --manifest or "
+            "--template-dir is given.",
+            err=True,
+        )
+        return 2
+    configure_logging(
+        "ERROR" if params["quiet"] else params["log_level"],
+        params["log_format"],
+    )
+    set_template_cache_size(params["template_cache_size"])
+    set_async_concurrency(params["async_concurrency"])
+    if params["cache_dir"]:
+        get_disk_cache(params["cache_dir"], params["cache_max_size"] << 20)
+    session = sessions.get(params)
+    try:
+        match session.render(
+            params["input_file"], params["output"], params["only_if_changed"]
+        ):
+            case Success(_):
+                logger.info("Command run successfully")
+                return 0
+            case Failure(value):
+                logger.error(f"Command failed with error {value}")
+                return 1
+    finally:
+        sessions.update_size(session)
+    return 1
+
+
+@contextlib.contextmanager
+def _client_context(
+    cwd: str, env: Dict[str, str], stdout: io.StringIO, stderr: io.StringIO
+):
+    """
+    Run in the client's directory and environment, capturing stdout, and the
+    logs with stderr.
+    """
+    saved_cwd = os.getcwd()
+    saved_env = dict(os.environ)
+    handlers = {
+        handler
+        for name in (None, "masha")
+        for handler in logging.getLogger(name).handlers
+        if isinstance(handler, logging.StreamHandler)
+    }
+    streams = {handler: handler.stream for handler in handlers}
+    for handler in handlers:
+        handler.setStream(stderr)
+    try:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        with (
+            contextlib.redirect_stdout(stdout),
+            contextlib.redirect_stderr(stderr),
+        ):
+            yield
+    finally:
+        for handler, stream in streams.items():
+            handler.setStream(stream)
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handles one request of a `masha-client`."""
+
+    def handle(self):
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        try:
+            request = json.loads(self.rfile.readline())
+            with _client_context(
+                request["cwd"], request["env"], stdout, stderr
+            ):
+                exit_code = run_command(
+                    request["argv"], request["cwd"], self.server.sessions
+                )
+        # pylint: disable=W0718
+        except Exception as e:
+            stderr.write(f"masha-serve failed to handle the request: {e}\n")
+            exit_code = 1
+        response = {
+            "exit_code": exit_code,
+            "stdout": stdout.getvalue(),
+            "stderr": stderr.getvalue(),
+        }
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+
+class RenderServer(socketserver.UnixStreamServer):
+    """
+    Unix socket server handling `masha-client` requests one at a time.
+
+    Args:
+        socket_path (str): The path of the socket to listen on.
+        max_bytes (int, optional): Memory limit of the hot render sessions.
+                                   Defaults to `DEFAULT_MAX_MEMORY`.
+    """
+
+    def __init__(self, socket_path: str, max_bytes: int = DEFAULT_MAX_MEMORY):
+        self.sessions = SessionCache(max_bytes)
+        _remove_stale_socket(socket_path)
+        umask = os.umask(0o177)  # only the owner may connect
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        with contextlib.suppress(OSError):
+            os.unlink(self.server_address)
+
+
+def _remove_stale_socket(socket_path: str):
+    """Remove a socket left behind by a daemon which is no longer running."""
+    if not os.path.exists(socket_path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except OSError:
+            os.unlink(socket_path)
+            return
+    raise OSError(f"A masha daemon is already listening on {socket_path}")
+
+
+@click.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Unix socket to listen on (default: $MASHA_SOCKET or a per-user path).",
+)
+@click.option(
+    "--max-memory",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_MEMORY >> 20,
+    show_default=True,
+    help="MiB of cached configurations above which old sessions are evicted.",
+)
+def serve(socket_path: str, max_memory: int):
+    """
+    Serve masha renders for masha-client over a Unix domain socket.
+    """
+    socket_path = socket_path or default_socket_path()
+    try:
+        server = RenderServer(socket_path, max_memory << 20)
+    except OSError as e:
+        logger.error(f"Failed to start the server: {e}")
+        sys.exit(1)
+    logger.info(f"Listening on {socket_path}")
+    # exit cleanly, removing the socket, when terminated
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Stopped serving")
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,186 @@
+"""
+In-process LRU cache of compiled Jinja2 templates.
+
+Config-string templates are keyed by their source text, together with the
+environment settings that affect how that text is compiled, so that a value
+seen before is never parsed or compiled again within the same process.
+"""
+
+import weakref
+from collections import OrderedDict, namedtuple
+from typing import Any, Callable, Dict, Hashable
+
+import jinja2
+
+from masha.function_registry import LazyFunctions, pass_arg
+
+DEFAULT_CACHE_SIZE = 2048
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+# environment -> (identity and size of its filters and tests, their key)
+_functions_keys = weakref.WeakKeyDictionary()
+
+
+def functions_key(functions: Dict[str, Any]) -> tuple:
+    """
+    Return the names and pass arguments of Jinja2 filters or tests.
+
+    The custom functions of a `LazyFunctions` mapping are not loaded, the
+    fingerprint of their registry stands for them.
+
+    Args:
+        functions (Dict[str, Any]): The filters or tests of an environment.
+
+    Returns:
+        tuple: A hashable summary of the functions.
+    """
+    if isinstance(functions, LazyFunctions):
+        return functions.fingerprint()
+    return tuple(
+        sorted(
+            (name, pass_arg(function)) for name, function in functions.items()
+        )
+    )
+
+
+def _environment_functions_key(env: jinja2.Environment) -> tuple:
+    """
+    Return the key of the filters and tests of `env`, computed once. Filters or
+    tests replaced in place, keeping their number, are not noticed.
+    """
+    state = (id(env.filters), len(env.filters), id(env.tests), len(env.tests))
+    cached = _functions_keys.get(env)
+    if cached is None or cached[0] != state:
+        cached = (
+            state,
+            (functions_key(env.filters), functions_key(env.tests)),
+        )
+        _functions_keys[env] = cached
+    return cached[1]
+
+
+def environment_key(env: jinja2.Environment) -> tuple:
+    """
+    Return the settings of `env` that change the code a template compiles to.
+
+    The compiled code calls every filter and test by name with its pass argument
+    (`jinja2.pass_context`, `pass_eval_context` or `pass_environment`), and
+    compiling fails on unknown ones, so the names and pass arguments of the
+    filters and tests are part of the key, see `functions_key`.
+
+    Args:
+        env (jinja2.Environment): The environment templates are compiled with.
+
+    Returns:
+        tuple: A hashable summary of the compile-relevant settings.
+    """
+    return (
+        env.block_start_string,
+        env.block_end_string,
+        env.variable_start_string,
+        env.variable_end_string,
+        env.comment_start_string,
+        env.comment_end_string,
+        env.line_statement_prefix,
+        env.line_comment_prefix,
+        env.trim_blocks,
+        env.lstrip_blocks,
+        env.newline_sequence,
+        env.keep_trailing_newline,
+        env.autoescape,
+        env.optimized,
+        env.is_async,
+        tuple(sorted(env.extensions)),
+        _environment_functions_key(env),
+    )
+
+
+class TemplateCache:
+    """
+    A least-recently-used cache with hit/miss counters.
+
+    Args:
+        maxsize (int, optional): Maximum number of entries kept, 0 disables the
+                                 cache. Defaults to `DEFAULT_CACHE_SIZE`.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """
+        Return the entry for `key`, creating it with `factory()` on a miss.
+
+        Args:
+            key (Hashable): The cache key.
+            factory (Callable[[], Any]): Builds the entry when it is not cached.
+
+        Returns:
+            Any: The cached or newly created entry.
+        """
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            value = factory()
+            if self.maxsize > 0:
+                self._entries[key] = value
+                self._evict()
+            return value
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def resize(self, maxsize: int):
+        """
+        Change the maximum number of entries, evicting the oldest if needed.
+
+        Args:
+            maxsize (int): The new maximum number of entries.
+        """
+        self.maxsize = maxsize
+        self._evict()
+
+    def cache_info(self) -> CacheInfo:
+        """Return the hit/miss counters and the current size of the cache."""
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self))
+
+    def cache_clear(self):
+        """Remove all entries and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self):
+        while len(self._entries) > max(self.maxsize, 0):
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_default_cache = TemplateCache()
+
+
+def get_template_cache() -> TemplateCache:
+    """Return the process-wide cache used for config-string templates."""
+    return _default_cache
+
+
+def set_template_cache_size(maxsize: int):
+    """
+    Resize the process-wide config-string template cache.
+
+    Args:
+        maxsize (int): The new maximum number of entries, 0 disables the cache.
+    """
+    _default_cache.resize(maxsize)
+
+
+def template_cache_info() -> CacheInfo:
+    """Return the hit/miss counters of the process-wide template cache."""
+    return _default_cache.cache_info()
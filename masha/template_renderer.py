@@ -4,42 +4,58 @@
 Render jinja2 template defined in configuration
 """
 
-import importlib.util
 import os
 from pathlib import Path
+from typing import Any, Dict, Iterable, Union
 
 import jinja2
 
 # pylint: disable=W1203
+from masha.async_render import limit_concurrency, limit_functions
+from masha.bytecode_cache import get_disk_cache
+from masha.function_registry import (
+    FunctionRegistry,
+    LazyFunctions,
+    load_module_functions,
+)
 from masha.logger_factory import create_logger
+from masha.profiler import count, counting, is_active
+from masha.template_cache import get_template_cache
+from masha.template_resolver import (
+    MAX_PASSES,
+    KeyPath,
+    compile_cached,
+    format_key_path,
+    has_template_syntax,
+    iter_string_leaves,
+    required_paths,
+    resolve_templates,
+    select_paths,
+)
 
 logger = create_logger("masha")
 
+# custom filters or tests: loaded functions by name, or a registry loading them
+# when first used
+Functions = Union[Dict[str, Any], FunctionRegistry]
+
 
 def load_functions_from_file(file: str):
-    """Loads all Python functions from a given file.
+    """Loads the Python functions defined in a given file.
+
+    The file is only executed again if it changed since it was last loaded, see
+    `masha.function_registry.load_module_functions`.
 
     Args:
         file (str): The path to the Python file from which to load functions.
 
     Returns:
         dict: A dictionary containing function names as keys and their corresponding
-              callable objects as values.
+              callable objects as values. Callables imported by the file are left out.
     """
-    functions = {}
     if os.path.exists(file) and file.endswith(".py"):
-        module_name = file[:-3]  # Remove '.py' extension
-        spec = importlib.util.spec_from_file_location(module_name, file)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-
-        for attr_name in dir(module):
-            attr = getattr(module, attr_name)
-            if callable(attr) and not attr_name.startswith(
-                "_"
-            ):  # Only include functions
-                functions[attr_name] = attr
-    return functions
+        return dict(load_module_functions(Path(file)))
+    return {}
 
 
 def load_functions_from_directory(directory: str):
@@ -52,12 +68,7 @@ def load_functions_from_directory(directory: str):
         dict: A dictionary containing filter names as keys and their corresponding callable
               objects as values.
     """
-    fxns = {}
-    if os.path.exists(directory):
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
-            fxns.update(load_functions_from_file(file_path))
-    return fxns
+    return FunctionRegistry(Path(directory)).load_all()
 
 
 def render_templates_with_filters(
@@ -65,47 +76,293 @@ def render_templates_with_filters(
     filters_directory: str = None,
     tests_directory: str = None,
     max_iterations=10,
+    cache_dir: str = None,
+    enable_async: bool = False,
 ) -> dict:
     """
     Renders templates in a dictionary using Jinja2, applying custom filters and tests.
 
+    Every templated value is rendered after the values it references (see
+    `masha.template_resolver.resolve_templates`). Compiled templates are kept in
+    the process-wide cache of `masha.template_cache`.
+
     Args:
         input_dict (dict): The dictionary containing the template strings to be rendered.
         filters_directory (str, optional): Path to the directory containing custom filters.
                                            Defaults to None.
         tests_directory (str, optional): Path to the directory containing custom tests.
                                          Defaults to None.
-        max_iterations (int, optional): Maximum number of iterations for rendering. Defaults to 10.
+        max_iterations (int, optional): Maximum number of passes, rendering again
+                                        the values rendered to new templates.
+                                        Defaults to 10.
+        cache_dir (str, optional): Directory of the persistent compiled-template
+                                   cache. Defaults to None, not persisting them.
+        enable_async (bool, optional): Render with an async environment, running
+                                   the coroutine filters and tests of independent
+                                   values concurrently. Defaults to False.
+
+    Returns:
+        dict: The dictionary with rendered template strings.
+
+    Raises:
+        TemplateCycleError: If templated values reference each other in a cycle.
+    """
+    return render_templates_with_functions(
+        input_dict,
+        (
+            FunctionRegistry(Path(filters_directory))
+            if filters_directory
+            else None
+        ),
+        FunctionRegistry(Path(tests_directory)) if tests_directory else None,
+        cache_dir,
+        enable_async,
+        max_iterations,
+    )
+
+
+def render_templates_with_functions(
+    input_dict: dict,
+    filters: Functions = None,
+    tests: Functions = None,
+    cache_dir: str = None,
+    enable_async: bool = False,
+    max_passes: int = MAX_PASSES,
+) -> dict:
+    """
+    Renders templates in a dictionary using Jinja2 with given filters and tests.
+
+    Args:
+        input_dict (dict): The dictionary containing the template strings to be rendered.
+        filters (Functions, optional): Custom filters, as returned by
+                                  `load_functions_from_directory`, or a
+                                  `FunctionRegistry` loading the used ones.
+                                  Defaults to None.
+        tests (Functions, optional): Custom tests, as returned by
+                                `load_functions_from_directory`, or a
+                                `FunctionRegistry` loading the used ones.
+                                Defaults to None.
+        cache_dir (str, optional): Directory of the persistent compiled-template
+                                   cache. Defaults to None, not persisting them.
+        enable_async (bool, optional): Render with an async environment, running
+                                   the coroutine filters and tests of independent
+                                   values concurrently. Defaults to False.
+        max_passes (int, optional): Maximum number of passes, rendering again the
+                                   values rendered to new templates. Defaults
+                                   to `masha.template_resolver.MAX_PASSES`.
 
     Returns:
         dict: The dictionary with rendered template strings.
+
+    Raises:
+        TemplateCycleError: If templated values reference each other in a cycle.
     """
-    env = jinja2.Environment()
-    if filters_directory:
-        filters = load_functions_from_directory(filters_directory)
-        env.filters.update(filters)  # Add custom filters
-    if tests_directory:
-        tests = load_functions_from_directory(tests_directory)
-        env.tests.update(tests)
-
-    rendered_dict = input_dict.copy()
-
-    def recursive_render(value):
-        if isinstance(value, dict):
-            return {k: recursive_render(v) for k, v in value.items()}
-        if isinstance(value, str):
-            template = env.from_string(value)
-            return template.render(rendered_dict)
-        return value
-
-    for _ in range(max_iterations):
-        new_dict = recursive_render(rendered_dict)
-        if new_dict == rendered_dict:
-            break
-        rendered_dict = new_dict
+    env = create_value_environment(filters, tests, cache_dir, enable_async)
+    rendered_dict = resolve_templates(
+        input_dict, env, get_template_cache(), max_passes
+    )
+    if env.bytecode_cache is not None:
+        env.bytecode_cache.prune()
+    logger.debug(f"template cache: {get_template_cache().cache_info()}")
     return rendered_dict
 
 
+def select_required_config(
+    input_dict: dict,
+    roots: Iterable[KeyPath],
+    filters: Functions = None,
+    tests: Functions = None,
+    cache_dir: str = None,
+    enable_async: bool = False,
+) -> dict:
+    """
+    Select the part of a configuration needed to render the values at `roots`.
+
+    See `masha.template_resolver.required_paths`. The templated values compiled
+    to find their references are kept in the template cache, so rendering the
+    selected configuration does not compile them again.
+
+    Args:
+        input_dict (dict): The configuration, with its environment placeholders
+                           not resolved yet.
+        roots (Iterable[KeyPath]): The key paths read, e.g. by an input template.
+        filters (Functions, optional): Custom filters, needed to compile the values
+                                  using them. Defaults to None.
+        tests (Functions, optional): Custom tests, needed to compile the values
+                                using them. Defaults to None.
+        cache_dir (str, optional): Directory of the persistent compiled-template
+                                   cache. Defaults to None, not persisting them.
+        enable_async (bool, optional): Compile for an async environment.
+                                   Defaults to False.
+
+    Returns:
+        dict: The configuration holding only the required values, shared with
+              `input_dict`.
+    """
+    env = create_value_environment(filters, tests, cache_dir, enable_async)
+    paths = required_paths(input_dict, env, roots, get_template_cache())
+    logger.debug(
+        f"Selected config keys: {sorted(map(format_key_path, paths))}"
+    )
+    count("config_keys_selected", len(paths))
+    return select_paths(input_dict, paths)
+
+
+def compile_config_templates(
+    configs: Iterable[dict],
+    filters: Functions = None,
+    tests: Functions = None,
+    cache_dir: str = None,
+    enable_async: bool = False,
+) -> int:
+    """
+    Compile the templated values of configurations into the template cache.
+
+    Compiling the values of variable files shared by several renders once, e.g.
+    before forking worker processes, spares every render compiling them again.
+    Values failing to compile are skipped, they fail when rendered.
+
+    Args:
+        configs (Iterable[dict]): The configurations, e.g. loaded variable files.
+        filters (Functions, optional): Custom filters, needed to compile the values
+                                  using them. Defaults to None.
+        tests (Functions, optional): Custom tests, needed to compile the values
+                                using them. Defaults to None.
+        cache_dir (str, optional): Directory of the persistent compiled-template
+                                   cache. Defaults to None, not persisting them.
+        enable_async (bool, optional): Compile for an async environment.
+                                   Defaults to False.
+
+    Returns:
+        int: The number of templated values compiled or found in the cache.
+    """
+    env = create_value_environment(filters, tests, cache_dir, enable_async)
+    cache = get_template_cache()
+    compiled = 0
+    for config in configs:
+        if not isinstance(config, dict):
+            continue
+        for _, value in iter_string_leaves(config):
+            if not has_template_syntax(env, value):
+                continue
+            try:
+                compile_cached(env, value, cache)
+                compiled += 1
+            except jinja2.TemplateError:
+                continue
+    if env.bytecode_cache is not None:
+        env.bytecode_cache.prune()
+    return compiled
+
+
+def create_value_environment(
+    filters: Functions = None,
+    tests: Functions = None,
+    cache_dir: str = None,
+    enable_async: bool = False,
+) -> jinja2.Environment:
+    """
+    Create the Jinja2 environment used to render templated config values.
+
+    Args:
+        filters (Functions, optional): Custom Jinja2 filters, or a `FunctionRegistry`
+                            loading the ones the values use. Defaults to None.
+        tests (Functions, optional): Custom Jinja2 tests, or a `FunctionRegistry`
+                            loading the ones the values use. Defaults to None.
+        cache_dir (str, optional): The directory of the persistent compiled-template
+                            cache. Defaults to None.
+        enable_async (bool, optional): Create an async environment, awaiting
+                            coroutine filters and tests. Defaults to False.
+
+    Returns:
+        jinja2.Environment: The configured environment.
+    """
+    env = jinja2.Environment(
+        bytecode_cache=get_disk_cache(cache_dir) if cache_dir else None,
+        enable_async=enable_async,
+    )
+    _add_functions(env, filters, tests)
+    return env
+
+
+def create_jinja_environment(
+    search_path: Path,
+    filters: Functions = None,
+    tests: Functions = None,
+    cache_dir: Path = None,
+    enable_async: bool = False,
+) -> jinja2.Environment:
+    """
+    Create the Jinja2 environment used to render input templates.
+
+    Args:
+        search_path (Path): The directory the templates are loaded from.
+        filters (Functions, optional): Custom Jinja2 filters, or a `FunctionRegistry`
+                            loading the ones the templates use. Defaults to None.
+        tests (Functions, optional): Custom Jinja2 tests, or a `FunctionRegistry`
+                            loading the ones the templates use. Defaults to None.
+        cache_dir (Path, optional): The directory of the persistent compiled-template
+                            cache. Defaults to None.
+        enable_async (bool, optional): Create an async environment, awaiting
+                            coroutine filters and tests. Defaults to False.
+
+    Returns:
+        jinja2.Environment: The configured environment.
+    """
+    jenv = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(search_path),
+        bytecode_cache=get_disk_cache(cache_dir) if cache_dir else None,
+        enable_async=enable_async,
+    )
+    _add_functions(jenv, filters, tests)
+    return jenv
+
+
+def _add_functions(
+    env: jinja2.Environment, filters: Functions, tests: Functions
+):
+    """
+    Add custom filters and tests, limiting coroutine ones in async mode and
+    counting the calls of all of them while profiling.
+    """
+    env.filters = _with_custom(
+        env.filters, filters, env.is_async, "filter_calls"
+    )
+    env.tests = _with_custom(env.tests, tests, env.is_async, "test_calls")
+
+
+def _with_custom(
+    builtins: dict, functions: Functions, is_async: bool, counter: str
+) -> dict:
+    profiling = is_active()
+    if profiling:
+        builtins = {
+            name: counting(function, counter)
+            for name, function in builtins.items()
+        }
+
+    def wrap(function):
+        if is_async:
+            function = limit_concurrency(function)
+        return counting(function, counter) if profiling else function
+
+    if isinstance(functions, FunctionRegistry):
+        # loads the custom functions the templates use on first lookup
+        return LazyFunctions(
+            builtins, functions, wrap if is_async or profiling else None
+        )
+    if functions:
+        if is_async:
+            functions = limit_functions(functions)
+        if profiling:
+            functions = {
+                name: counting(function, counter)
+                for name, function in functions.items()
+            }
+        builtins.update(functions)
+    return builtins
+
+
 def main():
     """main function to test this module"""
     inp = {
@@ -0,0 +1,756 @@
+#!/usr/bin/env python3
+
+"""
+Resolve templated configuration values in dependency order.
+
+Every templated string value of the configuration is parsed into a Jinja2 AST
+once, the variables it references are mapped back onto key paths of the
+configuration and each value is then rendered exactly once, in topological order
+of the resulting dependency graph. Plain strings never go through Jinja2.
+
+Values calling filters, tests or globals that receive the context may read any
+value, so they are rendered after all the others. Values whose rendered text is
+a template again are rendered once more, as long as that changes them.
+
+With an async environment, every value is rendered as soon as the values it
+references are, so the coroutine filters of independent values run concurrently.
+"""
+
+import asyncio
+import inspect
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+import jinja2
+from jinja2 import meta, nodes
+from jinja2.defaults import DEFAULT_FILTERS, DEFAULT_TESTS
+
+# pylint: disable=W1203
+from masha.async_render import run_async
+from masha.config_overlay import MAPPING_TYPES, shallow_copy
+from masha.function_registry import pass_arg
+from masha.logger_factory import create_logger
+from masha.profiler import count, count_max, is_active
+from masha.template_cache import TemplateCache, environment_key
+
+logger = create_logger("masha")
+
+KeyPath = Tuple[Any, ...]
+
+# the key path of the whole configuration, referenced by the values calling
+# filters, tests or globals that receive the context
+WHOLE_CONFIG: KeyPath = ()
+
+# the passes rendering values whose rendered text is a template again
+MAX_PASSES = 10
+
+_VISITING = 1
+_DONE = 2
+
+# built-in filters and tests calling others by name, e.g. ``map("lookup")``
+_DISPATCHING = frozenset(
+    {"map", "select", "reject", "selectattr", "rejectattr"}
+)
+
+
+class TemplateCycleError(ValueError):
+    """
+    Raised when templated configuration values reference each other in a cycle.
+
+    Attributes:
+        cycle (List[KeyPath]): The key paths forming the cycle, the first key path
+                               being repeated at the end.
+    """
+
+    def __init__(self, cycle: List[KeyPath]):
+        self.cycle = cycle
+        super().__init__(
+            "Cyclic reference between templated config values: "
+            + " -> ".join(format_key_path(path) for path in cycle)
+        )
+
+
+def format_key_path(path: KeyPath) -> str:
+    """
+    Format a key path as a dotted string, e.g. ``("c", "d")`` -> ``"c.d"``.
+
+    Args:
+        path (KeyPath): The key path to format.
+
+    Returns:
+        str: The dotted representation of the key path.
+    """
+    return ".".join(str(key) for key in path)
+
+
+def iter_string_leaves(
+    config: dict, prefix: KeyPath = ()
+) -> Iterator[Tuple[KeyPath, str]]:
+    """
+    Yield the key path and value of every string reachable through nested dicts.
+
+    Lists are not descended into, matching the values rendered by
+    `render_templates_with_filters`.
+
+    Args:
+        config (dict): The configuration to walk.
+        prefix (KeyPath, optional): Key path of `config` itself. Defaults to ().
+
+    Yields:
+        Tuple[KeyPath, str]: The key path of the string value and the value.
+    """
+    for key, value in config.items():
+        path = prefix + (key,)
+        if isinstance(value, MAPPING_TYPES):
+            yield from iter_string_leaves(value, path)
+        elif isinstance(value, str):
+            yield path, value
+
+
+def _constant_chain(node: nodes.Node):
+    """Return the key path of a ``name.attr['item']`` chain, or None."""
+    path = []
+    while True:
+        if isinstance(node, nodes.Getattr):
+            path.append(node.attr)
+            node = node.node
+        elif isinstance(node, nodes.Getitem) and isinstance(
+            node.arg, nodes.Const
+        ):
+            path.append(node.arg.value)
+            node = node.node
+        elif isinstance(node, nodes.Name):
+            path.append(node.name)
+            return tuple(reversed(path))
+        else:
+            return None
+
+
+def find_references(ast: nodes.Template) -> Set[KeyPath]:
+    """
+    Find the key paths a parsed template reads from its context.
+
+    Attribute and constant subscript accesses on undeclared variables are
+    followed, so ``{{ c.d }}`` references ``("c", "d")`` rather than the whole
+    of ``c``. Dynamic subscripts stop the chain at the last constant key, and
+    method calls at the object they are called on: ``{{ d.get('b') }}``
+    references ``("d",)``.
+
+    Args:
+        ast (nodes.Template): The template AST as returned by `Environment.parse`.
+
+    Returns:
+        Set[KeyPath]: The referenced key paths.
+    """
+    names = meta.find_undeclared_variables(ast)
+    references = set()
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, nodes.Call) and isinstance(
+            node.node, nodes.Getattr
+        ):
+            # the method is not a key, the call reads the object it belongs to
+            stack.append(node.node.node)
+            stack.extend(
+                arg
+                for arg in (
+                    *node.args,
+                    *node.kwargs,
+                    node.dyn_args,
+                    node.dyn_kwargs,
+                )
+                if arg is not None
+            )
+            continue
+        if isinstance(node, (nodes.Getattr, nodes.Getitem)):
+            chain = _constant_chain(node)
+            if chain is not None and chain[0] in names:
+                references.add(chain)
+                continue
+        elif isinstance(node, nodes.Name):
+            if node.ctx == "load" and node.name in names:
+                references.add((node.name,))
+            continue
+        stack.extend(node.iter_child_nodes())
+    return references
+
+
+def calls_context_functions(
+    jenv: jinja2.Environment, ast: nodes.Template
+) -> bool:
+    """
+    Tell whether a template calls custom functions receiving its context.
+
+    Such filters, tests or globals, decorated with `jinja2.pass_context` or
+    `jinja2.pass_eval_context`, may read any variable, e.g.
+    ``{{ "a" | lookup }}``. The built-in ones of Jinja2 are not counted.
+
+    Args:
+        jenv (jinja2.Environment): The environment holding the functions.
+        ast (nodes.Template): The template AST as returned by `Environment.parse`.
+
+    Returns:
+        bool: True if a custom function called by `ast` receives the context.
+    """
+    for node in ast.find_all(nodes.Call):
+        if isinstance(node.node, nodes.Name) and pass_arg(
+            jenv.globals.get(node.node.name)
+        ) in ("context", "eval_context"):
+            return True
+    for node in ast.find_all((nodes.Filter, nodes.Test)):
+        names = [node.name]
+        if node.name in _DISPATCHING:
+            names.extend(
+                arg.value
+                for arg in node.args
+                if isinstance(arg, nodes.Const) and isinstance(arg.value, str)
+            )
+        for name in names:
+            for functions, defaults in (
+                (jenv.filters, DEFAULT_FILTERS),
+                (jenv.tests, DEFAULT_TESTS),
+            ):
+                function = functions.get(name)
+                if pass_arg(function) not in ("context", "eval_context"):
+                    continue
+                default = defaults.get(name)
+                # profiling and async variants wrap the built-in functions
+                if default is None or inspect.unwrap(
+                    function
+                ) is not inspect.unwrap(default):
+                    return True
+    return False
+
+
+def reads_whole_context(jenv: jinja2.Environment, ast: nodes.Template) -> bool:
+    """
+    Tell whether a template may read any variable of its context.
+
+    Args:
+        jenv (jinja2.Environment): The environment holding the functions.
+        ast (nodes.Template): The template AST as returned by `Environment.parse`.
+
+    Returns:
+        bool: True if `ast` references the context itself or calls functions
+              receiving it, see `calls_context_functions`.
+    """
+    return ast.find(nodes.ContextReference) is not None or (
+        calls_context_functions(jenv, ast)
+    )
+
+
+def find_template_references(
+    jenv: jinja2.Environment, name: str
+) -> Optional[Set[KeyPath]]:
+    """
+    Find the key paths an input template and the templates it uses read.
+
+    The templates `name` includes, imports or extends are followed through the
+    loader of `jenv`, missing ones are skipped.
+
+    Args:
+        jenv (jinja2.Environment): The environment loading the templates.
+        name (str): The name of the template.
+
+    Returns:
+        Optional[Set[KeyPath]]: The referenced key paths, see `find_references`,
+                   or None if a template name is computed at render time or
+                   the whole context may be read (see `reads_whole_context`),
+                   so any key path may be read.
+    """
+    references = set()
+    seen = set()
+    pending = [name]
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        try:
+            source = jenv.loader.get_source(jenv, current)[0]
+        except jinja2.TemplateNotFound:
+            continue
+        ast = jenv.parse(source, current)
+        names = set(meta.find_referenced_templates(ast))
+        if None in names or reads_whole_context(jenv, ast):
+            return None
+        pending.extend(names)
+        references.update(find_references(ast))
+    return references
+
+
+class CompiledTemplate(NamedTuple):
+    """
+    The compiled code of a config-string template and its references, which
+    include `WHOLE_CONFIG` if it may read any value.
+    """
+
+    code: Any
+    references: Set[KeyPath]
+
+
+def has_template_syntax(env: jinja2.Environment, value: str) -> bool:
+    """
+    Check whether a string contains any Jinja2 markup for `env`.
+
+    Args:
+        env (jinja2.Environment): The environment whose delimiters are used.
+        value (str): The string to check.
+
+    Returns:
+        bool: False if rendering `value` cannot change it, True otherwise.
+    """
+    markers = (
+        env.variable_start_string,
+        env.block_start_string,
+        env.comment_start_string,
+        env.line_statement_prefix,
+        env.line_comment_prefix,
+    )
+    return any(marker and marker in value for marker in markers)
+
+
+def compile_source(env: jinja2.Environment, source: str) -> CompiledTemplate:
+    """
+    Parse and compile a config-string template.
+
+    If the bytecode cache of `env` is a `masha.bytecode_cache.DiskTemplateCache`,
+    the compiled code and references are loaded from and stored to it.
+
+    Args:
+        env (jinja2.Environment): The environment to compile with.
+        source (str): The template source.
+
+    Returns:
+        CompiledTemplate: The compiled code and the key paths it references.
+    """
+    disk_cache = env.bytecode_cache
+    if not hasattr(disk_cache, "get_string_bucket"):
+        ast = env.parse(source)
+        return CompiledTemplate(env.compile(ast), _value_references(env, ast))
+
+    bucket = disk_cache.get_string_bucket(env, source, environment_key(env))
+    if bucket.code is None:
+        ast = env.parse(source)
+        bucket.code = (env.compile(ast), tuple(_value_references(env, ast)))
+        disk_cache.set_bucket(bucket)
+    code, references = bucket.code
+    return CompiledTemplate(code, set(references))
+
+
+def _value_references(
+    env: jinja2.Environment, ast: nodes.Template
+) -> Set[KeyPath]:
+    """The references of a config-string template, see `CompiledTemplate`."""
+    references = find_references(ast)
+    if reads_whole_context(env, ast):
+        references.add(WHOLE_CONFIG)
+    return references
+
+
+def compile_cached(
+    env: jinja2.Environment, source: str, cache: TemplateCache = None
+) -> CompiledTemplate:
+    """
+    Compile a config-string template, reusing the compiled code from `cache`.
+
+    Args:
+        env (jinja2.Environment): The environment to compile with.
+        source (str): The template source.
+        cache (TemplateCache, optional): Cache of compiled templates keyed by source
+                   text. Defaults to None, compiling `source`.
+
+    Returns:
+        CompiledTemplate: The compiled code and the key paths it references.
+    """
+    if cache is None:
+        return compile_source(env, source)
+    return cache.get_or_create(
+        (environment_key(env), source), lambda: compile_source(env, source)
+    )
+
+
+class _LeafIndex:
+    """Maps referenced key paths onto the templated leaves they depend on."""
+
+    def __init__(self, config: dict, leaves: Dict[KeyPath, Any]):
+        self.config = config
+        self.leaves = leaves
+        self._under = {}
+
+    def existing_prefix(self, path: KeyPath) -> KeyPath:
+        """Return the longest prefix of `path` present in the config."""
+        value = self.config
+        for depth, key in enumerate(path):
+            if not isinstance(value, MAPPING_TYPES) or key not in value:
+                return path[:depth]
+            value = value[key]
+        return path
+
+    def leaves_under(self, path: KeyPath) -> List[KeyPath]:
+        """Return the templated leaves at or below `path`."""
+        if path not in self._under:
+            if path in self.leaves:
+                self._under[path] = [path]
+            else:
+                value = self.config
+                for key in path:
+                    value = value[key]
+                if isinstance(value, MAPPING_TYPES):
+                    self._under[path] = [
+                        leaf
+                        for leaf, _ in iter_string_leaves(value, path)
+                        if leaf in self.leaves
+                    ]
+                else:
+                    self._under[path] = []
+        return self._under[path]
+
+
+def build_dependency_graph(
+    config: dict, references: Dict[KeyPath, Set[KeyPath]]
+) -> Dict[KeyPath, List[KeyPath]]:
+    """
+    Build the dependency graph between templated values of a configuration.
+
+    A leaf never depends on itself. A leaf referencing `WHOLE_CONFIG` depends on
+    every other leaf, except the ones referencing `WHOLE_CONFIG` as well and the
+    ones depending on it.
+
+    Args:
+        config (dict): The configuration the templated values belong to.
+        references (Dict[KeyPath, Set[KeyPath]]): For every templated leaf, the
+                   key paths its template references (see `CompiledTemplate`).
+
+    Returns:
+        Dict[KeyPath, List[KeyPath]]: For every templated leaf, the templated
+                   leaves it has to be rendered after.
+    """
+    index = _LeafIndex(config, references)
+    graph = {}
+    context_leaves = []
+    for leaf, refs in references.items():
+        deps = []
+        for ref in refs:
+            if ref == WHOLE_CONFIG:
+                context_leaves.append(leaf)
+                continue
+            prefix = index.existing_prefix(ref)
+            if prefix:
+                deps.extend(
+                    dep for dep in index.leaves_under(prefix) if dep != leaf
+                )
+        graph[leaf] = deps
+    for leaf in context_leaves:
+        excluded = set(context_leaves) | _dependents(graph, leaf)
+        graph[leaf] = graph[leaf] + [
+            other for other in graph if other not in excluded
+        ]
+    return graph
+
+
+def _dependents(
+    graph: Dict[KeyPath, List[KeyPath]], leaf: KeyPath
+) -> Set[KeyPath]:
+    """Return the leaves depending on `leaf`, directly or not."""
+    dependents = {}
+    for node, deps in graph.items():
+        for dep in deps:
+            dependents.setdefault(dep, []).append(node)
+    found = set()
+    pending = [leaf]
+    while pending:
+        for dependent in dependents.get(pending.pop(), ()):
+            if dependent not in found:
+                found.add(dependent)
+                pending.append(dependent)
+    return found
+
+
+def required_paths(
+    config: dict,
+    env: jinja2.Environment,
+    roots: Iterable[KeyPath],
+    cache: TemplateCache = None,
+) -> Set[KeyPath]:
+    """
+    Find the key paths of `config` needed to render the values at `roots`.
+
+    The values at or below every root are required, and so are the key paths
+    their templated values reference, transitively. Only those templated
+    values are compiled. A value referencing `WHOLE_CONFIG` requires all.
+
+    Args:
+        config (dict): The configuration containing templated string values.
+        env (jinja2.Environment): The environment the values are rendered with.
+        roots (Iterable[KeyPath]): The key paths read, e.g. by an input template
+                   (see `find_references`). Key paths missing from `config` are
+                   cut to their longest existing prefix.
+        cache (TemplateCache, optional): Cache of compiled templates keyed by source
+                   text. Defaults to None, compiling every value.
+
+    Returns:
+        Set[KeyPath]: The required key paths, none of them below another one.
+    """
+    index = _LeafIndex(config, {})
+    required = set()
+    pending = list(roots)
+    while pending:
+        path = pending.pop()
+        if path == WHOLE_CONFIG:
+            return {(key,) for key in config}
+        path = index.existing_prefix(path)
+        if not path or any(
+            path[:depth] in required for depth in range(1, len(path) + 1)
+        ):
+            continue
+        required.difference_update(
+            [other for other in required if other[: len(path)] == path]
+        )
+        required.add(path)
+        value = config
+        for key in path:
+            value = value[key]
+        if isinstance(value, MAPPING_TYPES):
+            leaves = iter_string_leaves(value, path)
+        else:
+            leaves = [(path, value)] if isinstance(value, str) else []
+        for _, source in leaves:
+            if has_template_syntax(env, source):
+                pending.extend(compile_cached(env, source, cache).references)
+    return required
+
+
+def select_paths(config: dict, paths: Iterable[KeyPath]) -> dict:
+    """
+    Return a configuration holding only the values at `paths` of `config`.
+
+    The selected values are shared with `config`, only the dicts leading to them
+    are new.
+
+    Args:
+        config (dict): The configuration to select from.
+        paths (Iterable[KeyPath]): Existing key paths, none of them below another
+                   one, as returned by `required_paths`.
+
+    Returns:
+        dict: The selected configuration.
+    """
+    selected = {}
+    for path in paths:
+        parent, value = selected, config
+        for key in path[:-1]:
+            value = value[key]
+            parent = parent.setdefault(key, {})
+        parent[path[-1]] = value[path[-1]]
+    return selected
+
+
+def topological_order(graph: Dict[KeyPath, List[KeyPath]]) -> List[KeyPath]:
+    """
+    Order the nodes of a dependency graph so that dependencies come first.
+
+    Args:
+        graph (Dict[KeyPath, List[KeyPath]]): The graph from
+                   `build_dependency_graph`.
+
+    Returns:
+        List[KeyPath]: The nodes in rendering order.
+
+    Raises:
+        TemplateCycleError: If the graph contains a cycle.
+    """
+    order = []
+    state = {}
+    for root in graph:
+        if root in state:
+            continue
+        state[root] = _VISITING
+        stack = [(root, iter(graph[root]))]
+        while stack:
+            node, deps = stack[-1]
+            for dep in deps:
+                dep_state = state.get(dep)
+                if dep_state is None:
+                    state[dep] = _VISITING
+                    stack.append((dep, iter(graph[dep])))
+                    break
+                if dep_state == _VISITING:
+                    path = [visiting for visiting, _ in stack]
+                    raise TemplateCycleError(path[path.index(dep) :] + [dep])
+            else:
+                stack.pop()
+                state[node] = _DONE
+                order.append(node)
+    return order
+
+
+def dependency_levels(
+    graph: Dict[KeyPath, List[KeyPath]], order: List[KeyPath]
+) -> int:
+    """
+    Return the length of the longest chain of dependent templated values.
+
+    That is the number of passes rendering the values level by level would take.
+
+    Args:
+        graph (Dict[KeyPath, List[KeyPath]]): The graph from
+                   `build_dependency_graph`.
+        order (List[KeyPath]): Its nodes in rendering order.
+
+    Returns:
+        int: The number of levels, 0 without templated values.
+    """
+    levels = {}
+    for node in order:
+        levels[node] = 1 + max((levels[dep] for dep in graph[node]), default=0)
+    return max(levels.values(), default=0)
+
+
+def writable_parent(rendered, path: KeyPath, copied: Set[int]):
+    """
+    Return the container of `path`, copying the shared ones on the way.
+
+    Args:
+        rendered (dict): The configuration being written to.
+        path (KeyPath): The key path of the value to write.
+        copied (Set[int]): The ids of the containers already copied, updated with
+                   the ones copied now.
+
+    Returns:
+        dict: The writable container of the value.
+    """
+    parent = rendered
+    for key in path[:-1]:
+        child = parent[key]
+        if id(child) not in copied:
+            child = shallow_copy(child)
+            copied.add(id(child))
+            parent[key] = child
+        parent = child
+    return parent
+
+
+def resolve_templates(
+    config: dict,
+    env: jinja2.Environment,
+    cache: TemplateCache = None,
+    max_passes: int = MAX_PASSES,
+) -> dict:
+    """
+    Render every templated string value of `config` once, in dependency order.
+
+    If `env` is async, the values are rendered concurrently on a new event loop,
+    each one after the values it references. While rendered values are templates
+    again, changed by rendering, all the values are rendered once more, for at
+    most `max_passes` passes.
+
+    Args:
+        config (dict): The configuration containing templated string values.
+        env (jinja2.Environment): The environment (filters, tests) to render with.
+        cache (TemplateCache, optional): Cache of compiled templates keyed by source
+                   text. Defaults to None, compiling every value.
+        max_passes (int, optional): The maximum number of rendering passes.
+                   Defaults to `MAX_PASSES`.
+
+    Only the dicts on the paths to templated values are copied, all other values
+    are shared with `config`, which is never modified.
+
+    Returns:
+        dict: A new configuration with all string values rendered.
+
+    Raises:
+        TemplateCycleError: If templated values reference each other in a cycle.
+    """
+    rendered = config
+    for _ in range(max_passes):
+        rendered, order = _resolve_once(rendered, env, cache)
+        if not any(
+            _rendered_again(env, rendered, config, path) for path in order
+        ):
+            break
+        config = rendered
+    return rendered
+
+
+def _resolve_once(config: dict, env: jinja2.Environment, cache: TemplateCache):
+    """Render the templated values once, see `resolve_templates`."""
+    compiled = {
+        path: compile_cached(env, value, cache)
+        for path, value in iter_string_leaves(config)
+        if has_template_syntax(env, value)
+    }
+    references = {path: entry.references for path, entry in compiled.items()}
+    graph = build_dependency_graph(config, references)
+    order = topological_order(graph)
+    logger.debug(f"Rendering {len(order)} config values in dependency order")
+    count("config_values_rendered", len(order))
+    if is_active():
+        count_max("dependency_levels", dependency_levels(graph, order))
+
+    # a plain dict at the top, Jinja2 copies the context of every render
+    rendered = dict(config)
+    copied = {id(rendered)}
+    globals_ = env.make_globals(None)
+    templates = {
+        path: env.template_class.from_code(env, compiled[path].code, globals_)
+        for path in order
+    }
+    if env.is_async:
+        run_async(
+            _render_concurrently(rendered, copied, templates, order, graph)
+        )
+        return rendered, order
+    for path in order:
+        parent = writable_parent(rendered, path, copied)
+        parent[path[-1]] = templates[path].render(rendered)
+    return rendered, order
+
+
+def _value_at(config: dict, path: KeyPath) -> Any:
+    for key in path:
+        config = config[key]
+    return config
+
+
+def _rendered_again(
+    env: jinja2.Environment, rendered: dict, config: dict, path: KeyPath
+) -> bool:
+    """Whether the value at `path` rendered to a new template."""
+    value = _value_at(rendered, path)
+    return has_template_syntax(env, value) and value != _value_at(config, path)
+
+
+async def _render_concurrently(
+    rendered: dict,
+    copied: Set[int],
+    templates: Dict[KeyPath, jinja2.Template],
+    order: List[KeyPath],
+    graph: Dict[KeyPath, List[KeyPath]],
+):
+    """Render every value in a task awaiting the tasks of its dependencies."""
+    tasks = {}
+
+    async def render(path: KeyPath):
+        if graph[path]:
+            await asyncio.gather(*(tasks[dep] for dep in set(graph[path])))
+        value = await templates[path].render_async(rendered)
+        # values are written between awaits, a render in progress only reads
+        # values it does not depend on from the containers written to
+        parent = writable_parent(rendered, path, copied)
+        parent[path[-1]] = value
+
+    # dependencies come first in `order`, so their tasks already exist
+    for path in order:
+        tasks[path] = asyncio.ensure_future(render(path))
+    await asyncio.gather(*tasks.values())
@@ -0,0 +1,265 @@
+"""
+Render a directory tree of templates into a mirrored output tree.
+
+Every `*.j2` template below the template directory is rendered to the same
+relative path below the output directory, without the `.j2` suffix. Templates
+whose file name starts with `_` are partials: they are only used through
+`include`, `import` or `extends` and are not rendered themselves.
+
+All templates are rendered with one shared environment whose `FileSystemLoader` is
+rooted at the template directory. A state file in the output directory records a
+content hash of every template together with the templates it includes or
+extends, the resolved configuration and the filters; later runs only re-render
+the templates whose hash changed and remove the outputs of deleted templates.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set
+
+import jinja2
+from jinja2 import meta
+
+# pylint: disable=W1203
+from masha.logger_factory import create_logger, json_default
+from masha.output_writer import write_template
+
+logger = create_logger("masha")
+
+STATE_FILE_NAME = ".masha-state.json"
+TEMPLATE_SUFFIX = ".j2"
+
+
+def is_tree_template(name: str) -> bool:
+    """
+    Check whether a template of the tree is rendered to an output file.
+
+    Args:
+        name (str): The template name, relative to the template directory.
+
+    Returns:
+        bool: True for `*.j2` templates that are not `_` prefixed partials.
+    """
+    return name.endswith(TEMPLATE_SUFFIX) and not Path(name).name.startswith(
+        "_"
+    )
+
+
+def hash_inputs(paths: Iterable[Path]) -> str:
+    """
+    Hash the content of files, or of all the files below directories.
+
+    Python bytecode below `__pycache__` directories is skipped.
+
+    Args:
+        paths (Iterable[Path]): The files and directories to hash, None is skipped.
+
+    Returns:
+        str: The hex digest over the names and contents of all the files.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        if path is None:
+            continue
+        path = Path(path)
+        files = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for file in files:
+            if file.is_file() and "__pycache__" not in file.parts:
+                digest.update(str(file).encode("utf-8") + b"\0")
+                digest.update(file.read_bytes() + b"\0")
+    return digest.hexdigest()
+
+
+def hash_config(config: Dict[str, Any]) -> str:
+    """
+    Hash a resolved configuration.
+
+    Args:
+        config (Dict[str, Any]): The configuration templates are rendered with.
+
+    Returns:
+        str: The hex digest of the canonical JSON form of `config`.
+    """
+    content = json.dumps(config, sort_keys=True, default=json_default)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class _TemplateHasher:
+    """Hashes templates together with the templates they reference."""
+
+    def __init__(self, jenv: jinja2.Environment):
+        self.jenv = jenv
+        self._sources = {}
+        self._references = {}
+
+    def source(self, name: str) -> str:
+        if name not in self._sources:
+            self._sources[name] = self.jenv.loader.get_source(self.jenv, name)[
+                0
+            ]
+        return self._sources[name]
+
+    def references(self, name: str) -> Set[str]:
+        """Return the templates `name` includes, imports or extends."""
+        if name not in self._references:
+            ast = self.jenv.parse(self.source(name))
+            refs = set(meta.find_referenced_templates(ast))
+            if None in refs:
+                # dynamic template names, depend on the whole tree
+                refs = set(self.jenv.list_templates())
+            self._references[name] = refs
+        return self._references[name]
+
+    def dependencies(self, name: str) -> Set[str]:
+        """Return `name` and all the templates it transitively references."""
+        seen = set()
+        pending = [name]
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            try:
+                pending.extend(self.references(current))
+            except jinja2.TemplateNotFound:
+                continue
+        return seen
+
+    def digest(self, name: str, environment_hash: str) -> str:
+        """Hash `name`, its dependencies and the rendering environment."""
+        digest = hashlib.sha256(environment_hash.encode("utf-8"))
+        for dependency in sorted(self.dependencies(name)):
+            try:
+                source = self.source(dependency)
+            except jinja2.TemplateNotFound:
+                source = ""
+            digest.update(dependency.encode("utf-8") + b"\0")
+            digest.update(source.encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+
+def load_tree_state(state_file: Path) -> Dict[str, Any]:
+    """
+    Load the state of the previous tree rendering.
+
+    Args:
+        state_file (Path): The state file.
+
+    Returns:
+        Dict[str, Any]: The recorded state, empty if missing or unreadable.
+    """
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {"templates": {}}
+    if not isinstance(state.get("templates"), dict):
+        return {"templates": {}}
+    return state
+
+
+def save_tree_state(state_file: Path, state: Dict[str, Any]):
+    """
+    Atomically write the state of a tree rendering.
+
+    Args:
+        state_file (Path): The state file.
+        state (Dict[str, Any]): The state to record.
+    """
+    tmp_file = state_file.with_name(f"{state_file.name}.{os.getpid()}.tmp")
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+
+def _report(name: str, output: Path, status: str, error: str = None) -> dict:
+    return {
+        "template": name,
+        "output": str(output),
+        "status": status,
+        "error": error,
+    }
+
+
+# pylint: disable=R0914
+def render_tree(
+    jenv: jinja2.Environment,
+    output_dir: Path,
+    config: Dict[str, Any],
+    extra_inputs: Iterable[Path] = (),
+    state_file: Path = None,
+    only_if_changed: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Render the templates of a tree whose inputs changed since the previous run.
+
+    Args:
+        jenv (jinja2.Environment): An environment with a `FileSystemLoader` rooted
+                                   at the template directory.
+        output_dir (Path): The directory the outputs are written to.
+        config (Dict[str, Any]): The resolved configuration for rendering.
+        extra_inputs (Iterable[Path], optional): Further files or directories, such
+                                   as the filter directories, whose change requires
+                                   rendering every template. Defaults to ().
+        state_file (Path, optional): The state file. Defaults to
+                                   `STATE_FILE_NAME` in `output_dir`.
+        only_if_changed (bool, optional): Keep the outputs of re-rendered templates
+                                   that already have the rendered content
+                                   untouched, reported as `unchanged`. Defaults to
+                                   False.
+
+    Returns:
+        List[Dict[str, Any]]: A report per template with the status `success`
+                              (rendered), `unchanged`, `removed` or `failure`.
+    """
+    state_file = state_file or output_dir / STATE_FILE_NAME
+    previous = load_tree_state(state_file)["templates"]
+    environment_hash = hash_config(config) + hash_inputs(extra_inputs)
+    hasher = _TemplateHasher(jenv)
+
+    names = sorted(filter(is_tree_template, jenv.list_templates()))
+    templates = {}
+    reports = []
+    for name in names:
+        output = output_dir / name[: -len(TEMPLATE_SUFFIX)]
+        try:
+            digest = hasher.digest(name, environment_hash)
+            entry = previous.get(name)
+            if entry and entry["hash"] == digest and output.exists():
+                templates[name] = entry
+                reports.append(_report(name, output, "unchanged"))
+                continue
+            output.parent.mkdir(parents=True, exist_ok=True)
+            changed = write_template(
+                jenv.get_template(name),
+                config,
+                output,
+                only_if_changed=only_if_changed,
+            )
+        # pylint: disable=W0718
+        except Exception as e:
+            logger.error(f"Failed to render template {name}: {e}")
+            reports.append(_report(name, output, "failure", str(e)))
+            continue
+        templates[name] = {"hash": digest}
+        if changed:
+            logger.info(f"Rendered output written to {output}")
+            reports.append(_report(name, output, "success"))
+        else:
+            logger.info(f"Rendered output unchanged in {output}")
+            reports.append(_report(name, output, "unchanged"))
+
+    for name in sorted(set(previous) - set(names)):
+        output = output_dir / name[: -len(TEMPLATE_SUFFIX)]
+        try:
+            output.unlink()
+        except FileNotFoundError:
+            pass
+        logger.info(f"Removed output {output} of deleted template {name}")
+        reports.append(_report(name, output, "removed"))
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    save_tree_state(state_file, {"templates": templates})
+    return reports
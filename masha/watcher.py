@@ -0,0 +1,497 @@
+"""
+Re-render a template whenever one of its inputs changes.
+
+A `RenderSession` keeps the result of every stage of the rendering pipeline in
+memory: the parsed variable files, the loaded filters and tests, the resolved
+configuration, the Pydantic model class, its validation and the Jinja2
+environment with its compiled templates. Each stage result is keyed by the
+fingerprints of the inputs it depends on, so after a change only the stages
+depending on the changed input are computed again. The resolved configuration
+is also keyed by the values of the environment variables it refers to.
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import jinja2
+from returns.result import Failure, Result, Success
+
+# pylint: disable=W1203
+from masha.config_cache import get_config_cache
+from masha.config_loader import expand_config_paths, load_config
+from masha.config_overlay import ConfigOverlay, materialize
+from masha.env_loader import PlaceholderIndex, resolve_env_variables
+from masha.function_registry import FunctionRegistry
+from masha.logger_factory import create_logger
+from masha.output_writer import write_template
+from masha.template_renderer import (
+    create_jinja_environment,
+    render_templates_with_functions,
+)
+from masha.template_resolver import TemplateCycleError
+
+logger = create_logger("masha")
+
+
+def file_fingerprint(path: Path) -> Tuple[int, int]:
+    """
+    Return the modification time and size of a file, None if it is missing.
+
+    Args:
+        path (Path): The file to fingerprint.
+
+    Returns:
+        Tuple[int, int]: The modification time in nanoseconds and the size.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def directory_fingerprint(directory: Path) -> tuple:
+    """
+    Return the fingerprints of the Python files of a filter or test directory.
+
+    Args:
+        directory (Path): The directory to fingerprint, may be None.
+
+    Returns:
+        tuple: The sorted names and fingerprints of the `*.py` files.
+    """
+    if directory is None or not os.path.isdir(directory):
+        return ()
+    return tuple(
+        (name, file_fingerprint(os.path.join(directory, name)))
+        for name in sorted(os.listdir(directory))
+        if name.endswith(".py")
+    )
+
+
+class RenderSession:
+    """
+    Renders templates while keeping every pipeline stage result in memory.
+
+    Args:
+        variables (Tuple[Path]): The configuration files, directories or glob
+                            patterns, merged in order.
+        template_filters_directory (Path, optional): The directory containing custom
+                            Jinja2 filters. Defaults to None.
+        template_tests_directory (Path, optional): The directory containing custom
+                            Jinja2 tests. Defaults to None.
+        model_file (Path, optional): The path to a Pydantic model file. Defaults to
+                            None.
+        class_model (str, optional): The name of the model class within
+                            `model_file`. Defaults to None.
+        cache_dir (Path, optional): The directory of the persistent
+                            compiled-template cache. Defaults to None.
+        deep_merge (bool, optional): Merge nested mappings of the variable files
+                            key by key. Defaults to False.
+        enable_async (bool, optional): Render with async environments, awaiting
+                            coroutine filters and tests. Defaults to False.
+    """
+
+    # pylint: disable=R0913,R0917
+    def __init__(
+        self,
+        variables: Tuple[Path],
+        template_filters_directory: Path = None,
+        template_tests_directory: Path = None,
+        model_file: Path = None,
+        class_model: str = None,
+        cache_dir: Path = None,
+        deep_merge: bool = False,
+        enable_async: bool = False,
+    ):
+        self.variables = tuple(variables)
+        self.template_filters_directory = template_filters_directory
+        self.template_tests_directory = template_tests_directory
+        self.model_file = model_file
+        self.class_model = class_model
+        self.cache_dir = cache_dir
+        self.deep_merge = deep_merge
+        self.enable_async = enable_async
+        self._stages: Dict[str, Tuple[Hashable, Any]] = {}
+
+    def _stage(
+        self, name: str, key: Hashable, compute: Callable[[], Any]
+    ) -> Any:
+        """Return the result of stage `name`, recomputing it if `key` changed."""
+        entry = self._stages.get(name)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        logger.debug(f"Computing stage {name}")
+        value = compute()
+        self._stages[name] = (key, value)
+        return value
+
+    def _config(self, path: Path) -> Result:
+        cache = get_config_cache(self.cache_dir) if self.cache_dir else None
+        return self._stage(
+            f"config:{path}",
+            file_fingerprint(path),
+            lambda: load_config(path, cache),
+        )
+
+    def _functions(self, name: str, directory: Path) -> FunctionRegistry:
+        return self._stage(
+            name,
+            directory_fingerprint(directory),
+            lambda: FunctionRegistry(directory) if directory else None,
+        )
+
+    def filters(self) -> FunctionRegistry:
+        """Return the custom filters, whose files are loaded again once changed."""
+        return self._functions("filters", self.template_filters_directory)
+
+    def tests(self) -> FunctionRegistry:
+        """Return the custom tests, whose files are loaded again once changed."""
+        return self._functions("tests", self.template_tests_directory)
+
+    def variable_files(self) -> List[Path]:
+        """Return the configuration files `variables` currently stand for."""
+        return expand_config_paths(self.variables)
+
+    def merged_config(self) -> Result[Dict, Exception]:
+        """
+        Return the merged variable files, parsing again only the changed files.
+
+        Returns:
+            Result[Dict, Exception]: The merged configuration, or the exception of
+                            the first file failing to load.
+        """
+        return self._stage(
+            "merged_config",
+            tuple(
+                (path, file_fingerprint(path))
+                for path in self.variable_files()
+            ),
+            self._compute_merged_config,
+        )[0]
+
+    def _compute_merged_config(
+        self,
+    ) -> Tuple[Result[Dict, Exception], Optional[PlaceholderIndex]]:
+        configs = []
+        for path in self.variable_files():
+            match self._config(path):
+                case Success(value):
+                    configs.append(value)
+                case Failure(value):
+                    error = ValueError(
+                        f"Failed to load configs from files: "
+                        f"Error processing file {path}: {value}"
+                    )
+                    return Failure(error), None
+        # the parsed files are kept, so merge them without copying
+        merged_config = ConfigOverlay(configs, self.deep_merge)
+        # kept to resolve the placeholders again when the environment changes
+        return Success(merged_config), PlaceholderIndex(merged_config)
+
+    def _template_config_key(self) -> tuple:
+        self.merged_config()
+        index = self._stages["merged_config"][1][1]
+        env_names = index.variable_names() if index is not None else set()
+        return (
+            self._stages["merged_config"][0],
+            directory_fingerprint(self.template_filters_directory),
+            directory_fingerprint(self.template_tests_directory),
+            tuple((name, os.environ.get(name)) for name in sorted(env_names)),
+        )
+
+    def _compute_template_config(self) -> Result[Dict, Exception]:
+        merged_config = None
+        match self.merged_config():
+            case Success(value):
+                merged_config = value
+            case Failure(value):
+                return Failure(value)
+        env_config = resolve_env_variables(
+            merged_config, index=self._stages["merged_config"][1][1]
+        )
+        if self.deep_merge:
+            # templates render against plain dicts, not nested overlays
+            env_config = materialize(env_config)
+        try:
+            template_config = render_templates_with_functions(
+                env_config,
+                self.filters(),
+                self.tests(),
+                self.cache_dir,
+                self.enable_async,
+            )
+        except TemplateCycleError as e:
+            return Failure(
+                ValueError(f"Failed to render config templates: {e}")
+            )
+        return Success(template_config)
+
+    def _model_class(self):
+        # pylint: disable=C0415
+        from masha.config_validator import load_model_class
+
+        return self._stage(
+            "model",
+            file_fingerprint(self.model_file),
+            lambda: load_model_class(
+                self.model_file, self.class_model, self.cache_dir
+            ),
+        )
+
+    def template_config(self) -> Result[Dict, Exception]:
+        """
+        Return the resolved and validated configuration.
+
+        Returns:
+            Result[Dict, Exception]: The configuration, or the exception of the
+                            first failing stage.
+        """
+        key = self._template_config_key()
+        result = self._stage(
+            "template_config", key, self._compute_template_config
+        )
+        if not (self.model_file and self.class_model) or isinstance(
+            result, Failure
+        ):
+            return result
+
+        model_key = file_fingerprint(self.model_file)
+
+        def validate():
+            # pylint: disable=C0415
+            from masha.config_validator import validate_config
+
+            model_class = self._model_class()
+            if not model_class:
+                return Failure(
+                    ValueError("Failed to load the specified model class.")
+                )
+            validation_result = validate_config(
+                result.unwrap(), model_class, self.cache_dir
+            )
+            if isinstance(validation_result, Failure):
+                return Failure(
+                    ValueError(f"Given config is invalid {validation_result}")
+                )
+            return result
+
+        return self._stage("validation", (key, model_key), validate)
+
+    def environment(self, search_path: Path) -> jinja2.Environment:
+        """
+        Return the environment rendering the templates of `search_path`.
+
+        The environment, and with it the compiled templates, is kept until a filter
+        or test file changes; Jinja2 recompiles templates whose file changed.
+
+        Args:
+            search_path (Path): The directory templates are loaded from.
+
+        Returns:
+            jinja2.Environment: The environment.
+        """
+        return self._stage(
+            f"environment:{search_path}",
+            (
+                directory_fingerprint(self.template_filters_directory),
+                directory_fingerprint(self.template_tests_directory),
+            ),
+            lambda: create_jinja_environment(
+                search_path,
+                self.filters(),
+                self.tests(),
+                self.cache_dir,
+                self.enable_async,
+            ),
+        )
+
+    def render(
+        self, input_file: Path, output: Path, only_if_changed: bool = False
+    ) -> Result[Dict, Exception]:
+        """
+        Render `input_file` to `output`, recomputing only the stale stages.
+
+        Args:
+            input_file (Path): The path to the input template file.
+            output (Path): The path where the rendered template will be saved, `-`
+                           for stdout.
+            only_if_changed (bool, optional): Keep `output` untouched if it already
+                           has the rendered content. Defaults to False.
+
+        Returns:
+            Result[Dict, Exception]: The configuration the template was rendered
+                            with, or the exception of the first failing stage.
+        """
+        template_config = None
+        match self.template_config():
+            case Success(value):
+                template_config = value
+            case Failure(value):
+                return Failure(value)
+        jenv = self.environment(input_file.parent)
+        try:
+            changed = write_template(
+                jenv.get_template(input_file.name),
+                template_config,
+                output,
+                only_if_changed=only_if_changed,
+            )
+        # pylint: disable=W0718
+        except Exception as e:
+            return Failure(ValueError(f"Failed to render template {e}"))
+        finally:
+            if jenv.bytecode_cache is not None:
+                jenv.bytecode_cache.prune()
+        if changed:
+            logger.info(f"Rendered output written to {output}")
+        else:
+            logger.info(f"Rendered output unchanged in {output}")
+        return Success(template_config)
+
+    def approximate_size(self) -> int:
+        """
+        Approximate the memory used by the parsed and resolved configurations.
+
+        Returns:
+            int: The approximate size in bytes.
+        """
+        return deep_sizeof(
+            [
+                value
+                for name, (_, value) in self._stages.items()
+                if name.startswith("config") or name.endswith("_config")
+            ]
+        )
+
+    def watched_paths(self, input_file: Path) -> List[Path]:
+        """
+        Return the files a render of `input_file` depends on.
+
+        Besides the variable files, filter and test files and the model file, these
+        are all the templates loaded so far, including included ones.
+
+        Args:
+            input_file (Path): The path to the input template file.
+
+        Returns:
+            List[Path]: The files to watch for changes.
+        """
+        paths = self.variable_files() + [input_file]
+        for directory in (
+            self.template_filters_directory,
+            self.template_tests_directory,
+        ):
+            if directory:
+                paths.append(directory)
+        if self.model_file:
+            paths.append(self.model_file)
+        entry = self._stages.get(f"environment:{input_file.parent}")
+        if entry is not None and entry[1].cache is not None:
+            paths.extend(
+                Path(template.filename)
+                for template in entry[1].cache.values()
+                if template.filename
+            )
+        return paths
+
+
+def deep_sizeof(value: Any) -> int:
+    """
+    Approximate the memory used by a configuration value and everything in it.
+
+    Dicts, lists, tuples, sets and `returns` containers are followed, any other
+    object only counts with its own `sys.getsizeof`.
+
+    Args:
+        value (Any): The value to measure.
+
+    Returns:
+        int: The approximate size in bytes.
+    """
+    size = 0
+    seen = set()
+    pending = [value]
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+        if isinstance(current, dict):
+            pending.extend(current.keys())
+            pending.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            pending.extend(current)
+        elif isinstance(current, ConfigOverlay):
+            # pylint: disable=W0212
+            pending.extend(current._layers)
+            pending.append(current._writes)
+        elif isinstance(current, (Success, Failure)):
+            pending.append(current._inner_value)  # pylint: disable=W0212
+    return size
+
+
+def fingerprint_paths(paths: List[Path]) -> tuple:
+    """
+    Fingerprint files and filter or test directories for change detection.
+
+    Args:
+        paths (List[Path]): The files and directories to fingerprint.
+
+    Returns:
+        tuple: A value that changes whenever one of the paths changes.
+    """
+    return tuple(
+        (
+            directory_fingerprint(path)
+            if os.path.isdir(path)
+            else file_fingerprint(path)
+        )
+        for path in paths
+    )
+
+
+def watch(
+    session: RenderSession,
+    input_file: Path,
+    output: Path,
+    interval: float = 1.0,
+    only_if_changed: bool = False,
+    max_renders: int = None,
+):
+    """
+    Render `input_file` now and again whenever one of its inputs changes.
+
+    Inputs are polled every `interval` seconds until interrupted.
+
+    Args:
+        session (RenderSession): The session keeping the stage results.
+        input_file (Path): The path to the input template file.
+        output (Path): The path where the rendered template will be saved.
+        interval (float, optional): Seconds between two polls. Defaults to 1.0.
+        only_if_changed (bool, optional): Keep `output` untouched if it already
+                            has the rendered content. Defaults to False.
+        max_renders (int, optional): Stop after this many renders, mainly for
+                            testing. Defaults to None, watching forever.
+    """
+    renders = 0
+    last_fingerprint = None
+    while max_renders is None or renders < max_renders:
+        paths = session.watched_paths(input_file)
+        fingerprint = fingerprint_paths(paths)
+        if fingerprint != last_fingerprint:
+            match session.render(input_file, output, only_if_changed):
+                case Failure(value):
+                    logger.error(f"Render failed with error {value}")
+            renders += 1
+            last_fingerprint = fingerprint
+            # the render may have loaded further templates to watch
+            new_paths = session.watched_paths(input_file)
+            if new_paths != paths:
+                last_fingerprint = fingerprint_paths(new_paths)
+            continue
+        time.sleep(interval)
@@ -40,9 +40,14 @@ setuptools.setup(
         "returns>=0.24.0",
         "click>=8.1.8",
     ],                            # list all packages that your package uses
+    extras_require={
+        "fast": ["orjson>=3.10"],                   # faster JSON config parsing
+    },
     entry_points='''
         [console_scripts]
         masha=masha.cli:main
+        masha-serve=masha.server:serve
+        masha-client=masha.client:main
     ''',
     keywords=["pypi", "masha", "shell", "yaml", "json", "jinja2", "configuration"],           #descriptive meta-data
     classifiers=[                                   # https://pypi.org/classifiers
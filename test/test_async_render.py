@@ -0,0 +1,87 @@
+import asyncio
+import io
+import sys
+import time
+import unittest
+from pathlib import Path
+
+import jinja2
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from output_writer import write_chunks
+from template_renderer import render_templates_with_functions
+# the module template_renderer uses, not a second copy of it
+from masha.async_render import DEFAULT_CONCURRENCY, iterate_async, set_async_concurrency
+
+
+class SlowLookup:
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def __call__(self, value):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.05)
+        self.running -= 1
+        return f"<{value}>"
+
+
+class TestAsyncRender(unittest.TestCase):
+
+    def tearDown(self):
+        set_async_concurrency(DEFAULT_CONCURRENCY)
+
+    def lookup(self):
+        lookup = SlowLookup()
+
+        async def slow(value):
+            return await lookup(value)
+
+        return lookup, slow
+
+    def test_independent_values_run_concurrently(self):
+        lookup, slow = self.lookup()
+        config = {f"k{i}": f"{{{{ 'v{i}' | slow }}}}" for i in range(10)}
+        config["all"] = "{{ k0 }}{{ k9 | upper }}"
+        start = time.perf_counter()
+        rendered = render_templates_with_functions(
+            config, {"slow": slow}, enable_async=True
+        )
+        self.assertLess(time.perf_counter() - start, 0.4)
+        self.assertEqual(lookup.max_running, 10)
+        self.assertEqual(rendered["k3"], "<v3>")
+        self.assertEqual(rendered["all"], "<v0><V9>")
+
+    def test_concurrency_limit(self):
+        set_async_concurrency(3)
+        lookup, slow = self.lookup()
+        config = {"d": {f"k{i}": f"{{{{ {i} | slow }}}}" for i in range(7)}}
+        rendered = render_templates_with_functions(
+            config, {"slow": slow}, enable_async=True
+        )
+        self.assertEqual(lookup.max_running, 3)
+        self.assertEqual(rendered["d"]["k6"], "<6>")
+        self.assertEqual(config["d"]["k6"], "{{ 6 | slow }}")
+
+    def test_sync_mode_unchanged(self):
+        rendered = render_templates_with_functions(
+            {"a": "x", "b": "{{ a | twice }}"}, {"twice": lambda v: v * 2}
+        )
+        self.assertEqual(rendered, {"a": "x", "b": "xx"})
+
+    def test_streamed_async_template(self):
+        _, slow = self.lookup()
+        env = jinja2.Environment(enable_async=True)
+        env.filters["slow"] = slow
+        template = env.from_string("{% for i in range(3) %}{{ i | slow }}{% endfor %}")
+        stream = io.StringIO()
+        write_chunks(iterate_async(template.generate_async()), stream, 1)
+        self.assertEqual(stream.getvalue(), "<0><1><2>")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+import unittest
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+import jinja2
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from bytecode_cache import DiskTemplateCache
+from template_resolver import resolve_templates
+
+
+class TestDiskTemplateCache(unittest.TestCase):
+
+    def test_config_strings_persisted(self):
+        inp = {"a": "val_a", "b": "from_{{ a }}", "c": "from {{ b }}"}
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = jinja2.Environment(bytecode_cache=DiskTemplateCache(cache_dir))
+            first = resolve_templates(inp, env)
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            # a new environment loads the compiled code instead of compiling
+            env = jinja2.Environment(bytecode_cache=DiskTemplateCache(cache_dir))
+            env.compile = None
+            self.assertEqual(resolve_templates(inp, env), first)
+
+    def test_prune_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = DiskTemplateCache(cache_dir, max_bytes=0)
+            env = jinja2.Environment(bytecode_cache=cache)
+            resolve_templates({"a": "x", "b": "{{ a }}"}, env)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            cache.prune()
+            self.assertEqual(os.listdir(cache_dir), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
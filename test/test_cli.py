@@ -0,0 +1,143 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from masha.cli import _used_key_paths
+
+root_dir = Path(__file__).parent.parent
+
+
+def run_masha(*args, cwd):
+    """Run the masha command, returning the completed process."""
+    env = dict(os.environ, PYTHONPATH=str(root_dir))
+    return subprocess.run(
+        [sys.executable, "-m", "masha.cli", *args],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+
+class TestReportOnStdout(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        (self.directory / "v.yaml").write_text("name: masha\n")
+        (self.directory / "a.j2").write_text("a {{ name }}")
+        (self.directory / "b.j2").write_text("b {{ name }}")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_manifest_report(self):
+        (self.directory / "m.yaml").write_text(
+            "jobs:\n"
+            "  - template: a.j2\n"
+            "    output: out/a.txt\n"
+            "  - template: b.j2\n"
+            "    output: b.txt\n"
+        )
+        (self.directory / "out").mkdir()
+        result = run_masha("-v", "v.yaml", "--manifest", "m.yaml", cwd=self.directory)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = json.loads(result.stdout)
+        self.assertEqual(report["succeeded"], 2)
+        self.assertIn("Command run successfully", result.stderr)
+        self.assertEqual((self.directory / "b.txt").read_text(), "b masha")
+
+    def test_failing_job_exit_code(self):
+        (self.directory / "m.yaml").write_text(
+            "jobs:\n"
+            "  - template: a.j2\n"
+            "    output: a.txt\n"
+            "  - template: missing.j2\n"
+            "    output: m.txt\n"
+            "  - template: b.j2\n"
+            "    output: b.txt\n"
+        )
+        for jobs in ("1", "2"):
+            result = run_masha(
+                "-v", "v.yaml", "--manifest", "m.yaml", "--jobs", jobs,
+                cwd=self.directory,
+            )
+            self.assertEqual(result.returncode, 1, result.stderr)
+            report = json.loads(result.stdout)
+            self.assertEqual(
+                [job["status"] for job in report["jobs"]],
+                ["success", "failure", "success"],
+            )
+            self.assertEqual((report["succeeded"], report["failed"]), (2, 1))
+
+    def test_tree_report(self):
+        (self.directory / "tree").mkdir()
+        (self.directory / "tree" / "c.txt.j2").write_text("c {{ name }}")
+        result = run_masha(
+            "-v", "v.yaml", "--template-dir", "tree", "--output-dir", "out",
+            cwd=self.directory,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout)["succeeded"], 1)
+
+    def test_matrix_report(self):
+        (self.directory / "dev.yaml").write_text("name: dev\n")
+        (self.directory / "matrix.yaml").write_text(
+            "dimensions:\n  env: {dev: dev.yaml}\n"
+        )
+        result = run_masha(
+            "-v", "v.yaml", "--matrix", "matrix.yaml", "-o", "{name}.txt",
+            "a.j2", cwd=self.directory,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(json.loads(result.stdout)["jobs"][0]["combination"], "dev")
+        self.assertEqual((self.directory / "dev.txt").read_text(), "a dev")
+
+    def test_only_if_changed_report(self):
+        for status in ("success", "unchanged"):
+            result = run_masha(
+                "--only-if-changed", "-v", "v.yaml", "-o", "a.txt", "a.j2",
+                cwd=self.directory,
+            )
+            self.assertEqual(result.returncode, 0, result.stderr)
+            report = json.loads(result.stdout)
+            self.assertEqual(report["jobs"][0]["status"], status)
+        self.assertEqual((self.directory / "a.txt").read_text(), "a masha")
+
+
+class TestUsedKeyPaths(unittest.TestCase):
+
+    def test_custom_filters(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_dir = Path(tmp_dir)
+            (tmp_dir / "filters").mkdir()
+            (tmp_dir / "filters" / "f.py").write_text(
+                "import jinja2\n"
+                "def shout(value):\n"
+                "    return value.upper()\n"
+                "@jinja2.pass_context\n"
+                "def lookup(context, name):\n"
+                "    return context[name]\n"
+            )
+            (tmp_dir / "plain.j2").write_text("{{ app.name | shout }}")
+            (tmp_dir / "context.j2").write_text("{{ 'a' | lookup }}")
+            self.assertEqual(
+                _used_key_paths(tmp_dir / "plain.j2", False, tmp_dir / "filters"),
+                {("app", "name")},
+            )
+            self.assertIsNone(
+                _used_key_paths(tmp_dir / "context.j2", False, tmp_dir / "filters")
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
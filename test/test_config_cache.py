@@ -0,0 +1,84 @@
+import unittest
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from config_cache import ConfigCache, RACY_WINDOW_NS
+from config_loader import load_config
+
+
+class CountingParser:
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, data):
+        self.calls += 1
+        return {"content": data.decode("utf-8")}
+
+
+class TestConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = ConfigCache(os.path.join(self.tmp_dir.name, "configs"))
+        self.path = Path(self.tmp_dir.name) / "vars.yaml"
+        self.parse = CountingParser()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_unchanged_file_not_parsed_again(self):
+        self.path.write_text("a: 1\n")
+        os.utime(self.path, ns=(1, 1))
+        self.assertEqual(self.cache.load(self.path, self.parse), {"content": "a: 1\n"})
+        # a new process sharing the directory loads the parsed data
+        cache = ConfigCache(self.cache.directory)
+        self.assertEqual(cache.load(self.path, self.parse), {"content": "a: 1\n"})
+        self.assertEqual(self.parse.calls, 1)
+
+        self.path.write_text("a: 2\n")
+        self.assertEqual(cache.load(self.path, self.parse), {"content": "a: 2\n"})
+        self.assertEqual(self.parse.calls, 2)
+
+    def test_racy_entry_verified_by_hash(self):
+        self.path.write_text("a: 1\n")
+        mtime_ns = os.stat(self.path).st_mtime_ns
+        self.cache.load(self.path, self.parse)
+        # same size and modification time, within the racy window
+        self.path.write_text("a: 2\n")
+        os.utime(self.path, ns=(mtime_ns, mtime_ns))
+        self.assertEqual(self.cache.load(self.path, self.parse), {"content": "a: 2\n"})
+        self.assertEqual(self.parse.calls, 2)
+
+    def test_touched_file_not_parsed_again(self):
+        self.path.write_text("a: 1\n")
+        self.cache.load(self.path, self.parse)
+        os.utime(self.path, ns=(RACY_WINDOW_NS, RACY_WINDOW_NS))
+        self.cache.load(self.path, self.parse)
+        self.assertEqual(self.parse.calls, 1)
+
+    def test_corrupt_entry_ignored(self):
+        self.path.write_text("a: 1\n")
+        self.cache.load(self.path, self.parse)
+        for name in os.listdir(self.cache.directory):
+            Path(self.cache.directory, name).write_bytes(b"garbage")
+        self.assertEqual(self.cache.load(self.path, self.parse), {"content": "a: 1\n"})
+        self.assertEqual(self.parse.calls, 2)
+
+    def test_load_config_with_cache(self):
+        self.path.write_text("a: 1\nb: [x, y]\n")
+        first = load_config(self.path, self.cache).unwrap()
+        second = load_config(self.path, self.cache).unwrap()
+        self.assertEqual(first, {"a": 1, "b": ["x", "y"]})
+        self.assertEqual(second, first)
+        self.assertIsNot(second, first)
+
+
+if __name__ == "__main__":
+    unittest.main()
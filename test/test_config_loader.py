@@ -1,6 +1,7 @@
 import unittest
 import sys
 import os
+import tempfile
 from pathlib import Path
 from typing import Dict, Any
 from unittest.mock import patch, MagicMock
@@ -10,7 +11,7 @@ from returns.result import Result, Success, Failure
 directory = Path(__file__).parent.parent / "masha"
 # setting path
 sys.path.append(str(directory))
-from config_loader import merge_configs, load_and_merge_configs
+from config_loader import merge_configs, load_and_merge_configs, expand_config_paths
 
 
 class TestMergeConfigs(unittest.TestCase):
@@ -118,5 +119,37 @@ class TestLoadAndMergeConfigs(unittest.TestCase):
         self.assertGreaterEqual(err_msg.find("Unsupported file type: .xml"), 0)
 
 
+class TestConcurrentLoading(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.fragments = Path(self.tmp_dir.name) / "fragments"
+        (self.fragments / "sub").mkdir(parents=True)
+        for index in range(40):
+            name = f"sub/{index:02d}.yaml" if index % 2 else f"{index:02d}.json"
+            (self.fragments / name).write_text(f'{{"index": {index}, "k{index}": {index}}}')
+        (self.fragments / "README.md").write_text("not a config")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_expand_directory_and_glob(self):
+        files = expand_config_paths([self.fragments])
+        self.assertEqual(len(files), 40)
+        self.assertEqual(files, sorted(files))
+        files = expand_config_paths([self.fragments / "**" / "*.yaml"])
+        self.assertEqual(len(files), 20)
+        absent = self.fragments / "*.toml"
+        self.assertEqual(expand_config_paths([absent]), [absent])
+
+    def test_merge_order_kept(self):
+        paths = sorted(self.fragments.glob("*.json")) + sorted(self.fragments.glob("sub/*.yaml"))
+        for processes in (1, 2):
+            config = load_and_merge_configs(paths, processes=processes).unwrap()
+            # the last file wins, whichever finishes loading first
+            self.assertEqual(config["index"], 39)
+            self.assertEqual(len(config), 41)
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,91 @@
+import unittest
+import sys
+import copy
+import json
+import pickle
+import tempfile
+from pathlib import Path
+
+import jinja2
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+# the pipeline modules check for masha.config_overlay.ConfigOverlay
+from masha.config_overlay import ConfigOverlay, materialize
+from config_loader import merge_configs
+from env_loader import resolve_env_variables
+from template_resolver import resolve_templates
+from masha.cli import prepare_template_config
+
+BASE = {"app": {"name": "masha", "port": 80}, "hosts": ["a", "b"], "env": "dev"}
+TEAM = {"app": {"port": "{{ 8000 + 80 }}"}, "owner": "${MASHA_OWNER: team}"}
+
+
+class TestConfigOverlay(unittest.TestCase):
+
+    def setUp(self):
+        self.layers = [copy.deepcopy(BASE), copy.deepcopy(TEAM)]
+
+    def test_shallow_like_merge_configs(self):
+        overlay = ConfigOverlay(self.layers)
+        self.assertEqual(overlay, merge_configs(self.layers))
+        self.assertEqual(list(overlay), list(merge_configs(self.layers)))
+        self.assertIs(overlay["hosts"], self.layers[0]["hosts"])
+
+    def test_deep(self):
+        overlay = ConfigOverlay(self.layers, deep=True)
+        self.assertEqual(
+            materialize(overlay)["app"], {"name": "masha", "port": "{{ 8000 + 80 }}"}
+        )
+        self.assertEqual(merge_configs(self.layers, deep=True), materialize(overlay))
+
+    def test_writes_keep_layers(self):
+        overlay = ConfigOverlay(self.layers, deep=True)
+        overlay["env"] = "prod"
+        overlay["app"]["name"] = "other"
+        del overlay["hosts"]
+        self.assertEqual(
+            materialize(pickle.loads(pickle.dumps(overlay))),
+            {"app": {"name": "other", "port": "{{ 8000 + 80 }}"}, "env": "prod",
+             "owner": "${MASHA_OWNER: team}"},
+        )
+        self.assertNotIn("hosts", overlay)
+        self.assertEqual(self.layers, [BASE, TEAM])
+
+    def test_pipeline_copies_changed_paths_only(self):
+        for deep in (False, True):
+            overlay = ConfigOverlay(self.layers, deep)
+            env_config = resolve_env_variables(overlay)
+            rendered = materialize(resolve_templates(env_config, jinja2.Environment()))
+            self.assertEqual(rendered["owner"], "team")
+            self.assertEqual(rendered["app"]["port"], "8080")
+            self.assertIs(rendered["hosts"], self.layers[0]["hosts"])
+            self.assertEqual(self.layers, [BASE, TEAM])
+
+    def test_values_render_against_plain_dicts(self):
+        layers = self.layers + [
+            {
+                "app": {"deep": "yes"},
+                "summary": "{{ app }}",
+                "flag": "{{ app.deep }}",
+            }
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            files = []
+            for i, layer in enumerate(layers):
+                files.append(Path(tmp_dir) / f"{i}.json")
+                files[-1].write_text(json.dumps(layer))
+            rendered = prepare_template_config(
+                tuple(files), None, None, deep_merge=True
+            ).unwrap()
+        self.assertEqual(
+            rendered["summary"], str({"name": "masha", "port": "8080", "deep": "yes"})
+        )
+        self.assertEqual(rendered["flag"], "yes")
+        self.assertIsInstance(rendered["app"], dict)
+
+
+if __name__ == "__main__":
+    unittest.main()
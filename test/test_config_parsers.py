@@ -0,0 +1,55 @@
+import unittest
+import sys
+import math
+from pathlib import Path
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from config_parsers import available_parsers, get_parser
+
+test_dir = Path(__file__).parent
+
+TOML_CONFIG = b"""
+title = "masha"
+ports = [8000, 8001]
+ratio = 0.1
+created = 1979-05-27T07:32:00-08:00
+
+[database]
+enabled = true
+server = "192.168.1.1"
+"""
+
+
+class TestConfigParsers(unittest.TestCase):
+
+    def assert_backends_agree(self, suffix, data):
+        backends = available_parsers(suffix)
+        self.assertTrue(backends)
+        expected = backends[-1].parse(data)
+        for backend in backends:
+            self.assertEqual(backend.parse(data), expected, backend.name)
+        return expected
+
+    def test_backends_agree_on_test_configs(self):
+        for path in sorted(test_dir.glob("*.yaml")) + sorted(test_dir.glob("*.json")):
+            self.assert_backends_agree(path.suffix, path.read_bytes())
+
+    def test_backends_agree_on_toml(self):
+        config = self.assert_backends_agree(".toml", TOML_CONFIG)
+        self.assertEqual(config["database"]["server"], "192.168.1.1")
+
+    def test_json_fallback_accepts_nan(self):
+        for backend in available_parsers(".json"):
+            self.assertTrue(math.isnan(backend.parse(b'{"x": NaN}')["x"]), backend.name)
+
+    def test_fastest_backend_selected(self):
+        self.assertEqual(get_parser(".yml").name, get_parser(".yaml").name)
+        self.assertEqual(get_parser(".yaml").name, available_parsers(".yaml")[0].name)
+        self.assertIsNone(get_parser(".ini"))
+
+
+if __name__ == "__main__":
+    unittest.main()
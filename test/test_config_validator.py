@@ -1,3 +1,5 @@
+import io
+import json
 import unittest
 import sys
 import os
@@ -5,6 +7,8 @@ from pathlib import Path
 from typing import Dict, Any
 from unittest.mock import patch, MagicMock
 from returns.result import Result, Success, Failure
+import tempfile
+from datetime import date
 import yaml
 
 # directory reach
@@ -15,7 +19,9 @@ from config_loader import merge_configs, load_and_merge_configs
 from env_loader import resolve_env_variables
 from template_renderer import render_templates_with_filters
 from config_validator import load_model_class, validate_config
-from logger_factory import create_logger
+from logger_factory import configure_logging, create_logger
+# the module the cli uses, not a second copy of it
+from masha import config_validator
 
 logger = create_logger("masha")
 
@@ -74,5 +80,145 @@ class TestConfigValidator(unittest.TestCase):
             logger.warning(f"Given config is invalid {validation_result}")
         
 
+class TestCachedValidation(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmp_dir.name) / "cache"
+        self.model_file = Path(self.tmp_dir.name) / "model.py"
+        # a source of its own, not loaded by other tests
+        self.model_file.write_text(
+            (Path(test_dir) / "model.py").read_text() + f"# {self.tmp_dir.name}\n"
+        )
+        self.valid = {"name": "n", "version": "1", "debug": False, "age": 14}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def load(self):
+        return config_validator.load_model_class(
+            self.model_file, "ConfigModel", str(self.cache_dir)
+        )
+
+    def test_model_class_cached_by_file_hash(self):
+        model_class = self.load()
+        self.assertIs(self.load(), model_class)
+        self.assertEqual(len(list(self.cache_dir.glob("__masha_model_*.code"))), 1)
+        self.model_file.write_text(self.model_file.read_text() + "\n# changed\n")
+        self.assertIsNot(self.load(), model_class)
+
+    def test_batch_validation(self):
+        model_class = self.load()
+        configs = [dict(self.valid, age=age) for age in (1, 200, 3, -1)]
+        for processes in (1, 2):
+            results = config_validator.validate_configs(
+                configs, model_class, processes
+            )
+            self.assertEqual(
+                [isinstance(result, Success) for result in results],
+                [True, False, True, False],
+            )
+        self.assertIn("not a valid date", results[1].failure())
+
+    def test_known_valid_config_is_skipped(self):
+        model_class = self.load()
+        cache_dir = str(self.cache_dir)
+        self.assertIsInstance(
+            config_validator.validate_config(self.valid, model_class, cache_dir), Success
+        )
+        with patch.object(model_class, "model_validate") as model_validate:
+            result = config_validator.validate_config(
+                dict(self.valid), model_class, cache_dir
+            )
+            self.assertIsInstance(result, Success)
+            model_validate.assert_not_called()
+
+            # remembered in the cache directory for later runs
+            config_validator._valid_fingerprints.clear()
+            config_validator._loaded_fingerprints.clear()
+            config_validator.validate_config(self.valid, model_class, cache_dir)
+            model_validate.assert_not_called()
+
+        self.assertIsInstance(
+            config_validator.validate_config(dict(self.valid, age=-1), model_class),
+            Failure,
+        )
+
+    def test_json_logs_omit_the_validated_config(self):
+        model_class = self.load()
+        stream = io.StringIO()
+        handler = logger.handlers[0]
+        saved_stream = handler.setStream(stream)
+        try:
+            configure_logging("debug", "json")
+            config_validator.validate_config(self.valid, model_class)
+        finally:
+            configure_logging()
+            handler.setStream(saved_stream)
+        messages = [json.loads(line)["message"] for line in stream.getvalue().splitlines()]
+        self.assertIn("validated_config omitted", messages)
+        self.assertNotIn("14", "".join(messages))
+
+    def test_fingerprints_keep_types_apart(self):
+        fingerprint = config_validator.config_fingerprint
+        self.assertNotEqual(
+            fingerprint({"d": date(2020, 1, 1)}), fingerprint({"d": "2020-01-01"})
+        )
+        self.assertNotEqual(fingerprint({1: "x"}), fingerprint({"1": "x"}))
+        self.assertNotEqual(fingerprint({"a": 1}), fingerprint({"a": 1.0}))
+        self.assertEqual(fingerprint({"a": [1]}), fingerprint({"a": [1]}))
+
+        # a valid ISO string does not make the same date valid for a str field
+        model_class = self.load()
+        cache_dir = str(self.cache_dir)
+        valid = dict(self.valid, version="2020-01-01")
+        self.assertIsInstance(
+            config_validator.validate_config(valid, model_class, cache_dir), Success
+        )
+        config_validator._valid_fingerprints.clear()
+        config_validator._loaded_fingerprints.clear()
+        self.assertIsInstance(
+            config_validator.validate_config(
+                dict(valid, version=date(2020, 1, 1)), model_class, cache_dir
+            ),
+            Failure,
+        )
+
+    def test_known_valid_fingerprints_capped(self):
+        model_class = self.load()
+        cache_dir = str(self.cache_dir)
+        with patch.object(config_validator, "MAX_VALID_FINGERPRINTS", 3):
+            for age in (1, 2, 3, 1, 4):
+                config_validator.validate_config(
+                    dict(self.valid, age=age), model_class, cache_dir
+                )
+            known = config_validator._known_valid(model_class)
+            self.assertEqual(len(known), 3)
+            (stored,) = self.cache_dir.glob("__masha_valid_*")
+            self.assertEqual(stored.read_text().splitlines(), list(known))
+            # known valid again, not validated nor stored again
+            self.assertNotIn(
+                config_validator.config_fingerprint(dict(self.valid, age=1)), known
+            )
+        self.assertEqual(len(list(self.cache_dir.iterdir())), 2)
+
+    def test_known_valid_configs_kept_per_imported_modules(self):
+        helper = Path(self.tmp_dir.name) / "masha_test_helper_module.py"
+        helper.write_text("LIMIT = 150\n")
+        self.model_file.write_text(
+            "import masha_test_helper_module\n" + self.model_file.read_text()
+        )
+        sys.path.insert(0, self.tmp_dir.name)
+        try:
+            key = config_validator._model_sources[self.load()][2]
+            config_validator._model_classes.clear()
+            sys.modules.pop("masha_test_helper_module")
+            helper.write_text("LIMIT = 100\n")
+            self.assertNotEqual(config_validator._model_sources[self.load()][2], key)
+        finally:
+            sys.path.remove(self.tmp_dir.name)
+            sys.modules.pop("masha_test_helper_module", None)
+
+
 if __name__ == '__main__':
     unittest.main()
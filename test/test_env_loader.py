@@ -12,7 +12,7 @@ directory = Path(__file__).parent.parent / "masha"
 # setting path
 sys.path.append(str(directory))
 from config_loader import merge_configs, load_and_merge_configs
-from env_loader import resolve_env_variables
+from env_loader import PlaceholderIndex, find_env_variable_names, interpolate, resolve_env_variables
 
 
 ##########################
@@ -42,6 +42,34 @@ class TestEnvLoader(unittest.TestCase):
         env_config = resolve_env_variables(config)
         self.assertEqual(env_config['a']['b'], os.environ["ENV_B"])
 
+    def test_placeholders_inside_strings(self):
+        environ = {"HOST": "db", "STAGE": "prod", "URL_prod": "https://prod/"}
+        self.assertEqual(interpolate("pg://${HOST:localhost}:${PORT: 5432}/x", environ), "pg://db:5432/x")
+        self.assertEqual(interpolate("${URL_${STAGE:dev}:none}", environ), "https://prod/")
+        self.assertEqual(interpolate("${URL:${HOST:h}-${PORT:1}}", environ), "db-1")
+        self.assertIsNone(interpolate("${MISSING:${OTHER:null}}", environ))
+        self.assertEqual(interpolate("a ${MISSING:null} b", environ), "a  b")
+        for literal in ["${HOST}", "${ HOST:x}", "${HOST:x", "a}b:c"]:
+            self.assertEqual(interpolate(literal, environ), literal)
+
+    def test_index_resolves_only_placeholder_leaves(self):
+        config = {
+            "a": {"url": "http://${HOST:h}/", "port": 80},
+            "l": [1, ["${PORT:1}"], {"n": "${NAME:null}"}],
+            "plain": {"k": "v"},
+        }
+        index = PlaceholderIndex(config)
+        self.assertEqual(index.paths(), [("a", "url"), ("l", 1, 0), ("l", 2, "n")])
+        self.assertEqual(index.variable_names({}), {"HOST", "PORT", "NAME"})
+        first = resolve_env_variables(config, {"HOST": "one"}, index)
+        second = resolve_env_variables(config, {"PORT": "2"}, index)
+        self.assertEqual(first["a"]["url"], "http://one/")
+        self.assertEqual(second["a"]["url"], "http://h/")
+        self.assertEqual(second["l"], [1, ["2"], {"n": None}])
+        self.assertIs(second["plain"], config["plain"])
+        self.assertEqual(config["l"][1], ["${PORT:1}"])
+        self.assertEqual(find_env_variable_names(config), {"HOST", "PORT", "NAME"})
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,98 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import jinja2
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from template_renderer import create_jinja_environment, render_templates_with_functions
+# the module template_renderer uses, not a second copy of it
+from masha import function_registry
+from masha.function_registry import FunctionRegistry, load_module_functions
+
+
+class TestFunctionRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        (self.directory / "heavy.py").write_text(
+            "from os.path import join\n"
+            "def joined(values):\n"
+            "    return join(*values)\n"
+        )
+        (self.directory / "light.py").write_text(
+            "def shout(value):\n"
+            "    return value.upper() + '!'\n"
+            "def upper(value):\n"
+            "    return 'custom ' + value\n"
+        )
+        self.heavy = (self.directory / "heavy.py").resolve()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_definitions_without_loading(self):
+        registry = FunctionRegistry(self.directory)
+        self.assertEqual(
+            registry.definitions(),
+            {
+                "joined": self.directory / "heavy.py",
+                "shout": self.directory / "light.py",
+                "upper": self.directory / "light.py",
+            },
+        )
+        self.assertNotIn(self.heavy, function_registry._modules)
+
+    def test_only_used_files_are_loaded(self):
+        registry = FunctionRegistry(self.directory)
+        rendered = render_templates_with_functions(
+            {"a": "x", "b": "{{ a | shout }} {{ a | upper }} {{ a | title }}"}, registry
+        )
+        self.assertEqual(rendered["b"], "X! custom x X")
+        self.assertNotIn(self.heavy, function_registry._modules)
+
+        jenv = create_jinja_environment(self.directory, registry)
+        (self.directory / "t.j2").write_text("{{ ['a', 'b'] | joined }}")
+        self.assertEqual(jenv.get_template("t.j2").render(), "a/b")
+        self.assertIn(self.heavy, function_registry._modules)
+        with self.assertRaises(jinja2.TemplateAssertionError):
+            jenv.from_string("{{ 1 | missing }}")
+
+    def test_cached_until_changed_and_imports_excluded(self):
+        functions = load_module_functions(self.directory / "heavy.py")
+        self.assertEqual(set(functions), {"joined"})
+        self.assertIs(load_module_functions(self.directory / "heavy.py"), functions)
+        (self.directory / "heavy.py").write_text("def joined(values):\n    return '+'.join(values)\n")
+        reloaded = load_module_functions(self.directory / "heavy.py")
+        self.assertEqual(reloaded["joined"](["a", "b"]), "a+b")
+
+
+    def test_callables_built_in_the_file_exported(self):
+        (self.directory / "built.py").write_text(
+            "import functools\n"
+            "import os.path\n"
+            "from math import *\n"
+            "from textwrap import shorten as short\n"
+            "def _twice(function):\n"
+            "    def wrapper(value):\n"
+            "        return function(function(value))\n"
+            "    return wrapper\n"
+            "def suffix(value, end):\n"
+            "    return value + end\n"
+            "bang = functools.partial(suffix, end='!')\n"
+            "@_twice\n"
+            "def exclaim(value):\n"
+            "    return value + '!'\n"
+        )
+        functions = load_module_functions(self.directory / "built.py")
+        self.assertEqual(set(functions), {"suffix", "bang", "exclaim"})
+        self.assertEqual(functions["bang"]("a"), "a!")
+        self.assertEqual(functions["exclaim"]("a"), "a!!")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import jinja2
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from incremental import IncrementalEngine, diff_paths
+
+
+class TestIncrementalEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        self.write("base.yaml", (
+            "name: app\n"
+            "hosts:\n  web: w1\n  db: d1\n"
+            "url: 'https://{{ name }}.${MASHA_DOMAIN:example.com}/'\n"
+            "db_url: 'pg://{{ hosts.db }}'\n"
+        ))
+        self.write("port.yaml", "port: 80\nlabel: '{{ port }}-x'\n")
+        self.write("url.j2", "url={{ url }}")
+        self.write("db.j2", "db={{ db_url }} {% include 'port.j2' %}")
+        self.write("port.j2", "port={{ label }}")
+        self.engine = IncrementalEngine(
+            [self.directory / "base.yaml", self.directory / "port.yaml"]
+        )
+        self.url = self.directory / "url.txt"
+        self.db = self.directory / "db.txt"
+        self.engine.add_output(self.directory / "url.j2", self.url)
+        self.engine.add_output(self.directory / "db.j2", self.db)
+        self.first = self.engine.update(environ={}).unwrap()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, name, content):
+        (self.directory / name).write_text(content)
+
+    def test_first_run_renders_everything(self):
+        self.assertEqual(len(self.first.rendered_keys), 3)
+        self.assertEqual(self.first.changed_outputs, [self.url, self.db])
+        self.assertEqual(self.db.read_text(), "db=pg://d1 port=80-x")
+        report = self.engine.update(environ={}).unwrap()
+        self.assertEqual(report.rendered_keys, [])
+        self.assertEqual(report.rendered_outputs, [])
+
+    def test_changed_environment_variable(self):
+        report = self.engine.update(environ={"MASHA_DOMAIN": "x.org"}).unwrap()
+        self.assertEqual(report.changed_keys, [("url",)])
+        self.assertEqual(report.rendered_keys, [("url",)])
+        self.assertEqual(report.changed_outputs, [self.url])
+        self.assertEqual(self.url.read_text(), "url=https://app.x.org/")
+
+    def test_changed_file(self):
+        self.write("base.yaml", (self.directory / "base.yaml").read_text().replace("d1", "d22"))
+        report = self.engine.update([self.directory / "base.yaml"], environ={}).unwrap()
+        self.assertEqual(report.changed_keys, [("hosts", "db"), ("db_url",)])
+        self.assertEqual(report.rendered_keys, [("db_url",)])
+        self.assertEqual(report.rendered_outputs, [self.db])
+        self.assertEqual(self.engine.config["db_url"], "pg://d22")
+        self.assertEqual(self.engine.source_of(("hosts", "db")), self.directory / "base.yaml")
+        self.assertEqual(self.engine.source_of(("port",)), self.directory / "port.yaml")
+
+    def test_unchanged_rendered_value_stops_propagation(self):
+        self.write("port.yaml", "port: 80\nlabel: '{{ port }}-x'\nextra: 1\n")
+        report = self.engine.update(environ={}).unwrap()
+        self.assertEqual(report.changed_keys, [("extra",)])
+        self.assertEqual(report.rendered_outputs, [])
+
+        self.write("port.j2", "port: {{ label }}")
+        report = self.engine.update(environ={}).unwrap()
+        self.assertEqual(report.changed_outputs, [self.db])
+
+    def test_templates_reading_the_context(self):
+        lookup = jinja2.pass_context(lambda ctx, name: ctx[name])
+        self.write("ctx.yaml", "name: app\nvia: \"{{ 'label' | lookup }}\"\n")
+        engine = IncrementalEngine(
+            [self.directory / "ctx.yaml", self.directory / "port.yaml"],
+            filters={"lookup": lookup},
+        )
+        self.write("ctx.j2", "{{ 'name' | lookup }} {{ via }}")
+        output = self.directory / "ctx.txt"
+        engine.add_output(self.directory / "ctx.j2", output)
+        self.assertEqual(engine.update(environ={}).unwrap().changed_outputs, [output])
+        self.assertEqual(engine.config["via"], "80-x")
+
+        self.write("ctx.yaml", "name: other\nvia: \"{{ 'label' | lookup }}\"\n")
+        report = engine.update(environ={}).unwrap()
+        self.assertEqual(report.changed_outputs, [output])
+        self.assertEqual(output.read_text(), "other 80-x")
+
+        self.write("port.yaml", "port: 81\nlabel: '{{ port }}-x'\n")
+        report = engine.update(environ={}).unwrap()
+        self.assertEqual(report.rendered_keys, [("label",), ("via",)])
+        self.assertEqual(output.read_text(), "other 81-x")
+
+    def test_diff_paths(self):
+        shared = {"x": [1]}
+        old = {"a": 1, "b": {"c": 2, "d": 3}, "s": shared}
+        new = {"a": 1, "b": {"c": 4}, "e": 5, "s": shared}
+        self.assertEqual(diff_paths(old, new), [("b", "c"), ("b", "d"), ("e",)])
+
+
+if __name__ == '__main__':
+    unittest.main()
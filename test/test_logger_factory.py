@@ -0,0 +1,98 @@
+import unittest
+import subprocess
+import sys
+import io
+import json
+import logging
+from pathlib import Path
+from unittest import mock
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from logger_factory import configure_logging, create_logger, log_config
+
+repo_dir = Path(__file__).parent.parent
+
+
+class TestCreateLogger(unittest.TestCase):
+
+    def test_configured_once(self):
+        logger = create_logger("masha")
+        handlers = list(logger.handlers)
+        logger.setLevel(logging.WARNING)
+        try:
+            # a second call keeps the existing configuration
+            self.assertIs(create_logger("masha"), logger)
+            self.assertEqual(logger.handlers, handlers)
+            self.assertEqual(logger.level, logging.WARNING)
+        finally:
+            logger.setLevel(logging.INFO)
+
+    def test_log_config_only_serializes_enabled_levels(self):
+        logger = create_logger("masha")
+        with mock.patch("json.dumps", wraps=json.dumps) as dumps:
+            log_config(logger, logging.DEBUG, "config", {"key": "value"})
+            dumps.assert_not_called()
+
+    def test_configure_logging(self):
+        logger = create_logger("masha")
+        stream = io.StringIO()
+        handler = logger.handlers[0]
+        saved_stream = handler.setStream(stream)
+        try:
+            configure_logging("warning", "json")
+            self.assertEqual(logger.level, logging.WARNING)
+            logger.info("hidden")
+            log_config(logger, logging.WARNING, "config", {"key": "value"})
+            entry = json.loads(stream.getvalue())
+            self.assertEqual(entry["level"], "WARNING")
+            self.assertEqual(entry["message"], "config omitted")
+        finally:
+            configure_logging()
+            handler.setStream(saved_stream)
+        self.assertEqual(logger.level, logging.INFO)
+
+
+class TestLazyImports(unittest.TestCase):
+
+    def imported_modules(self, code):
+        script = f"import sys\n{code}\nprint(' '.join(sys.modules))"
+        result = subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=repo_dir,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return set(result.stdout.split())
+
+    def test_cli_import_skips_optional_modules(self):
+        modules = self.imported_modules("import masha.cli")
+        for module in ("pydantic", "yaml", "toml", "masha.config_validator"):
+            self.assertNotIn(module, modules)
+
+    def test_parser_imported_for_its_file_type(self):
+        modules = self.imported_modules(
+            "from pathlib import Path\n"
+            "from masha import load_config\n"
+            "load_config(Path('test/config-c.json'))"
+        )
+        self.assertNotIn("yaml", modules)
+        modules = self.imported_modules(
+            "from pathlib import Path\n"
+            "from masha import load_config\n"
+            "load_config(Path('test/config-a.yaml'))"
+        )
+        self.assertIn("yaml", modules)
+
+    def test_unknown_attribute(self):
+        import masha
+
+        with self.assertRaises(AttributeError):
+            masha.no_such_function  # pylint: disable=W0104
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+from returns.result import Success, Failure
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from manifest import RenderJob, load_manifest
+from masha.cli import (
+    _init_render_worker,
+    _render_job,
+    _render_job_environment,
+    _worker_state,
+    render_manifest_jobs,
+)
+
+
+class TestLoadManifest(unittest.TestCase):
+
+    def test_paths_relative_to_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest = Path(tmp_dir) / "jobs.yaml"
+            manifest.write_text(
+                "jobs:\n"
+                "  - template: templates/a.j2\n"
+                "    output: out/a.txt\n"
+                "  - template: /abs/b.j2\n"
+                "    output: b.txt\n"
+            )
+            result = load_manifest(manifest)
+            self.assertIsInstance(result, Success)
+            self.assertEqual(
+                result.unwrap(),
+                [
+                    RenderJob(Path(tmp_dir) / "templates/a.j2", Path(tmp_dir) / "out/a.txt"),
+                    RenderJob(Path("/abs/b.j2"), Path(tmp_dir) / "b.txt"),
+                ],
+            )
+
+    def test_incomplete_job(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            manifest = Path(tmp_dir) / "jobs.json"
+            manifest.write_text('{"jobs": [{"template": "a.j2"}]}')
+            result = load_manifest(manifest)
+            self.assertIsInstance(result, Failure)
+            self.assertIn("needs 'template' and 'output'", result.failure()["error"])
+
+
+class TestRenderManifestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        (self.directory / "filters").mkdir()
+        (self.directory / "filters" / "f.py").write_text(
+            "def shout(value):\n    return value.upper()\n"
+        )
+        (self.directory / "sub").mkdir()
+        (self.directory / "a.j2").write_text("a {{ name | shout }}")
+        (self.directory / "b.j2").write_text("b {{ 1 / zero }}")
+        (self.directory / "sub" / "c.j2").write_text("c {{ name }}")
+        self.jobs = [
+            RenderJob(self.directory / "a.j2", self.directory / "a.txt"),
+            RenderJob(self.directory / "b.j2", self.directory / "b.txt"),
+            RenderJob(self.directory / "missing.j2", self.directory / "m.txt"),
+            RenderJob(self.directory / "sub" / "c.j2", self.directory / "c.txt"),
+        ]
+        self.config = {"name": "masha", "zero": 0}
+
+    def tearDown(self):
+        _worker_state.clear()
+        self.tmp_dir.cleanup()
+
+    def assert_rendered(self, reports):
+        self.assertEqual(
+            [report["template"] for report in reports],
+            [str(job.template) for job in self.jobs],
+        )
+        self.assertEqual(
+            [report["status"] for report in reports],
+            ["success", "failure", "failure", "success"],
+        )
+        self.assertIn("division by zero", reports[1]["error"])
+        self.assertEqual((self.directory / "a.txt").read_text(), "a MASHA")
+        self.assertEqual((self.directory / "c.txt").read_text(), "c masha")
+        self.assertFalse((self.directory / "b.txt").exists())
+
+    def test_jobs_of_the_worker_state(self):
+        _init_render_worker(
+            {
+                "jobs": self.jobs,
+                "config": self.config,
+                "filters_directory": self.directory / "filters",
+                "tests_directory": None,
+                "cache_dir": None,
+                "only_if_changed": True,
+                "enable_async": False,
+            }
+        )
+        self.assertIs(
+            _render_job_environment(self.jobs[0]),
+            _render_job_environment(self.jobs[1]),
+        )
+        self.assertIsNot(
+            _render_job_environment(self.jobs[0]),
+            _render_job_environment(self.jobs[3]),
+        )
+        self.assert_rendered([_render_job(index) for index in range(4)])
+        self.assertEqual(_render_job(0)["status"], "unchanged")
+
+    def test_process_pool(self):
+        reports = render_manifest_jobs(
+            self.jobs, self.config, self.directory / "filters", processes=2
+        )
+        self.assert_rendered(reports)
+        self.assertEqual(_worker_state, {})
+
+    def test_spawned_workers_initialized(self):
+        # without fork, the workers set up their state in the pool initializer
+        with patch("multiprocessing.get_all_start_methods", return_value=["spawn"]):
+            reports = render_manifest_jobs(
+                self.jobs, self.config, self.directory / "filters", processes=2
+            )
+        self.assert_rendered(reports)
+        self.assertEqual(_worker_state, {})
+
+if __name__ == '__main__':
+    unittest.main()
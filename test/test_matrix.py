@@ -0,0 +1,136 @@
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+from returns.result import Success, Failure
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from matrix import Combination, combination_output, load_matrix
+from masha.cli import process_matrix_with_validation
+
+test_dir = Path(__file__).parent
+
+
+class TestLoadMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_combinations_in_dimension_order(self):
+        matrix = self.directory / "matrix.yaml"
+        matrix.write_text(
+            "dimensions:\n"
+            "  env:\n"
+            "    dev: env/dev.yaml\n"
+            "    prod: [env/prod.yaml, /abs/secrets.yaml]\n"
+            "  region:\n"
+            "    eu: eu.yaml\n"
+        )
+        result = load_matrix(matrix)
+        self.assertIsInstance(result, Success)
+        self.assertEqual(
+            result.unwrap(),
+            [
+                Combination(
+                    "dev-eu",
+                    {"env": "dev", "region": "eu"},
+                    (self.directory / "env/dev.yaml", self.directory / "eu.yaml"),
+                ),
+                Combination(
+                    "prod-eu",
+                    {"env": "prod", "region": "eu"},
+                    (
+                        self.directory / "env/prod.yaml",
+                        Path("/abs/secrets.yaml"),
+                        self.directory / "eu.yaml",
+                    ),
+                ),
+            ],
+        )
+        combination = result.unwrap()[1]
+        self.assertEqual(
+            combination_output(combination, Path("out/{env}/{region}-{name}.txt")),
+            Path("out/prod/eu-prod-eu.txt"),
+        )
+
+    def test_invalid_overlay_set(self):
+        matrix = self.directory / "matrix.json"
+        matrix.write_text('{"dimensions": {"env": {"dev": 1}}}')
+        result = load_matrix(matrix)
+        self.assertIsInstance(result, Failure)
+        self.assertIn("needs a path or a list of paths", result.failure()["error"])
+
+
+class TestProcessMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp_dir.name)
+        (self.directory / "base.yaml").write_text(
+            "name: shop\n"
+            "version: '1.{{ age }}'\n"
+            "debug: false\n"
+            "url: '{{ stage }}.{{ region }}.example.com'\n"
+        )
+        for name, content in {
+            "dev.yaml": "stage: dev\nage: 1\n",
+            "prod.yaml": "stage: prod\nage: 200\n",
+            "eu.yaml": "region: eu\n",
+            "us.yaml": "region: us\n",
+        }.items():
+            (self.directory / name).write_text(content)
+        (self.directory / "matrix.yaml").write_text(
+            "dimensions:\n"
+            "  env: {dev: dev.yaml, prod: prod.yaml}\n"
+            "  region: {eu: eu.yaml, us: us.yaml}\n"
+        )
+        (self.directory / "t.j2").write_text("{{ url }} {{ version }}")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def process(self, processes=1, model_file=None, class_model=None):
+        return process_matrix_with_validation(
+            (self.directory / "base.yaml",),
+            None,
+            None,
+            self.directory / "matrix.yaml",
+            self.directory / "out" / "{env}" / "{region}.txt",
+            self.directory / "t.j2",
+            model_file,
+            class_model,
+            processes=processes,
+        ).unwrap()
+
+    def test_every_combination_rendered(self):
+        for processes in (1, 2):
+            reports = self.process(processes)
+            self.assertEqual(
+                [report["combination"] for report in reports],
+                ["dev-eu", "dev-us", "prod-eu", "prod-us"],
+            )
+            self.assertTrue(all(report["status"] == "success" for report in reports))
+            self.assertEqual(
+                (self.directory / "out/prod/us.txt").read_text(),
+                "prod.us.example.com 1.200",
+            )
+
+    def test_combinations_validated(self):
+        reports = self.process(2, test_dir / "model.py", "ConfigModel")
+        self.assertEqual(
+            [report["status"] for report in reports],
+            ["success", "success", "failure", "failure"],
+        )
+        self.assertIn("not a valid date", reports[2]["error"])
+        self.assertFalse((self.directory / "out/prod").exists())
+
+
+if __name__ == '__main__':
+    unittest.main()
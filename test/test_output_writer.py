@@ -0,0 +1,126 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import jinja2
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from output_writer import write_chunks, write_template
+
+
+class RecordingStream(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+
+    def write(self, s):
+        self.writes.append(len(s))
+        return super().write(s)
+
+
+class TestWriteTemplate(unittest.TestCase):
+
+    def setUp(self):
+        self.template = jinja2.Environment().from_string(
+            "{% for i in range(n) %}line {{ i }}\n{% endfor %}"
+        )
+
+    def test_writes_are_bounded_by_the_buffer(self):
+        stream = RecordingStream()
+        written = write_chunks(self.template.generate(n=10000), stream, 4096)
+        self.assertEqual(stream.getvalue(), self.template.render(n=10000))
+        self.assertEqual(written, len(stream.getvalue()))
+        self.assertGreater(len(stream.writes), 10)
+        self.assertLess(max(stream.writes), 4096 + 100)
+
+    def test_file_and_stdout(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = Path(tmp_dir) / "out.txt"
+            write_template(self.template, {"n": 3}, output, buffer_size=4)
+            self.assertEqual(output.read_text(), "line 0\nline 1\nline 2\n")
+            self.assertEqual(os.listdir(tmp_dir), ["out.txt"])
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            write_template(self.template, {"n": 2}, Path("-"))
+        self.assertEqual(stdout.getvalue(), "line 0\nline 1\n")
+
+    def test_only_if_changed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = Path(tmp_dir) / "out.txt"
+            self.assertTrue(write_template(self.template, {"n": 3}, output, only_if_changed=True))
+            os.utime(output, ns=(0, 0))
+            self.assertFalse(write_template(self.template, {"n": 3}, output, only_if_changed=True))
+            self.assertEqual(output.stat().st_mtime_ns, 0)
+            self.assertTrue(write_template(self.template, {"n": 4}, output, only_if_changed=True))
+            self.assertEqual(output.read_text().count("line"), 4)
+            self.assertEqual(os.listdir(tmp_dir), ["out.txt"])
+
+    def test_failing_render_keeps_the_output(self):
+        template = jinja2.Environment().from_string("start {{ 1 / x }}")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = Path(tmp_dir) / "out.txt"
+            output.write_text("previous")
+            with self.assertRaises(ZeroDivisionError):
+                write_template(template, {"x": 0}, output)
+            with self.assertRaises(ZeroDivisionError):
+                write_template(template, {"x": 0}, output, only_if_changed=True)
+            self.assertEqual(output.read_text(), "previous")
+            self.assertEqual(os.listdir(tmp_dir), ["out.txt"])
+
+    def test_written_in_place(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = Path(tmp_dir) / "out.txt"
+            output.write_text("previous")
+            output.chmod(0o640)
+            link = Path(tmp_dir) / "hard.txt"
+            os.link(output, link)
+            inode = output.stat().st_ino
+            write_template(self.template, {"n": 1}, output)
+            self.assertEqual(output.stat().st_ino, inode)
+            self.assertEqual(link.read_text(), "line 0\n")
+            write_template(self.template, {"n": 2}, output, only_if_changed=True)
+            self.assertEqual(output.stat().st_mode & 0o777, 0o640)
+            self.assertEqual(output.read_text(), "line 0\nline 1\n")
+
+    @unittest.skipIf(os.geteuid() == 0, "the superuser writes to any directory")
+    def test_read_only_directory(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = Path(tmp_dir) / "out.txt"
+            output.write_text("previous")
+            os.chmod(tmp_dir, 0o555)
+            try:
+                write_template(self.template, {"n": 1}, output)
+                self.assertEqual(output.read_text(), "line 0\n")
+                self.assertFalse(
+                    write_template(self.template, {"n": 1}, output, only_if_changed=True)
+                )
+                self.assertTrue(
+                    write_template(self.template, {"n": 2}, output, only_if_changed=True)
+                )
+                self.assertEqual(output.read_text(), "line 0\nline 1\n")
+            finally:
+                os.chmod(tmp_dir, 0o755)
+
+    def test_symlink_and_device_outputs(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            target = Path(tmp_dir) / "target.txt"
+            target.write_text("previous")
+            link = Path(tmp_dir) / "link.txt"
+            link.symlink_to(target)
+            write_template(self.template, {"n": 1}, link)
+            self.assertTrue(link.is_symlink())
+            self.assertEqual(target.read_text(), "line 0\n")
+            self.assertEqual(sorted(os.listdir(tmp_dir)), ["link.txt", "target.txt"])
+        self.assertTrue(write_template(self.template, {"n": 1}, Path(os.devnull)))
+        self.assertTrue(Path(os.devnull).is_char_device())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import io
+import json
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from pathlib import Path
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+# the modules the pipeline uses, not second copies of them
+from masha.cli import render_manifest_jobs
+from masha.manifest import RenderJob
+from masha.profiler import count, is_active, profiling, stage
+from masha.template_renderer import render_templates_with_functions
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.profile_file = Path(self.tmp_dir.name) / "profile.json"
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def read_profile(self):
+        return json.loads(self.profile_file.read_text())
+
+    def test_inactive_without_files(self):
+        with profiling():
+            self.assertFalse(is_active())
+            with stage("load"):
+                count("files_loaded")
+        self.assertFalse(is_active())
+
+    def test_stages_and_counts(self):
+        with profiling(self.profile_file):
+            self.assertTrue(is_active())
+            for _ in range(2):
+                with stage("load"):
+                    data = [str(i) for i in range(10000)]
+                    count("files_loaded", 2)
+            with stage("render"):
+                pass
+        self.assertFalse(is_active())
+        del data
+        profile = self.read_profile()
+        self.assertEqual(list(profile["stages"]), ["load", "render"])
+        load = profile["stages"]["load"]
+        self.assertEqual(load["runs"], 2)
+        self.assertGreater(load["peak_bytes"], 100000)
+        self.assertGreaterEqual(load["wall_seconds"], 0)
+        self.assertGreaterEqual(profile["total"]["peak_bytes"], load["peak_bytes"])
+        self.assertEqual(profile["counts"], {"files_loaded": 4})
+
+    def test_written_when_the_block_fails(self):
+        with self.assertRaises(ValueError):
+            with profiling(self.profile_file):
+                with stage("env"):
+                    raise ValueError("failed")
+        self.assertEqual(self.read_profile()["stages"]["env"]["runs"], 1)
+
+    def test_rendering_counts(self):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr), profiling("-"):
+            rendered = render_templates_with_functions(
+                {
+                    "a": "x",
+                    "b": "{{ a | shout }}",
+                    "c": "{{ b | lower }}{{ a is short }}",
+                },
+                {"shout": lambda value: value.upper() + "!"},
+                {"short": lambda value: len(value) < 2},
+            )
+        self.assertEqual(rendered["c"], "x!True")
+        counts = json.loads(stderr.getvalue())["counts"]
+        self.assertEqual(counts["config_values_rendered"], 2)
+        self.assertEqual(counts["dependency_levels"], 2)
+        self.assertEqual(counts["filter_calls"], 2)
+        self.assertEqual(counts["test_calls"], 1)
+
+    def test_dependency_levels_are_the_deepest(self):
+        stderr = io.StringIO()
+        with redirect_stderr(stderr), profiling("-"):
+            render_templates_with_functions({"a": "x", "b": "{{ a }}"}, {}, {})
+            render_templates_with_functions(
+                {"a": "x", "b": "{{ a }}", "c": "{{ b }}"}, {}, {}
+            )
+        self.assertEqual(json.loads(stderr.getvalue())["counts"]["dependency_levels"], 2)
+
+    def test_worker_processes_counted(self):
+        directory = Path(self.tmp_dir.name)
+        (directory / "a.j2").write_text("{{ name }}")
+        jobs = [
+            RenderJob(directory / "a.j2", directory / f"{i}.txt") for i in range(3)
+        ]
+        with profiling(self.profile_file):
+            with stage("render"):
+                render_manifest_jobs(jobs, {"name": "masha"}, processes=2)
+        profile = self.read_profile()
+        self.assertEqual(profile["counts"]["characters_written"], 15)
+        self.assertEqual(profile["stages"]["render"]["runs"], 1)
+
+    def test_cprofile_dump(self):
+        cprofile_file = Path(self.tmp_dir.name) / "run.prof"
+        with profiling(cprofile_file=cprofile_file):
+            self.assertFalse(is_active())
+            sum(range(1000))
+        self.assertGreater(cprofile_file.stat().st_size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
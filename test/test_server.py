@@ -0,0 +1,104 @@
+import json
+import os
+import subprocess
+import unittest
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from client import send_request
+from server import RenderServer
+
+test_dir = Path(__file__).parent
+
+
+class TestRenderServer(unittest.TestCase):
+
+    def test_render_request(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            socket_path = str(Path(tmp_dir) / "masha.sock")
+            server = RenderServer(socket_path)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.start()
+            try:
+                argv = [
+                    "-v", str(test_dir / "config-a.yaml"),
+                    "-v", str(test_dir / "config-b.yaml"),
+                    "-f", str(test_dir.parent / "masha" / "filters"),
+                    "-t", str(test_dir.parent / "masha" / "tests"),
+                    "-o", str(Path(tmp_dir) / "out.txt"),
+                    str(test_dir / "input.txt.j2"),
+                ]
+                for _ in range(2):
+                    response = send_request(argv, socket_path)
+                    self.assertEqual(response["exit_code"], 0)
+                    self.assertIn("Command run successfully", response["stderr"])
+                    self.assertEqual(response["stdout"], "")
+                self.assertIn("14 years even", (Path(tmp_dir) / "out.txt").read_text())
+                self.assertEqual(len(server.sessions._sessions), 1)
+
+                response = send_request(argv[:-1] + ["missing.j2"], socket_path)
+                self.assertEqual(response["exit_code"], 2)
+
+                # `-o -` writes to the client's stdout, not to a file named `-`
+                response = send_request(argv[:-3] + ["-o", "-", argv[-1]], socket_path)
+                self.assertEqual(response["exit_code"], 0, response["stderr"])
+                self.assertIn("14 years even", response["stdout"])
+                self.assertFalse(os.path.exists("-"))
+
+                manifest = Path(tmp_dir) / "jobs.yaml"
+                manifest.write_text(
+                    f"jobs:\n  - template: {test_dir / 'input.txt.j2'}\n"
+                    f"    output: {Path(tmp_dir) / 'job.txt'}\n"
+                )
+                response = send_request(
+                    argv[:-3] + ["--manifest", str(manifest)], socket_path
+                )
+                self.assertEqual(response["exit_code"], 0, response["stderr"])
+                self.assertEqual(json.loads(response["stdout"])["succeeded"], 1)
+                self.assertIn("Command run successfully", response["stderr"])
+
+                (Path(tmp_dir) / "dev.yaml").write_text("name: dev\n")
+                (Path(tmp_dir) / "matrix.yaml").write_text(
+                    "dimensions:\n  env: {dev: dev.yaml}\n"
+                )
+                response = send_request(
+                    argv[:-3] + [
+                        "--matrix", str(Path(tmp_dir) / "matrix.yaml"),
+                        "-o", str(Path(tmp_dir) / "{name}.txt"),
+                        argv[-1],
+                    ],
+                    socket_path,
+                )
+                self.assertEqual(response["exit_code"], 0, response["stderr"])
+                self.assertEqual(json.loads(response["stdout"])["succeeded"], 1)
+                self.assertTrue((Path(tmp_dir) / "dev.txt").exists())
+
+                client = subprocess.run(
+                    [sys.executable, "-m", "masha.client", *argv[:-3],
+                     "--manifest", str(manifest)],
+                    env=dict(
+                        os.environ,
+                        MASHA_SOCKET=socket_path,
+                        PYTHONPATH=str(test_dir.parent),
+                    ),
+                    capture_output=True,
+                    text=True,
+                    check=False,
+                )
+                self.assertEqual(client.returncode, 0, client.stderr)
+                self.assertEqual(json.loads(client.stdout)["succeeded"], 1)
+                self.assertIn("Command run successfully", client.stderr)
+            finally:
+                server.shutdown()
+                server.server_close()
+                thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+
+import jinja2
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from template_cache import TemplateCache, environment_key
+from template_resolver import resolve_templates
+from masha.function_registry import FunctionRegistry
+from masha.template_renderer import create_jinja_environment
+
+
+class TestTemplateCache(unittest.TestCase):
+
+    def test_lru_eviction_and_counters(self):
+        cache = TemplateCache(maxsize=2)
+        cache.get_or_create("a", lambda: 1)
+        cache.get_or_create("b", lambda: 2)
+        self.assertEqual(cache.get_or_create("a", lambda: 10), 1)
+        cache.get_or_create("c", lambda: 3)  # evicts "b"
+        self.assertEqual(cache.get_or_create("b", lambda: 20), 20)
+        info = cache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 4, 2))
+
+    def test_resolve_templates_reuses_compiled_values(self):
+        cache = TemplateCache()
+        env = jinja2.Environment()
+        inp = {"a": "val_a", "b": "from_{{ a }}", "c": "from {{ b }}"}
+        first = resolve_templates(inp, env, cache)
+        second = resolve_templates(inp, env, cache)
+        self.assertEqual(first, second)
+        self.assertEqual(first["c"], "from from_val_a")
+        # plain strings never reach Jinja2
+        self.assertEqual(cache.cache_info().misses, 2)
+        self.assertEqual(cache.cache_info().hits, 2)
+
+
+    def test_filters_are_part_of_the_key(self):
+        cache = TemplateCache()
+        inp = {"a": "x", "b": "{{ a | f }}"}
+        plain = jinja2.Environment()
+        plain.filters["f"] = lambda value: value + "?"
+        self.assertEqual(resolve_templates(inp, plain, cache)["b"], "x?")
+        context = jinja2.Environment()
+        context.filters["f"] = jinja2.pass_context(lambda ctx, value: value + "!")
+        self.assertEqual(resolve_templates(inp, context, cache)["b"], "x!")
+        with self.assertRaises(jinja2.TemplateAssertionError):
+            resolve_templates(inp, jinja2.Environment(), cache)
+
+    def test_registry_fingerprint_in_the_key(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filters = Path(tmp_dir) / "filters.py"
+            filters.write_text("def f(value):\n    return value\n")
+            env = create_jinja_environment(Path(tmp_dir), FunctionRegistry(Path(tmp_dir)))
+            key = environment_key(env)
+            self.assertIsNotNone(env.filters.get("f"))
+            self.assertEqual(environment_key(env), key)
+            filters.write_text(
+                "import jinja2\n"
+                "@jinja2.pass_context\n"
+                "def f(context, value):\n"
+                "    return value\n"
+            )
+            env = create_jinja_environment(Path(tmp_dir), FunctionRegistry(Path(tmp_dir)))
+            self.assertNotEqual(environment_key(env), key)
+
+if __name__ == '__main__':
+    unittest.main()
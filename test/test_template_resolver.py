@@ -0,0 +1,165 @@
+import unittest
+import sys
+from pathlib import Path
+
+import jinja2
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from template_resolver import (
+    TemplateCycleError,
+    find_references,
+    find_template_references,
+    required_paths,
+    resolve_templates,
+    select_paths,
+)
+
+
+class TestFindReferences(unittest.TestCase):
+
+    def test_attribute_chains(self):
+        env = jinja2.Environment()
+        ast = env.parse("{{ a }} {{ c.d }} {{ c['e'] }} {{ f[x].g }}")
+        refs = find_references(ast)
+        self.assertEqual(refs, {("a",), ("c", "d"), ("c", "e"), ("f",), ("x",)})
+
+    def test_declared_names_ignored(self):
+        env = jinja2.Environment()
+        ast = env.parse("{% for i in items %}{{ i }}{% endfor %}{% set y = 1 %}{{ y }}")
+        self.assertEqual(find_references(ast), {("items",)})
+
+    def test_included_templates_followed(self):
+        jenv = jinja2.Environment(
+            loader=jinja2.DictLoader(
+                {
+                    "t.j2": "{% extends 'base.j2' %}{% block b %}{{ app.name }}{% endblock %}",
+                    "base.j2": "{% import 'macros.j2' as m %}{% block b %}{% endblock %}{{ m.f() }}",
+                    "macros.j2": "{% macro f() %}{{ db.host }}{% endmacro %}",
+                }
+            )
+        )
+        self.assertEqual(
+            find_template_references(jenv, "t.j2"), {("app", "name"), ("db", "host")}
+        )
+
+    def test_dynamic_template_names(self):
+        jenv = jinja2.Environment(
+            loader=jinja2.DictLoader({"t.j2": "{% include name ~ '.j2' %}"})
+        )
+        self.assertIsNone(find_template_references(jenv, "t.j2"))
+
+
+    def test_filters_receiving_the_context(self):
+        @jinja2.pass_context
+        def lookup(context, name):
+            return context[name]
+
+        jenv = jinja2.Environment(
+            loader=jinja2.DictLoader(
+                {
+                    "plain.j2": "{{ a | shout }} {{ b | map('upper') | join }}",
+                    "filter.j2": "{{ 'a' | lookup }}",
+                    "map.j2": "{{ ['a'] | map('lookup') | join }}",
+                    "test.j2": "{{ 'a' is defined_in_context }}",
+                }
+            )
+        )
+        jenv.filters.update(shout=str.upper, lookup=lookup)
+        jenv.tests["defined_in_context"] = jinja2.pass_eval_context(
+            lambda eval_ctx, name: True
+        )
+        self.assertEqual(find_template_references(jenv, "plain.j2"), {("a",), ("b",)})
+        for name in ("filter.j2", "map.j2", "test.j2"):
+            self.assertIsNone(find_template_references(jenv, name), name)
+
+
+class TestResolveTemplates(unittest.TestCase):
+
+    def test_nested_dependencies(self):
+        inp = {
+            "c": {"d": "{{ x }}", "e": "{{ f }}"},
+            "f": "{{ c.d }}!",
+            "g": "{{ c }}",
+            "x": "Mitesh",
+            "n": 4,
+        }
+        rendered = resolve_templates(inp, jinja2.Environment())
+        self.assertEqual(rendered["c"], {"d": "Mitesh", "e": "Mitesh!"})
+        self.assertEqual(rendered["f"], "Mitesh!")
+        self.assertEqual(rendered["g"], str({"d": "Mitesh", "e": "Mitesh!"}))
+        self.assertEqual(rendered["n"], 4)
+        # input is left untouched
+        self.assertEqual(inp["f"], "{{ c.d }}!")
+
+    def test_cycle_reported_by_key_path(self):
+        inp = {"a": "{{ b.c }}", "b": {"c": "{{ d }}"}, "d": "{{ a }}"}
+        with self.assertRaises(TemplateCycleError) as ctx:
+            resolve_templates(inp, jinja2.Environment())
+        self.assertEqual(ctx.exception.cycle, [("a",), ("b", "c"), ("d",), ("a",)])
+        self.assertIn("a -> b.c -> d -> a", str(ctx.exception))
+
+    def test_context_filters_render_last(self):
+        env = jinja2.Environment()
+        env.filters["lookup"] = jinja2.pass_context(lambda ctx, name: ctx[name])
+        inp = {"a": "{{ 'b' | lookup }}", "b": "{{ c }}", "c": "x", "d": "{{ a }}"}
+        rendered = resolve_templates(inp, env)
+        self.assertEqual((rendered["a"], rendered["d"]), ("x", "x"))
+
+    def test_method_calls_read_their_object(self):
+        env = jinja2.Environment()
+        ast = env.parse("{{ d.get('b') }} {{ c.e.items() | list }}")
+        self.assertEqual(find_references(ast), {("d",), ("c", "e")})
+        inp = {"d": {"a": "{{ d.get('b') }}", "b": "{{ x }}"}, "x": "y"}
+        self.assertEqual(resolve_templates(inp, env)["d"]["a"], "y")
+
+    def test_rendered_templates_rendered_again(self):
+        inp = {"a": "{{ b }}", "b": "{{ '{{' }} c {{ '}}' }}", "c": "z"}
+        rendered = resolve_templates(inp, jinja2.Environment())
+        self.assertEqual((rendered["a"], rendered["b"]), ("z", "z"))
+
+
+class TestRequiredPaths(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {
+            "app": {"name": "demo", "full": "{{ app.name }}-{{ version }}"},
+            "version": "1.{{ minor }}",
+            "minor": 2,
+            "other": {"x": "{{ missing | nofilter }}", "y": 1},
+            "db": {"host": "h", "port": 5},
+        }
+
+    def test_transitive_references(self):
+        env = jinja2.Environment()
+        paths = required_paths(self.config, env, [("app", "full"), ("db", "host", "x")])
+        self.assertEqual(
+            paths,
+            {("app", "full"), ("app", "name"), ("version",), ("minor",), ("db", "host")},
+        )
+
+        selected = select_paths(self.config, paths)
+        self.assertEqual(
+            selected,
+            {
+                "app": self.config["app"],
+                "version": "1.{{ minor }}",
+                "minor": 2,
+                "db": {"host": "h"},
+            },
+        )
+        self.assertIsNot(selected["app"], self.config["app"])
+        self.assertEqual(resolve_templates(selected, env)["app"]["full"], "demo-1.2")
+
+    def test_paths_below_required_ones_dropped(self):
+        paths = required_paths(
+            self.config, jinja2.Environment(), [("db", "host"), ("db",), ("nope",)]
+        )
+        self.assertEqual(paths, {("db",)})
+        self.assertIs(select_paths(self.config, paths)["db"], self.config["db"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+
+import jinja2
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from tree_renderer import render_tree
+
+
+class TestRenderTree(unittest.TestCase):
+
+    def statuses(self, reports):
+        return {report["template"]: report["status"] for report in reports}
+
+    def test_incremental_rendering(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            template_dir = Path(tmp_dir) / "templates"
+            output_dir = Path(tmp_dir) / "out"
+            (template_dir / "sub").mkdir(parents=True)
+            (template_dir / "a.txt.j2").write_text("a={{ a }}")
+            (template_dir / "sub" / "b.txt.j2").write_text('{% include "_p.j2" %}')
+            (template_dir / "_p.j2").write_text("b={{ b }}")
+            jenv = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir))
+            config = {"a": 1, "b": 2}
+
+            reports = render_tree(jenv, output_dir, config)
+            self.assertEqual(self.statuses(reports), {"a.txt.j2": "success", "sub/b.txt.j2": "success"})
+            self.assertEqual((output_dir / "sub" / "b.txt").read_text(), "b=2")
+
+            reports = render_tree(jenv, output_dir, config)
+            self.assertEqual(self.statuses(reports), {"a.txt.j2": "unchanged", "sub/b.txt.j2": "unchanged"})
+
+            # a change of an included partial re-renders its includers only
+            (template_dir / "_p.j2").write_text("b={{ b }}!")
+            jenv = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir))
+            reports = render_tree(jenv, output_dir, config)
+            self.assertEqual(self.statuses(reports), {"a.txt.j2": "unchanged", "sub/b.txt.j2": "success"})
+
+            # a config change re-renders everything
+            reports = render_tree(jenv, output_dir, {"a": 1, "b": 3})
+            self.assertEqual(self.statuses(reports), {"a.txt.j2": "success", "sub/b.txt.j2": "success"})
+
+            (template_dir / "a.txt.j2").unlink()
+            reports = render_tree(jenv, output_dir, {"a": 1, "b": 3})
+            self.assertEqual(self.statuses(reports), {"a.txt.j2": "removed", "sub/b.txt.j2": "unchanged"})
+            self.assertFalse((output_dir / "a.txt").exists())
+
+    def test_only_if_changed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            template_dir = Path(tmp_dir) / "templates"
+            output_dir = Path(tmp_dir) / "out"
+            template_dir.mkdir()
+            (template_dir / "a.txt.j2").write_text("a={{ a }}")
+            jenv = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir))
+            render_tree(jenv, output_dir, {"a": 1, "unused": 1})
+            # the config changed, but not the rendered content
+            reports = render_tree(jenv, output_dir, {"a": 1, "unused": 2}, only_if_changed=True)
+            self.assertEqual(self.statuses(reports), {"a.txt.j2": "unchanged"})
+            reports = render_tree(jenv, output_dir, {"a": 2, "unused": 2}, only_if_changed=True)
+            self.assertEqual(self.statuses(reports), {"a.txt.j2": "success"})
+            self.assertEqual((output_dir / "a.txt").read_text(), "a=2")
+
+
+if __name__ == '__main__':
+    unittest.main()
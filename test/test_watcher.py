@@ -0,0 +1,45 @@
+import unittest
+import sys
+import os
+import tempfile
+from pathlib import Path
+from returns.result import Success
+
+# directory reach
+directory = Path(__file__).parent.parent / "masha"
+# setting path
+sys.path.append(str(directory))
+from watcher import RenderSession
+
+test_dir = Path(__file__).parent
+
+
+class TestRenderSession(unittest.TestCase):
+
+    def test_only_stale_stages_recomputed(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            variables = Path(tmp_dir) / "vars.yaml"
+            variables.write_text("name: Mitesh\nage: 14\n")
+            output = Path(tmp_dir) / "out.txt"
+            session = RenderSession(
+                (variables,),
+                test_dir.parent / "masha" / "filters",
+                test_dir.parent / "masha" / "tests",
+            )
+            self.assertIsInstance(session.render(test_dir / "input.txt.j2", output), Success)
+            self.assertIn("14 years even", output.read_text())
+            filters = session.filters()
+            jenv = session.environment(test_dir)
+
+            variables.write_text("name: Mitesh\nage: 15\n")
+            os.utime(variables, ns=(1, 1))
+            self.assertIsInstance(session.render(test_dir / "input.txt.j2", output), Success)
+            self.assertIn("15 years odd", output.read_text())
+            # filters and the environment with its compiled templates are kept
+            self.assertIs(session.filters(), filters)
+            self.assertIs(session.environment(test_dir), jenv)
+            self.assertIn(test_dir / "input.txt.j2", session.watched_paths(test_dir / "input.txt.j2"))
+
+
+if __name__ == '__main__':
+    unittest.main()